@@ -0,0 +1,46 @@
+// Client side of heatmap.HeatmapGrid: keeps the heatmap image and applies each frame's changed pixels.
+const HeatmapModule = function (canvas_width, canvas_height) {
+  const canvas = document.createElement("canvas");
+  canvas.width = canvas_width;
+  canvas.height = canvas_height;
+  canvas.className = "world-grid";
+  const parent = document.createElement("div");
+  parent.style.height = canvas_height + "px";
+  parent.className = "world-grid-parent";
+  parent.appendChild(canvas);
+  document.getElementById("elements").appendChild(parent);
+
+  const context = canvas.getContext("2d");
+  const buffer = document.createElement("canvas"); // One pixel per heatmap block, scaled up when drawn
+  const bufferContext = buffer.getContext("2d");
+  let image = null;
+  let frame = null;
+
+  this.render = (data) => {
+    if (data.base !== null && data.base !== frame) return; // Missed a frame: wait for the next full one
+    if (data.base === null || !image || image.width !== data.width || image.height !== data.height) {
+      buffer.width = data.width;
+      buffer.height = data.height;
+      image = bufferContext.createImageData(data.width, data.height);
+    }
+    const cells = data.cells;
+    for (let k = 0; k < cells.length; k += 5) {
+      const i = cells[k] * 4;
+      image.data[i] = cells[k + 1];
+      image.data[i + 1] = cells[k + 2];
+      image.data[i + 2] = cells[k + 3];
+      image.data[i + 3] = cells[k + 4];
+    }
+    frame = data.frame;
+    bufferContext.putImageData(image, 0, 0);
+    context.clearRect(0, 0, canvas_width, canvas_height);
+    context.imageSmoothingEnabled = false;
+    context.drawImage(buffer, 0, 0, canvas_width, canvas_height);
+  };
+
+  this.reset = () => {
+    image = null;
+    frame = null;
+    context.clearRect(0, 0, canvas_width, canvas_height);
+  };
+};
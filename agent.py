@@ -1,13 +1,33 @@
 from mesa import Agent
 import random # Added for normalvariate
 
+try:
+    from .tables import age_bucket, infector_class, susceptible_class, vaccine_status
+    from .codes import (SUSCEPTIBLE, INFECTED, RECOVERED, DEAD, STATE_NAMES, AT_HOME, AT_WORK,
+                        GOING_TO_WORK, GOING_TO_HOME, LOCATION_NAMES, ISOLATED, ESSENTIAL, MOBILITY_NAMES)
+except ImportError:
+    from tables import age_bucket, infector_class, susceptible_class, vaccine_status
+    from codes import (SUSCEPTIBLE, INFECTED, RECOVERED, DEAD, STATE_NAMES, AT_HOME, AT_WORK,
+                       GOING_TO_WORK, GOING_TO_HOME, LOCATION_NAMES, ISOLATED, ESSENTIAL, MOBILITY_NAMES)
+
 class PersonAgent(Agent):
-    def __init__(self, unique_id, model):
+    # Fixed attribute layout instead of a per-agent __dict__ (Mesa's own unique_id/model/pos included).
+    # state, location and mobility are small integer codes from codes.py; the *_name properties give the strings.
+    __slots__ = (
+        "unique_id", "model", "pos", "age", "state", "days_infected", "masked", "asymptomatic",
+        "vaccinated", "vaccine_waned", "days_since_vaccination", "days_since_recovery",
+        "home_pos", "work_pos", "route", "route_step", "mobility", "location", "perceived_local_risk",
+        "base_propensity_to_mask_normal", "base_propensity_to_mask_lockdown",
+        "prop_voluntary_isolation_if_risk_high", "base_compliance_propensity", "base_willingness_to_vaccinate",
+    )
+    recovery_days = 14
+
+    def __init__(self, unique_id, model, traits=None):
         super().__init__(unique_id, model)
-        self.age = self.random.choices([5,15,25,35,45,55,65,75,85], [.117,.131,.136,.135,.124,.128,.118,.073,.039])[0]
-        self.state = "Susceptible"
+        if traits is None: traits = self.draw_traits() # Bulk construction passes traits drawn in batches (population.py)
+        self.age = traits["age"]
+        self.state = SUSCEPTIBLE
         self.days_infected = 0
-        self.recovery_days = 14
 
         self.masked = False # Will be updated dynamically
         self.asymptomatic = False
@@ -18,80 +38,122 @@ class PersonAgent(Agent):
 
         self.home_pos = None
         self.work_pos = None
-        self.mobility_type = self.assign_mobility_type()
-        self.current_location_status = "at_home"
+        self.route = None # Shared tuple of cells from model.routes; self.pos == self.route[self.route_step] while on it
+        self.route_step = 0
+        self.mobility = traits["mobility"]
+        self.location = AT_HOME
 
         # New behavioral attributes for more humanlike responses
         self.perceived_local_risk = 0.0 # Updated each step
         
         # Masking propensities (values between 0 and 1)
-        self.base_propensity_to_mask_normal = max(0, min(1, self.random.normalvariate(self.model.avg_mask_propensity_normal, 0.2)))
-        self.base_propensity_to_mask_lockdown = max(0, min(1, self.random.normalvariate(self.model.avg_mask_propensity_lockdown, 0.15)))
+        self.base_propensity_to_mask_normal = traits["base_propensity_to_mask_normal"]
+        self.base_propensity_to_mask_lockdown = traits["base_propensity_to_mask_lockdown"]
 
         # Voluntary isolation for essential workers
-        self.prop_voluntary_isolation_if_risk_high = max(0, min(1, self.random.normalvariate(self.model.avg_prop_voluntary_isolation, 0.2)))
+        self.prop_voluntary_isolation_if_risk_high = traits["prop_voluntary_isolation_if_risk_high"]
         
         # Lockdown compliance
-        self.base_compliance_propensity = max(0, min(1, self.random.normalvariate(self.model.avg_lockdown_compliance, 0.15))) # Higher means more compliant
+        self.base_compliance_propensity = traits["base_compliance_propensity"] # Higher means more compliant
 
         # Vaccine willingness
-        self.base_willingness_to_vaccinate = max(0, min(1, self.random.normalvariate(self.model.avg_vaccine_willingness, 0.25)))
-
-
-    def assign_mobility_type(self):
-        if self.age < 65:
-            return "essential" if self.random.random() < self.model.essential_worker_rate else "isolated"
+        self.base_willingness_to_vaccinate = traits["base_willingness_to_vaccinate"]
+
+        self.model.counters.add(self) # Counted from creation; every later change goes through the setters below
+        self.model.vaccine_pool.update(self)
+
+    # Pickled as a plain tuple of slot values (checkpoint.py snapshots whole populations)
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in PersonAgent.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(PersonAgent.__slots__, state):
+            setattr(self, name, value)
+
+    # --- String views of the integer codes (reporters, server, debugging) ---
+    @property
+    def state_name(self):
+        return STATE_NAMES[self.state]
+
+    @property
+    def mobility_type(self):
+        return MOBILITY_NAMES[self.mobility]
+
+    @property
+    def current_location_status(self):
+        return LOCATION_NAMES[self.location]
+
+    # --- Transitions (keep model.counters and model.vaccine_pool in sync; never assign these attributes directly) ---
+    def set_state(self, new_state):
+        self.model.counters.change_state(self, new_state)
+        if self.pos is not None and (new_state == INFECTED) != (self.state == INFECTED):
+            self.model.rasters.infected[self.pos] += 1 if new_state == INFECTED else -1
+        self.state = new_state
+        self.model.vaccine_pool.update(self)
+
+    def infect(self):
+        self.asymptomatic = self.random.random() < self.model.asymptomatic_rate
+        self.days_infected = 0
+        self.set_state(INFECTED)
+
+    def set_masked(self, masked):
+        if masked != self.masked:
+            self.model.counters.masked += 1 if masked else -1
+            if self.pos is not None: self.model.rasters.masked[self.pos] += 1 if masked else -1
+            self.masked = masked
+
+    def set_vaccine(self, vaccinated, vaccine_waned):
+        self.model.counters.change_vaccine(self, vaccinated, vaccine_waned)
+        self.vaccinated = vaccinated; self.vaccine_waned = vaccine_waned
+        self.model.vaccine_pool.update(self)
+
+    def draw_traits(self):
+        """Draws age, mobility type and behavioral propensities for a single new agent."""
+        age = self.random.choices([5,15,25,35,45,55,65,75,85], [.117,.131,.136,.135,.124,.128,.118,.073,.039])[0]
+        return {
+            "age": age,
+            "mobility": self.assign_mobility_type(age),
+            "base_propensity_to_mask_normal": max(0, min(1, self.random.normalvariate(self.model.avg_mask_propensity_normal, 0.2))),
+            "base_propensity_to_mask_lockdown": max(0, min(1, self.random.normalvariate(self.model.avg_mask_propensity_lockdown, 0.15))),
+            "prop_voluntary_isolation_if_risk_high": max(0, min(1, self.random.normalvariate(self.model.avg_prop_voluntary_isolation, 0.2))),
+            "base_compliance_propensity": max(0, min(1, self.random.normalvariate(self.model.avg_lockdown_compliance, 0.15))),
+            "base_willingness_to_vaccinate": max(0, min(1, self.random.normalvariate(self.model.avg_vaccine_willingness, 0.25))),
+        }
+
+    def assign_mobility_type(self, age):
+        if age < 65:
+            return ESSENTIAL if self.random.random() < self.model.essential_worker_rate else ISOLATED
         else:
-            return "isolated"
+            return ISOLATED
 
     def assign_work_location(self):
-        if self.mobility_type == "essential" and self.model.workplaces:
+        if self.mobility == ESSENTIAL and self.model.workplaces:
             self.work_pos = self.random.choice(self.model.workplaces)
         else:
             self.work_pos = None
 
     def get_mortality_rate(self):
-        base_rate = (
-            0.00003 if self.age < 19 else 0.00014 if self.age < 29 else
-            0.00039 if self.age < 39 else 0.00096 if self.age < 49 else
-            0.00219 if self.age < 59 else 0.00470 if self.age < 69 else
-            0.01060 if self.age < 79 else .03253
-        )
-        base_rate *= self.model.severity_multiplier
-        if self.vaccinated:
-            base_rate *= self.model.vaccine_mortality_reduction_waned if self.vaccine_waned else self.model.vaccine_mortality_reduction
-        return base_rate
+        return self.model.tables.mortality[age_bucket(self.age)][vaccine_status(self.vaccinated, self.vaccine_waned)]
 
     def calculate_effective_transmission_prob(self, susceptible_neighbor):
-        base_prob = self.model.infection_rate
-        modifier = 1.0
-        if self.masked and susceptible_neighbor.masked: modifier *= self.model.mask_effect_both
-        elif self.masked or susceptible_neighbor.masked: modifier *= self.model.mask_effect_one
-        if self.asymptomatic: modifier *= self.model.asymptomatic_infectiousness_modifier
-        if self.vaccinated:
-            vacc_trans_reduction_factor_base = self.model.vaccine_transmission_reduction_infector_waned if self.vaccine_waned else self.model.vaccine_transmission_reduction_infector
-            base_protection_trans = (1.0 - vacc_trans_reduction_factor_base)
-            effective_protection_trans = base_protection_trans * (1.0 - self.model.vaccine_escape_trans_factor)
-            modifier *= (1.0 - effective_protection_trans)
-        if susceptible_neighbor.vaccinated:
-            vacc_sus_reduction_factor_base = self.model.vaccine_susceptibility_reduction_susceptible_waned if susceptible_neighbor.vaccine_waned else self.model.vaccine_susceptibility_reduction_susceptible
-            base_protection_sus = (1.0 - vacc_sus_reduction_factor_base)
-            effective_protection_sus = base_protection_sus * (1.0 - self.model.vaccine_escape_sus_factor)
-            modifier *= (1.0 - effective_protection_sus)
-        return max(0, min(base_prob * modifier, 1.0))
+        return self.model.tables.transmission[infector_class(self)][susceptible_class(susceptible_neighbor)]
 
     def move_towards(self, target_pos):
         if self.pos == target_pos:
-            if target_pos == self.home_pos: self.current_location_status = "at_home"
-            if target_pos == self.work_pos: self.current_location_status = "at_work"
+            if target_pos == self.home_pos: self.location = AT_HOME
+            if target_pos == self.work_pos: self.location = AT_WORK
             return
-        dx = target_pos[0] - self.pos[0]; dy = target_pos[1] - self.pos[1]
-        new_x, new_y = self.pos[0], self.pos[1]
-        if dx != 0: new_x += dx // abs(dx)
-        if dy != 0: new_y += dy // abs(dy)
-        self.model.grid.move_agent(self, (new_x, new_y))
-        if self.pos == self.home_pos: self.current_location_status = "at_home"
-        elif self.pos == self.work_pos: self.current_location_status = "at_work"
+        route = self.route
+        if route is None or route[-1] != target_pos or route[self.route_step] != self.pos:
+            route = self.route = self.model.routes.get(self.pos, target_pos) # Cached; shortest way around the torus
+            self.route_step = 0
+        self.route_step += 1
+        old_pos = self.pos
+        self.model.grid.move_agent(self, route[self.route_step])
+        self.model.rasters.moved(self, old_pos) # Count layers are updated in one batch at the end of the day
+        if self.model.households is not None: self.model.households.arrive(self.pos) # Passing through wakes an aggregated household
+        if self.pos == self.home_pos: self.location = AT_HOME
+        elif self.pos == self.work_pos: self.location = AT_WORK
 
     def update_perceived_local_risk(self):
         """Updates agent's perceived risk based on infected neighbors."""
@@ -99,22 +161,9 @@ class PersonAgent(Agent):
             self.perceived_local_risk = 0.0
             return
 
-        infected_neighbors_count = 0
-        neighbor_cells = self.model.grid.get_neighborhood(self.pos, moore=True, include_center=False, radius=self.model.risk_perception_radius)
-        # Consider neighbors in neighborhood cells, not just direct cellmates for risk perception
-        actual_neighbors_in_area = 0
-        for cell_pos in neighbor_cells:
-            cell_contents = self.model.grid.get_cell_list_contents([cell_pos])
-            for agent in cell_contents:
-                if isinstance(agent, PersonAgent) and agent != self: # Don't count self
-                    actual_neighbors_in_area +=1
-                    if agent.state == "Infected":
-                        infected_neighbors_count += 1
-        
-        if actual_neighbors_in_area > 0:
-            self.perceived_local_risk = infected_neighbors_count / actual_neighbors_in_area
-        else:
-            self.perceived_local_risk = 0.0
+        # Infected / person ratio over the risk_perception_radius neighborhood (own cell excluded),
+        # read from the table model.rasters rebuilds at the start of each day.
+        self.perceived_local_risk = float(self.model.rasters.infected_ratio[self.pos])
         # Simple global risk component (can be weighted)
         # global_infected_ratio = self.model.count_state("Infected") / sum(1 for _ in self.model.schedule.agents if isinstance(_, PersonAgent))
         # self.perceived_local_risk = (self.perceived_local_risk * 0.7) + (global_infected_ratio * 0.3)
@@ -132,18 +181,10 @@ class PersonAgent(Agent):
 
         # Simple social influence: if majority of neighbors mask, more likely to mask
         if self.pos: # Check if agent is on grid
-            masking_neighbors = 0
-            total_neighbors = 0
-            neighbor_agents = self.model.grid.get_neighbors(self.pos, moore=True, include_center=False)
-            for neighbor in neighbor_agents:
-                if isinstance(neighbor, PersonAgent):
-                    total_neighbors += 1
-                    if neighbor.masked:
-                        masking_neighbors +=1
-            if total_neighbors > 0 and (masking_neighbors / total_neighbors) > 0.5:
+            if self.model.rasters.masked_fraction[self.pos] > 0.5:
                 prob_mask = min(1.0, prob_mask * 1.2) # Social norm effect
 
-        self.masked = self.random.random() < prob_mask
+        self.set_masked(self.random.random() < prob_mask)
 
     def get_current_vaccine_willingness(self):
         """Calculates current willingness to vaccinate, possibly modified by risk."""
@@ -154,7 +195,7 @@ class PersonAgent(Agent):
 
 
     def step(self):
-        if self.state == "Dead":
+        if self.state == DEAD:
              return
 
         # --- 0. Perception Phase ---
@@ -164,28 +205,38 @@ class PersonAgent(Agent):
         self.decide_masking() # Agent decides if they wear a mask for this step
 
         # --- 2. Waning Immunity Logic & State Updates (Recovery/Death) ---
-        if self.state == "Recovered":
+        self.progress_disease()
+        if self.state == DEAD: # Check again if agent just died
+            self.model.retire_agent(self) # Leaves the schedule and grid; kept in model.dead_archive
+            return
+
+        # --- 3. Movement Logic with Lockdown & Behavioral Considerations ---
+        self.move()
+
+        # --- 4. Infection Spreading Logic ---
+        if self.state == INFECTED:
+            self.spread_infection()
+
+    def progress_disease(self):
+        if self.state == RECOVERED:
             self.days_since_recovery += 1
             if self.days_since_recovery > self.model.natural_immunity_duration:
-                self.state = "Susceptible"; self.days_since_recovery = 0
+                self.set_state(SUSCEPTIBLE); self.days_since_recovery = 0
         if self.vaccinated and not self.vaccine_waned:
             self.days_since_vaccination += 1
             if self.days_since_vaccination > self.model.vaccine_immunity_duration:
-                self.vaccine_waned = True
+                self.set_vaccine(True, True)
 
-        if self.state == "Infected":
+        if self.state == INFECTED:
             self.days_infected += 1
             if self.days_infected >= self.recovery_days:
                 if self.random.random() < self.get_mortality_rate():
-                    self.state = "Dead"; self.model.cumulative_deaths += 1
+                    self.set_state(DEAD); self.model.cumulative_deaths += 1
                 else:
-                    self.state = "Recovered"; self.days_infected = 0; self.days_since_recovery = 0
-        
-        if self.state == "Dead": # Check again if agent just died
-            return
+                    self.set_state(RECOVERED); self.days_infected = 0; self.days_since_recovery = 0
 
-        # --- 3. Movement Logic with Lockdown & Behavioral Considerations ---
-        current_mobility = self.mobility_type
+    def move(self):
+        current_mobility = self.mobility
         obeys_lockdown = True # Assume compliance initially
 
         if self.model.lockdown_active:
@@ -193,58 +244,41 @@ class PersonAgent(Agent):
             if self.random.random() > self.base_compliance_propensity:
                 obeys_lockdown = False # Agent chooses not to comply this step
 
-            if obeys_lockdown and not (self.mobility_type == "essential" and self.age > 14):
-                current_mobility = "isolated" # Forced to isolate by lockdown compliance
+            if obeys_lockdown and not (self.mobility == ESSENTIAL and self.age > 14):
+                current_mobility = ISOLATED # Forced to isolate by lockdown compliance
             elif not obeys_lockdown: # Agent is not complying with lockdown
                 pass # They will attempt their normal mobility_type movement
         
         # Voluntary isolation for essential workers if risk is very high (and not in a stricter lockdown)
-        if not self.model.lockdown_active and current_mobility == "essential" and \
+        if not self.model.lockdown_active and current_mobility == ESSENTIAL and \
            self.perceived_local_risk > self.model.voluntary_isolation_risk_threshold:
             if self.random.random() < self.prop_voluntary_isolation_if_risk_high:
-                current_mobility = "isolated"
+                current_mobility = ISOLATED
         
         # Actual Movement
-        if current_mobility == "essential" and self.work_pos and self.home_pos and self.age > 14:
+        if current_mobility == ESSENTIAL and self.work_pos and self.home_pos and self.age > 14:
             target_pos = None
-            if self.current_location_status == "going_to_work" and self.pos != self.work_pos: target_pos = self.work_pos
-            elif self.current_location_status == "going_to_home" and self.pos != self.home_pos: target_pos = self.home_pos
+            if self.location == GOING_TO_WORK and self.pos != self.work_pos: target_pos = self.work_pos
+            elif self.location == GOING_TO_HOME and self.pos != self.home_pos: target_pos = self.home_pos
             elif self.random.random() < 0.75 : 
-                if self.current_location_status == "at_home" and self.pos != self.work_pos:
-                    target_pos = self.work_pos; self.current_location_status = "going_to_work"
-                elif self.current_location_status == "at_work" and self.pos != self.home_pos:
-                    target_pos = self.home_pos; self.current_location_status = "going_to_home"
+                if self.location == AT_HOME and self.pos != self.work_pos:
+                    target_pos = self.work_pos; self.location = GOING_TO_WORK
+                elif self.location == AT_WORK and self.pos != self.home_pos:
+                    target_pos = self.home_pos; self.location = GOING_TO_HOME
             if target_pos: self.move_towards(target_pos)
             else:
-                if self.pos == self.home_pos: self.current_location_status = "at_home"
-                elif self.pos == self.work_pos: self.current_location_status = "at_work"
+                if self.pos == self.home_pos: self.location = AT_HOME
+                elif self.pos == self.work_pos: self.location = AT_WORK
         # Covers "isolated" by initial type, by lockdown, or by voluntary choice
-        elif current_mobility == "isolated" and self.home_pos:
+        elif current_mobility == ISOLATED and self.home_pos:
             if self.pos != self.home_pos: self.move_towards(self.home_pos)
-            self.current_location_status = "at_home"
-
-
-        # --- 4. Infection Spreading Logic ---
-        if self.state == "Infected":
-            neighbors = self.model.grid.get_neighbors(self.pos, moore=True, include_center=False)
-            for neighbor_agent in neighbors:
-                if isinstance(neighbor_agent, PersonAgent) and neighbor_agent.state == "Susceptible":
-                    transmission_prob = self.calculate_effective_transmission_prob(neighbor_agent)
-                    if self.random.random() < transmission_prob:
-                        neighbor_agent.state = "Infected"
-                        neighbor_agent.asymptomatic = self.random.random() < self.model.asymptomatic_rate
-                        neighbor_agent.days_infected = 0
-
-class WorkplaceMarkerAgent(Agent):
-    def __init__(self, unique_id, model):
-        super().__init__(unique_id, model)
-        self.agent_type = "workplace_marker"
-    def step(self): pass
-
-class HomeMarkerAgent(Agent):
-    def __init__(self, unique_id, model):
-        super().__init__(unique_id, model)
-        self.agent_type = "home_marker"
-    def step(self): pass
-
-# StatusDisplayAgent REMOVED as per previous request
+            self.location = AT_HOME
+
+    def spread_infection(self):
+        if self.model.households is not None: self.model.households.touch(self.pos) # Aggregated neighbors become agents to be exposed
+        transmission_probs = self.model.tables.transmission[infector_class(self)] # Row for this infector, see tables.py
+        for neighbor_agent in self.model.neighbors.get(self.pos): # PersonAgents only
+            if neighbor_agent.state == SUSCEPTIBLE: # susceptible_class(), inlined for the hot loop
+                status = (1 + neighbor_agent.vaccine_waned) if neighbor_agent.vaccinated else 0
+                if self.random.random() < transmission_probs[neighbor_agent.masked * 3 + status]:
+                    self.model.wake_agent(neighbor_agent); neighbor_agent.infect()
@@ -0,0 +1,93 @@
+from collections import namedtuple
+
+import numpy as np
+
+try:
+    from .codes import DEAD, STATE_NAMES
+except ImportError:
+    from codes import DEAD, STATE_NAMES
+
+# Read-only stand-in for a retired PersonAgent, enough for agent_portrayal and reporting.
+class ArchivedAgent(namedtuple("ArchivedAgent", "unique_id age day_of_death pos vaccinated vaccine_waned masked state")):
+    __slots__ = ()
+
+    @property
+    def state_name(self):
+        return STATE_NAMES[self.state]
+
+
+class DeadArchive:
+    """Compact record of agents that died and were retired from the schedule and grid.
+
+    Each death is one row in a set of growable NumPy arrays. Running totals of the
+    flags the population counters track are kept alongside, so the archive can add
+    its share to a full-scan verification in O(1).
+    """
+
+    FIELDS = {
+        "unique_id": np.int64, "age": np.int16, "day_of_death": np.int32, "x": np.int32, "y": np.int32,
+        "vaccinated": bool, "vaccine_waned": bool, "masked": bool, "asymptomatic": bool,
+    }
+
+    def __init__(self, capacity=64):
+        self._size = 0
+        for name, dtype in self.FIELDS.items():
+            setattr(self, "_" + name, np.zeros(capacity, dtype=dtype))
+        self.vaccinated = 0
+        self.vaccine_effective = 0
+        self.masked = 0
+
+    def __len__(self):
+        return self._size
+
+    def __getattr__(self, name):
+        # archive.age, archive.x, ... return views of the filled part of each column
+        if name in DeadArchive.FIELDS:
+            return getattr(self, "_" + name)[:self._size]
+        raise AttributeError(name)
+
+    def _reserve(self, extra):
+        capacity = len(self._unique_id)
+        if self._size + extra <= capacity: return
+        capacity = max(2 * capacity, self._size + extra)
+        for name in self.FIELDS:
+            column = getattr(self, "_" + name)
+            grown = np.zeros(capacity, dtype=column.dtype); grown[:self._size] = column[:self._size]
+            setattr(self, "_" + name, grown)
+
+    def add(self, agent, day):
+        self.add_columns(unique_id=[agent.unique_id], age=[agent.age], day_of_death=[day],
+                         x=[agent.pos[0]], y=[agent.pos[1]], vaccinated=[agent.vaccinated],
+                         vaccine_waned=[agent.vaccine_waned], masked=[agent.masked],
+                         asymptomatic=[agent.asymptomatic])
+
+    def add_columns(self, **columns):
+        """Appends a batch of dead agents given one array per field."""
+        n = len(columns["unique_id"])
+        self._reserve(n)
+        for name in self.FIELDS:
+            getattr(self, "_" + name)[self._size:self._size + n] = columns[name]
+        vaccinated = np.asarray(columns["vaccinated"], dtype=bool)
+        self.vaccinated += int(vaccinated.sum())
+        self.vaccine_effective += int((vaccinated & ~np.asarray(columns["vaccine_waned"], dtype=bool)).sum())
+        self.masked += int(np.count_nonzero(columns["masked"]))
+        self._size += n
+
+    def columns(self, start=0):
+        """Copies of the filled part of every column (from row `start`), as add_columns() takes them."""
+        return {name: getattr(self, "_" + name)[start:self._size].copy() for name in self.FIELDS}
+
+    def tally_into(self, counters):
+        """Adds the archived dead to a PopulationCounters built from the living agents."""
+        counters.total += self._size
+        counters.states[STATE_NAMES[DEAD]] += self._size
+        counters.vaccinated += self.vaccinated
+        counters.vaccine_effective += self.vaccine_effective
+        counters.masked += self.masked
+        return counters
+
+    def records(self):
+        for i in range(self._size):
+            yield ArchivedAgent(int(self._unique_id[i]), int(self._age[i]), int(self._day_of_death[i]),
+                                (int(self._x[i]), int(self._y[i])), bool(self._vaccinated[i]),
+                                bool(self._vaccine_waned[i]), bool(self._masked[i]), DEAD)
@@ -0,0 +1,170 @@
+"""Step-loop benchmarks over grid size, density and risk_perception_radius, with a stored baseline.
+
+    python benchmarks.py --out bench.json                        # full matrix, results as JSON
+    python benchmarks.py --quick --save-baseline baseline.json   # record a baseline
+    python benchmarks.py --quick --baseline baseline.json        # exit 1 if throughput regressed
+
+Every case runs with a fixed seed in its own fresh process, so peak RSS is per case
+and earlier cases cannot warm caches for later ones.
+"""
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import multiprocessing
+import platform
+import statistics
+import sys
+import time
+import traceback
+
+try:
+    from .headless import peak_rss_mb
+except ImportError:
+    from headless import peak_rss_mb
+
+SIZES = (50, 200, 500)
+QUICK_SIZES = (50, 200)
+DENSITIES = (0.4, 0.8)
+RADII = (1, 3)
+ENGINES = ("object", "vectorized")
+WARMUP_DAYS = 3 # Not timed: lets masks, commutes and the epidemic get going
+MEASURE_DAYS = 10
+SEED = 12345
+THRESHOLD = 0.25 # Allowed drop in agent-steps/s before compare() flags a case
+
+
+def case_name(case):
+    return f"{case['engine']}-{case['size']}x{case['size']}-d{case['density']}-r{case['radius']}"
+
+
+def benchmark_cases(sizes=SIZES, densities=DENSITIES, radii=RADII, engines=ENGINES):
+    """Every combination of engine, square grid size, density and risk_perception_radius."""
+    cases = [{"engine": engine, "size": size, "density": density, "radius": radius}
+             for engine, size, density, radius in itertools.product(engines, sizes, densities, radii)]
+    return [dict(case, name=case_name(case)) for case in cases]
+
+
+def run_case(task):
+    """Builds the case's model, steps through the warm-up, then times each measured day."""
+    case, warmup_days, measure_days = task
+    try:
+        from .model import InfectionModel
+    except ImportError:
+        from model import InfectionModel
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        model = InfectionModel(width=case["size"], height=case["size"], density=case["density"],
+                               risk_perception_radius=case["radius"], engine=case["engine"], seed=SEED,
+                               max_days=warmup_days + measure_days + 1, log_path=None)
+        construction_seconds = time.perf_counter() - start
+        for _ in range(warmup_days):
+            model.step()
+        day_seconds, living = [], []
+        for _ in range(measure_days): # Steps on even if the epidemic has ended, so every case times the same days
+            living.append(model.count_person_agents() - model.count_state("Dead"))
+            start = time.perf_counter()
+            model.step()
+            day_seconds.append(time.perf_counter() - start)
+        if model.engine_mode == "tiled": model.engine.close() # Its strip workers are this process's children
+    seconds_per_day = statistics.median(day_seconds) # Median: robust to the odd slow day on a shared machine
+    return dict(case, agents=living[0], construction_seconds=round(construction_seconds, 4),
+                seconds_per_day=round(seconds_per_day, 6),
+                agent_steps_per_second=round(statistics.mean(living) / seconds_per_day) if seconds_per_day else None,
+                peak_rss_mb=peak_rss_mb())
+
+
+def _serve_case(conn, task):
+    """Case process: sends back (True, result) or (False, traceback)."""
+    try:
+        conn.send((True, run_case(task)))
+    except Exception:
+        conn.send((False, traceback.format_exc()))
+
+
+def run_benchmarks(cases, warmup_days=WARMUP_DAYS, measure_days=MEASURE_DAYS, progress=None):
+    """Runs the cases one at a time, each in a new process; returns their results in order.
+
+    The processes are not daemonic (unlike a Pool's), so tiled cases can start their strip workers.
+    """
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for case in cases:
+        conn, child = context.Pipe()
+        process = context.Process(target=_serve_case, args=(child, (case, warmup_days, measure_days)))
+        process.start(); child.close()
+        try:
+            ok, reply = conn.recv()
+        except EOFError: # Died without replying
+            ok, reply = False, None
+        process.join()
+        if reply is None: reply = f"the case process exited with code {process.exitcode} without a result"
+        if not ok:
+            raise RuntimeError(f"Benchmark case {case['name']} failed:\n{reply}")
+        results.append(reply)
+        if progress is not None: progress(reply)
+    return results
+
+
+def environment():
+    import numpy
+    import mesa
+    return {"python": platform.python_version(), "platform": platform.platform(), "processor": platform.processor(),
+            "cpu_count": multiprocessing.cpu_count(), "numpy": numpy.__version__, "mesa": mesa.__version__}
+
+
+def compare(results, baseline, threshold=THRESHOLD):
+    """Cases whose agent-steps/s fell more than `threshold` below the baseline's, as (name, baseline, current, change)."""
+    reference = {result["name"]: result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        before = reference.get(result["name"])
+        if before is None or not before["agent_steps_per_second"] or result["agent_steps_per_second"] is None: continue
+        change = result["agent_steps_per_second"] / before["agent_steps_per_second"] - 1
+        if change < -threshold:
+            regressions.append((result["name"], before["agent_steps_per_second"], result["agent_steps_per_second"], change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark InfectionModel's step loop.")
+    parser.add_argument("--quick", action="store_true", help=f"grid sizes {QUICK_SIZES} only")
+    parser.add_argument("--sizes", type=int, nargs="+")
+    parser.add_argument("--densities", type=float, nargs="+", default=DENSITIES)
+    parser.add_argument("--radii", type=int, nargs="+", default=RADII)
+    parser.add_argument("--engines", nargs="+", default=ENGINES, choices=("object", "vectorized", "tiled"))
+    parser.add_argument("--warmup-days", type=int, default=WARMUP_DAYS)
+    parser.add_argument("--days", type=int, default=MEASURE_DAYS, help="measured days per case")
+    parser.add_argument("--out", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="baseline JSON to compare against; exit status 1 on regression")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="allowed fractional drop in agent-steps/s")
+    parser.add_argument("--save-baseline", help="also write these results as a baseline file")
+    args = parser.parse_args(argv)
+
+    sizes = args.sizes or (QUICK_SIZES if args.quick else SIZES)
+    cases = benchmark_cases(sizes, args.densities, args.radii, args.engines)
+    print(f"{'case':<32}{'agents':>9}{'build s':>9}{'ms/day':>10}{'agent-steps/s':>15}{'RSS MiB':>9}")
+    def show(r):
+        print(f"{r['name']:<32}{r['agents']:>9}{r['construction_seconds']:>9.2f}{r['seconds_per_day'] * 1000:>10.1f}"
+              f"{r['agent_steps_per_second'] or 0:>15,}{r['peak_rss_mb'] or 0:>9.0f}", flush=True)
+    results = run_benchmarks(cases, args.warmup_days, args.days, progress=show)
+    report = {"environment": environment(), "seed": SEED, "warmup_days": args.warmup_days,
+              "measure_days": args.days, "results": results}
+    for path in filter(None, (args.out, args.save_baseline)):
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for name, before, after, change in regressions:
+            print(f"REGRESSION {name}: {before:,} -> {after:,} agent-steps/s ({change:+.1%})")
+        if regressions:
+            sys.exit(1)
+        print(f"No case regressed more than {args.threshold:.0%} against {args.baseline}.")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""On-disk cache of finished runs, keyed by a hash of the scenario parameters, seed and model code.
+
+    cache = ResultCache("run_cache", max_bytes=512 * 2**20)
+    result = cache.run({"seed": 7, "infection_rate": 0.1})   # simulates once; instant afterwards
+    result.series["Infected"], result.summary["final"], cache.stats()
+
+An entry is <key>.npz: every DataCollector series plus a JSON summary. With
+checkpoints=True it also gets <key>.ckpt, a Checkpoint of the final model. Entries are
+evicted least recently used first (by file mtime, refreshed on every hit) once the
+directory holds more than max_bytes. Only seeded runs are cached; profiled runs
+are not, since their timing reporters are never the same twice.
+"""
+import contextlib
+import functools
+import hashlib
+import inspect
+import json
+import os
+import tempfile
+
+import numpy as np
+import mesa
+from mesa import Model
+from mesa.datacollection import DataCollector
+
+try:
+    from .model import InfectionModel
+    from .checkpoint import Checkpoint
+except ImportError:
+    from model import InfectionModel
+    from checkpoint import Checkpoint
+
+DEFAULT_MAX_BYTES = 512 * 2**20
+# Where the output goes, or extra checks; results are the same either way, so they are not part of the key.
+OUTPUT_PARAMS = {"log_path", "log_format", "log_flush_every", "record_path", "debug_counters"}
+# Modules whose code decides a run's results; editing any of them invalidates the cache.
+MODEL_MODULES = ("agent", "archive", "checkpoint", "codes", "counters", "households", "locations", "model", "neighbors",
+                 "population", "profiling", "rasters", "routes", "scheduling", "sinks", "tables", "tiles", "vaccination",
+                 "vectorized")
+
+
+@functools.lru_cache(maxsize=None)
+def code_version():
+    """Hash of the model modules' source and the Mesa and NumPy versions."""
+    digest = hashlib.sha256(f"mesa {mesa.__version__} numpy {np.__version__}".encode())
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name in MODEL_MODULES:
+        with open(os.path.join(here, name + ".py"), "rb") as f:
+            digest.update(name.encode() + b"\0" + f.read())
+    return digest.hexdigest()
+
+
+def canonical_params(params):
+    """Every InfectionModel constructor parameter that shapes the results, defaults filled in, in name order."""
+    defaults = {name: p.default for name, p in inspect.signature(InfectionModel.__init__).parameters.items() if name != "self"}
+    unknown = set(params) - set(defaults)
+    if unknown:
+        raise ValueError(f"Unknown InfectionModel parameters: {sorted(unknown)}")
+    full = {**defaults, **params}
+    if full["engine"] == "tiled" and full["workers"] is None: full["workers"] = os.cpu_count() or 1 # Results depend on the worker count
+    def plain(value): # 0.1 and np.float64(0.1) hash alike, and so do 2 and 2.0
+        if isinstance(value, np.generic): value = value.item()
+        return int(value) if isinstance(value, float) and value.is_integer() else value
+    return {name: plain(full[name]) for name in sorted(full) if name not in OUTPUT_PARAMS}
+
+
+def run_summary(model):
+    """What headless.py and CachedResult report about a finished run besides its series."""
+    return {"days": model.day, "final": model.counters.as_dict(), "cumulative_deaths": model.cumulative_deaths}
+
+
+class CachedResult:
+    """One cache entry: the DataCollector series, the run summary and, if stored, the final checkpoint."""
+
+    def __init__(self, key, params, series, summary, checkpoint_path=None):
+        self.key, self.params, self.series, self.summary = key, params, series, summary
+        self.checkpoint_path = checkpoint_path
+
+    def restore(self):
+        """The final model, as an independent InfectionModel; None if the entry has no checkpoint."""
+        if self.checkpoint_path is None: return None
+        return Checkpoint.load(self.checkpoint_path).restore()
+
+
+class PendingEntry:
+    """Set as model.result_cache by ResultCache.open(): the model files itself here when its run stops."""
+
+    def __init__(self, cache, params):
+        self.cache, self.params = cache, params
+
+    def store(self, model):
+        model.result_cache = None # Not part of the checkpoint, and stored only once
+        self.cache.put(self.params, model)
+
+
+class ResultCache:
+    """Directory of finished runs with size-bounded LRU eviction; hit, miss and eviction counts in stats()."""
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES, checkpoints=False):
+        if max_bytes <= 0:
+            raise ValueError(f"max_bytes must be positive, got {max_bytes}")
+        self.directory, self.max_bytes, self.checkpoints = directory, max_bytes, checkpoints
+        os.makedirs(directory, exist_ok=True)
+        self.hits = self.misses = self.bypassed = self.stores = self.evictions = 0
+
+    def key(self, params):
+        """The entry key for these InfectionModel parameters, or None if the run is not cacheable."""
+        canonical = canonical_params(params)
+        if canonical["seed"] is None or canonical["profile"]: return None
+        payload = json.dumps({"params": canonical, "code": code_version()}, sort_keys=True, default=repr)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def path(self, key, suffix):
+        return os.path.join(self.directory, key + suffix)
+
+    def get(self, params):
+        """The cached run for these parameters, or None (counted as a miss, or as bypassed if uncacheable)."""
+        key = self.key(params)
+        if key is None:
+            self.bypassed += 1
+            return None
+        try:
+            with np.load(self.path(key, ".npz")) as entry:
+                meta = json.loads(str(entry["__meta__"]))
+                series = {name: entry[name] for name in meta["series"]}
+        except (FileNotFoundError, ValueError, KeyError, OSError): # Missing, or evicted or truncated mid-read
+            self.misses += 1
+            return None
+        checkpoint_path = self.path(key, ".ckpt")
+        has_checkpoint = os.path.exists(checkpoint_path)
+        for suffix in (".npz", ".ckpt") if has_checkpoint else (".npz",):
+            with contextlib.suppress(FileNotFoundError): os.utime(self.path(key, suffix)) # Most recently used
+        self.hits += 1
+        return CachedResult(key, meta["params"], series, meta["summary"], checkpoint_path if has_checkpoint else None)
+
+    def put(self, params, model):
+        """Stores a finished model's series and summary (and its checkpoint if checkpoints=True); returns the key."""
+        series = {name: np.asarray(values, dtype=float) for name, values in model.datacollector.model_vars.items()}
+        checkpoint = model.checkpoint() if self.checkpoints and model.engine_mode != "tiled" else None
+        return self.put_series(params, series, run_summary(model), checkpoint)
+
+    def put_series(self, params, series, summary, checkpoint=None):
+        """Stores a run from its series and summary, e.g. ones sent back by sweep workers; returns the key or None."""
+        key = self.key(params)
+        if key is None: return None
+        meta = {"params": canonical_params(params), "series": list(series), "summary": summary}
+        if checkpoint is not None: self._write(key, ".ckpt", lambda f: f.write(checkpoint.data))
+        self._write(key, ".npz", lambda f: np.savez(f, __meta__=np.array(json.dumps(meta, default=repr)), **series))
+        self.stores += 1
+        self.evict(keep=key)
+        return key
+
+    def _write(self, key, suffix, save):
+        """Writes through a temporary file, so readers never see a partial entry."""
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                save(f)
+            os.replace(tmp, self.path(key, suffix))
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError): os.remove(tmp)
+            raise
+
+    def entries(self):
+        """{key: (last used, bytes)} over the entries on disk."""
+        entries = {}
+        for name in os.listdir(self.directory):
+            key, suffix = os.path.splitext(name)
+            if suffix not in (".npz", ".ckpt"): continue
+            with contextlib.suppress(FileNotFoundError):
+                stat = os.stat(os.path.join(self.directory, name))
+                used, size = entries.get(key, (0.0, 0))
+                entries[key] = (max(used, stat.st_mtime), size + stat.st_size)
+        return entries
+
+    def evict(self, keep=None):
+        """Removes least recently used entries until the directory fits in max_bytes."""
+        entries = self.entries()
+        total = sum(size for _, size in entries.values())
+        for key, (_, size) in sorted(entries.items(), key=lambda item: item[1][0]):
+            if total <= self.max_bytes: break
+            if key == keep: continue
+            for suffix in (".npz", ".ckpt"):
+                with contextlib.suppress(FileNotFoundError): os.remove(self.path(key, suffix))
+            total -= size; self.evictions += 1
+
+    def clear(self):
+        for key in self.entries():
+            for suffix in (".npz", ".ckpt"):
+                with contextlib.suppress(FileNotFoundError): os.remove(self.path(key, suffix))
+
+    def stats(self):
+        entries = self.entries()
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "bypassed": self.bypassed, "stores": self.stores,
+                "evictions": self.evictions, "hit_rate": self.hits / lookups if lookups else None,
+                "entries": len(entries), "bytes": sum(size for _, size in entries.values()), "max_bytes": self.max_bytes}
+
+    def run(self, params):
+        """The cached result for params, simulating and storing the run first on a miss."""
+        result = self.get(params)
+        if result is not None: return result
+        model = InfectionModel(**params)
+        while model.running:
+            model.step()
+        if model.engine_mode == "tiled": model.engine.close()
+        key = self.put(params, model)
+        series = {name: np.asarray(values, dtype=float) for name, values in model.datacollector.model_vars.items()}
+        return CachedResult(key, canonical_params(params), series, run_summary(model))
+
+    def open(self, **params):
+        """A model for the web view: a CachedRun replay on a hit with a checkpoint, else a new InfectionModel
+        that files its results here when it stops."""
+        result = self.get(params)
+        if result is not None and result.checkpoint_path is not None: return CachedRun(result)
+        model = InfectionModel(**params)
+        model.result_cache = PendingEntry(self, params)
+        return model
+
+
+class CachedRun(Model):
+    """A cached run played back for server.py: each step shows the next stored day of the reporters.
+
+    The grid views show the final day, from the stored checkpoint.
+    """
+
+    def __init__(self, result):
+        super().__init__()
+        self.result, self.final = result, result.restore()
+        self.width, self.height = self.final.width, self.final.height
+        self.datacollector = DataCollector()
+        self.day = -1
+        self.step()
+
+    def __getattr__(self, name): # grid, locations, dead_archive, engine, ...: the final model's
+        if name in ("final", "result"): raise AttributeError(name)
+        return getattr(self.final, name)
+
+    def cell_counts(self):
+        return self.final.cell_counts()
+
+    def step(self):
+        days = len(next(iter(self.result.series.values())))
+        self.day = min(self.day + 1, days - 1)
+        self.datacollector.model_vars = {name: values[:self.day + 1].tolist() for name, values in self.result.series.items()}
+        self.running = self.day < days - 1
+
@@ -0,0 +1,11 @@
+# Small integer codes for per-agent categorical attributes, shared by PersonAgent and the
+# vectorized engine. Index the *_NAMES tuples for the strings used by reporters and the server.
+SUSCEPTIBLE, INFECTED, RECOVERED, DEAD = 0, 1, 2, 3
+STATE_NAMES = ("Susceptible", "Infected", "Recovered", "Dead")
+STATE_CODES = {name: code for code, name in enumerate(STATE_NAMES)}
+
+AT_HOME, AT_WORK, GOING_TO_WORK, GOING_TO_HOME = 0, 1, 2, 3
+LOCATION_NAMES = ("at_home", "at_work", "going_to_work", "going_to_home")
+
+ISOLATED, ESSENTIAL = 0, 1
+MOBILITY_NAMES = ("isolated", "essential")
@@ -0,0 +1,92 @@
+from collections import namedtuple
+
+try:
+    from .codes import INFECTED, STATE_NAMES as STATES
+except ImportError:
+    from codes import INFECTED, STATE_NAMES as STATES
+
+# One row of an engine's per-agent arrays, with the attributes PopulationCounters.add() reads.
+ScannedRow = namedtuple("ScannedRow", "state asymptomatic masked vaccinated vaccine_waned")
+
+
+class PopulationCounters:
+    """Running tallies of the person population, updated as agents transition.
+
+    PersonAgent routes every state, masking and vaccination change through
+    set_state / set_masked / set_vaccine, which adjust these counts in O(1), so the
+    model reporters and the CSV log never have to scan the schedule.
+    """
+
+    def __init__(self):
+        self.states = dict.fromkeys(STATES, 0)
+        self.total = 0
+        self.vaccinated = 0
+        self.vaccine_effective = 0
+        self.asymptomatic = 0
+        self.masked = 0
+
+    @classmethod
+    def from_agents(cls, agents):
+        """Builds the tallies with a full scan (used for verification)."""
+        counters = cls()
+        for agent in agents:
+            counters.add(agent)
+        return counters
+
+    @classmethod
+    def from_columns(cls, columns):
+        """Full scan of per-agent arrays (InfectionModel.agent_columns), row by row as from_agents() does."""
+        return cls.from_agents(map(ScannedRow._make, zip(*(columns[name].tolist() for name in ScannedRow._fields))))
+
+    def add(self, agent):
+        self.total += 1
+        self.states[STATES[agent.state]] += 1
+        self.vaccinated += agent.vaccinated
+        self.vaccine_effective += agent.vaccinated and not agent.vaccine_waned
+        self.asymptomatic += agent.state == INFECTED and agent.asymptomatic
+        self.masked += agent.masked
+
+    def remove(self, agent):
+        self.total -= 1
+        self.states[STATES[agent.state]] -= 1
+        self.vaccinated -= agent.vaccinated
+        self.vaccine_effective -= agent.vaccinated and not agent.vaccine_waned
+        self.asymptomatic -= agent.state == INFECTED and agent.asymptomatic
+        self.masked -= agent.masked
+
+    def merge(self, other):
+        """Adds the tallies of another part of the population (e.g. one tile of tiles.TiledEngine)."""
+        for name, count in other.states.items():
+            self.states[name] += count
+        self.total += other.total
+        self.vaccinated += other.vaccinated
+        self.vaccine_effective += other.vaccine_effective
+        self.asymptomatic += other.asymptomatic
+        self.masked += other.masked
+        return self
+
+    def change_state(self, agent, new_state):
+        """Call before agent.state is overwritten with new_state (both codes from codes.py)."""
+        old_state = agent.state
+        self.states[STATES[old_state]] -= 1
+        self.states[STATES[new_state]] += 1
+        if agent.asymptomatic:
+            self.asymptomatic += (new_state == INFECTED) - (old_state == INFECTED)
+
+    def change_vaccine(self, agent, vaccinated, vaccine_waned):
+        """Call before agent.vaccinated / agent.vaccine_waned are overwritten."""
+        self.vaccinated += vaccinated - agent.vaccinated
+        self.vaccine_effective += (vaccinated and not vaccine_waned) - (agent.vaccinated and not agent.vaccine_waned)
+
+    def as_dict(self):
+        return {**self.states, "Total": self.total, "Vaccinated (Any)": self.vaccinated,
+                "Vaccine Effective": self.vaccine_effective, "Asymptomatic": self.asymptomatic,
+                "Masked": self.masked}
+
+    def verify(self, expected, day):
+        """Raises RuntimeError listing every tally that differs from `expected` (a full-scan PopulationCounters)."""
+        actual, expected = self.as_dict(), expected.as_dict()
+        mismatches = {key: (actual[key], expected[key]) for key in expected if actual[key] != expected[key]}
+        if mismatches:
+            details = ", ".join(f"{key}: counter={a} scan={e}" for key, (a, e) in mismatches.items())
+            raise RuntimeError(f"Day {day}: population counters out of sync with full scan ({details})")
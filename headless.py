@@ -0,0 +1,167 @@
+"""Command-line runner: builds an InfectionModel from flags or a JSON config, runs it and writes its log.
+
+    python headless.py --width 200 --height 200 --engine vectorized --days 120 --seed 7 --out run.csv
+    python headless.py --config scenario.json --set infection_rate=0.2 --summary run.json
+
+Nothing from server.py is imported, and the model itself is only imported once the
+flags have been parsed, so --help and flag errors return immediately.
+"""
+import argparse
+import ast
+import contextlib
+import inspect
+import io
+import json
+import sys
+import time
+
+_START = time.perf_counter()
+
+
+def parse_value(text):
+    """Python literal if it parses as one (numbers, True/False/None, quoted strings), else the raw string."""
+    try:
+        return ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        return text
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MiB, or None where the resource module is missing (Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10 # Bytes on macOS, KiB on Linux
+
+
+def add_model_arguments(parser):
+    """Flags that describe the model to build; read back with model_params(). Shared with live.py."""
+    parser.add_argument("--config", help="JSON file of InfectionModel keyword arguments")
+    parser.add_argument("--set", action="append", default=[], metavar="NAME=VALUE",
+                        help="any InfectionModel keyword argument (repeatable); overrides --config")
+    parser.add_argument("--days", type=int, help="maximum days to run (max_days)")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--width", type=int)
+    parser.add_argument("--height", type=int)
+    parser.add_argument("--density", type=float)
+    parser.add_argument("--engine", choices=("object", "vectorized", "tiled"))
+    parser.add_argument("--workers", type=int, help="worker processes for --engine tiled")
+    parser.add_argument("--out", help="per-day log path (log_path); 'none' disables it")
+    parser.add_argument("--log-format", choices=("csv", "npz", "memory"))
+    parser.add_argument("--profile", action="store_true", help="time each phase of the daily step (profiling.py)")
+    parser.add_argument("--hybrid", action="store_true", help="run isolated low-risk households as compartments (households.py)")
+    return parser
+
+
+def build_parser():
+    parser = add_model_arguments(argparse.ArgumentParser(description="Run InfectionModel without the web server."))
+    parser.add_argument("--summary", help="also write the run summary as JSON to this path")
+    parser.add_argument("--verbose", action="store_true", help="show the model's lockdown announcements")
+    parser.add_argument("--cache", metavar="DIR", help="result cache directory: a seeded run already in it is not re-simulated")
+    parser.add_argument("--cache-mb", type=float, default=512, help="size bound of --cache, least recently used evicted first")
+    return parser
+
+
+def model_params(args, parser):
+    """Keyword arguments for InfectionModel: --config, then --set, then the dedicated flags."""
+    params = {}
+    if args.config:
+        with open(args.config) as f:
+            params.update(json.load(f))
+    for item in args.set:
+        name, sep, value = item.partition("=")
+        if not sep: parser.error(f"--set expects NAME=VALUE, got {item!r}")
+        params[name.strip()] = parse_value(value.strip())
+    flags = {"max_days": args.days, "seed": args.seed, "width": args.width, "height": args.height,
+             "density": args.density, "engine": args.engine, "workers": args.workers, "log_format": args.log_format,
+             "profile": args.profile or None, "hybrid": args.hybrid or None}
+    params.update({name: value for name, value in flags.items() if value is not None})
+    if args.out is not None:
+        params["log_path"] = None if args.out.lower() == "none" else args.out
+    return params
+
+
+def run(params, verbose=False):
+    """Builds and runs the model; returns (model, summary dict of timings, throughput and final counts)."""
+    import_start = time.perf_counter()
+    try:
+        from .model import InfectionModel
+    except ImportError:
+        from model import InfectionModel
+    import_seconds = time.perf_counter() - import_start
+    unknown = set(params) - set(inspect.signature(InfectionModel.__init__).parameters) - {"self"}
+    if unknown:
+        raise ValueError(f"Unknown InfectionModel parameters: {sorted(unknown)}")
+    quiet = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    with quiet:
+        construction_start = time.perf_counter()
+        model = InfectionModel(**params)
+        construction_seconds = time.perf_counter() - construction_start
+        agent_steps = 0; step_seconds = 0.0
+        while model.running:
+            living = model.count_person_agents() - model.count_state("Dead")
+            step_start = time.perf_counter()
+            model.step()
+            step_seconds += time.perf_counter() - step_start; agent_steps += living
+    if params.get("engine") == "tiled": model.engine.close() # The run is over; stop the worker processes
+    summary = {
+        "startup_seconds": round(construction_start - _START + construction_seconds, 4),
+        "import_seconds": round(import_seconds, 4),
+        "construction_seconds": round(construction_seconds, 4),
+        "days": model.day,
+        "step_seconds": round(step_seconds, 4),
+        "seconds_per_day": round(step_seconds / model.day, 6) if model.day else None,
+        "agent_steps_per_second": round(agent_steps / step_seconds) if step_seconds else None,
+        "peak_rss_mb": peak_rss_mb(),
+        "final": model.counters.as_dict(),
+        "cumulative_deaths": model.cumulative_deaths,
+    }
+    if model.profiler is not None: summary["profile"] = model.profiler.summary()
+    if model.households is not None: summary["hybrid"] = model.households.stats()
+    return model, summary
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    params = model_params(args, parser)
+    cache = None
+    if args.cache:
+        try:
+            from .cache import ResultCache
+        except ImportError:
+            from cache import ResultCache
+        cache = ResultCache(args.cache, int(args.cache_mb * 2**20))
+    result = cache.get(params) if cache is not None else None
+    if result is not None:
+        model, summary = None, dict(result.summary, cache_key=result.key)
+    else:
+        model, summary = run(params, args.verbose)
+        if cache is not None: cache.put(params, model)
+    if cache is not None: summary["cache"] = cache.stats()
+    if args.summary:
+        with open(args.summary, "w") as f:
+            json.dump({"params": params, **summary}, f, indent=2)
+    print(f"{summary['days']} days, {summary['final']['Total']} agents, "
+          f"{summary['final']['Dead']} dead ({summary['cumulative_deaths']} cumulative)")
+    if result is not None:
+        print(f"from the result cache ({result.key[:12]}); nothing was simulated")
+        return summary
+    print(f"startup {summary['startup_seconds']:.3f} s (imports {summary['import_seconds']:.3f} s, "
+          f"construction {summary['construction_seconds']:.3f} s)")
+    if summary["seconds_per_day"] is not None:
+        print(f"{summary['seconds_per_day'] * 1000:.1f} ms/day, {summary['agent_steps_per_second']:,} agent-steps/s")
+    if summary["peak_rss_mb"] is not None:
+        print(f"peak memory {summary['peak_rss_mb']:.1f} MiB")
+    if "hybrid" in summary:
+        hybrid = summary["hybrid"]
+        print(f"hybrid: {hybrid['promotions']} promotions, {hybrid['demotions']} demotions, "
+              f"{hybrid['aggregated_people']} people in {hybrid['aggregated_households']} aggregated households at the end")
+    if model.profiler is not None: print(model.profiler.report())
+    return summary
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import math
+import os
+import weakref
+
+import numpy as np
+from mesa.visualization.ModularVisualization import VisualizationElement
+
+# RGB per state layer of model.cell_counts(); a heatmap cell is the mix of its people's colors.
+PALETTE = {
+    "susceptible": (200, 200, 200),
+    "vaccinated": (40, 110, 230),
+    "infected": (220, 30, 30),
+    "recovered": (40, 160, 70),
+}
+
+
+def block_sums(layer, block):
+    """Sums a (width, height) layer over block x block squares (edge blocks may be partial)."""
+    width, height = layer.shape
+    bw, bh = math.ceil(width / block), math.ceil(height / block)
+    padded = np.zeros((bw * block, bh * block), dtype=layer.dtype)
+    padded[:width, :height] = layer
+    return padded.reshape(bw, block, bh, block).sum(axis=(1, 3))
+
+
+def heatmap_rgba(layers, block, levels=16):
+    """(bw, bh, 4) uint8 image: color by the state mix of each block, opacity by its people per cell.
+
+    Channels are posterized to `levels` values, so slow drifts (a few more vaccinated per
+    block each day) only change a pixel once they become visible.
+    """
+    people = block_sums(layers["people"], block)
+    cells = block_sums(np.ones(layers["people"].shape, dtype=np.int64), block)
+    share = 1 / np.maximum(people, 1)
+    rgb = sum(np.multiply.outer(block_sums(layers[name], block) * share, color) for name, color in PALETTE.items())
+    alpha = 255 * np.minimum(1.0, people / cells)
+    step = 255 / (levels - 1)
+    return (np.round(np.dstack([rgb, alpha]) / step) * step).round().astype(np.uint8)
+
+
+def heatmap_pixels(model, max_bins=100, levels=16):
+    """The model's heatmap as (width, height, (n, 4) uint8 RGBA rows), row-major from the top row.
+
+    y grows upward as in CanvasGrid. Blocks are sized so neither side exceeds max_bins.
+    """
+    block = max(1, math.ceil(max(model.width, model.height) / max_bins))
+    image = heatmap_rgba(model.cell_counts(), block, levels)
+    return image.shape[0], image.shape[1], image[:, ::-1].transpose(1, 0, 2).reshape(-1, 4)
+
+
+class HeatmapGrid(VisualizationElement):
+    """Draws the grid as a downsampled heatmap of per-cell state counts, rendered server-side.
+
+    The grid is summed into at most max_bins x max_bins blocks, so a frame never has
+    more than max_bins² pixels whatever the grid size or population. Each frame sends only the pixels
+    that changed since the previous one, as a flat [index, r, g, b, a, ...] list; a
+    full frame goes out for a new model and every keyframe_every frames, so a browser
+    that missed a frame (or a second tab) catches up at the next keyframe.
+    """
+
+    local_includes = ["HeatmapModule.js"]
+    local_dir = os.path.dirname(os.path.abspath(__file__))
+
+    def __init__(self, canvas_width=750, canvas_height=750, max_bins=100, keyframe_every=50, levels=16):
+        self.max_bins, self.keyframe_every, self.levels = max_bins, keyframe_every, levels
+        self.js_code = f"elements.push(new HeatmapModule({canvas_width}, {canvas_height}));"
+        self._model = None # weakref to the model the last frame came from
+        self._pixels = None
+        self._frame = 0
+
+    def render(self, model):
+        bw, bh, pixels = heatmap_pixels(model, self.max_bins, self.levels)
+        full = (self._model is None or self._model() is not model or self._pixels is None
+                or self._pixels.shape != pixels.shape or self._frame % self.keyframe_every == 0)
+        changed = np.arange(len(pixels)) if full else np.flatnonzero((pixels != self._pixels).any(axis=1))
+        self._model, self._pixels = weakref.ref(model), pixels
+        self._frame += 1
+        return {"frame": self._frame, "base": None if full else self._frame - 1, "width": bw, "height": bh,
+                "cells": np.column_stack([changed, pixels[changed]]).ravel().tolist()}
@@ -0,0 +1,255 @@
+import numpy as np
+
+try:
+    from .vaccination import campaign_order
+    from .rasters import window_sum
+    from .codes import SUSCEPTIBLE, INFECTED, RECOVERED, STATE_NAMES, ESSENTIAL, ISOLATED
+except ImportError:
+    from vaccination import campaign_order
+    from rasters import window_sum
+    from codes import SUSCEPTIBLE, INFECTED, RECOVERED, STATE_NAMES, ESSENTIAL, ISOLATED
+
+QUIET_DAYS = 7 # Days a promoted household stays agents before it may be aggregated again, so a passing outbreak does not churn it
+SLOTS = 6 # Member slots per household row: place_households draws 2-6 people; homes a migrant pushed past that stay agents
+TRAITS = ("base_propensity_to_mask_normal", "base_propensity_to_mask_lockdown", "prop_voluntary_isolation_if_risk_high",
+          "base_compliance_propensity", "base_willingness_to_vaccinate")
+# Everything a member's PersonAgent needs back on promotion; one (households, SLOTS) array each.
+SLOT_FIELDS = {
+    "unique_id": np.int64, "age": np.int16, "state": np.int8, "masked": bool, "vaccinated": bool, "vaccine_waned": bool,
+    "days_since_recovery": np.int32, "days_since_vaccination": np.int32, "mobility": np.int8,
+    "work_x": np.int32, "work_y": np.int32, **dict.fromkeys(TRAITS, np.float64),
+}
+
+
+def is_commuter(agent):
+    """Whether agent can ever leave home for work (PersonAgent.move's condition, lockdown aside)."""
+    return agent.mobility == ESSENTIAL and agent.work_pos is not None and agent.age > 14
+
+
+class HouseholdCompartments:
+    """Hybrid mode's aggregated households: one row of arrays each instead of one PersonAgent per member.
+
+    A household is aggregated (demoted) at the start of a day when all of these hold, and
+    it has not been promoted in the last QUIET_DAYS days:
+    * nobody in it commutes and its cell is not a workplace;
+    * nobody else is in the cell and nobody in it is infected;
+    * nobody within risk_perception_radius is infected.
+    Its members then perceive no risk and stay home, so their day is a masking draw
+    plus the immunity-waning timers, run for every aggregated household in one batch.
+    It is promoted back to PersonAgents in any of these cases:
+    * an infected person comes within risk_perception_radius (start of day);
+    * an infected agent's transmission neighborhood reaches the cell (touch());
+    * anyone else arrives in the cell: a commuter passing through (arrive()) or a migrant.
+    The members stay in the occupancy rasters and population counters throughout.
+
+    Rows are indexed by household (model.locations.home_id). Each member slot keeps the
+    SLOT_FIELDS of its PersonAgent (state susceptible or recovered), so promotion gives
+    back the same person: id, traits, vaccine status and day counters.
+    """
+
+    def __init__(self, model, population):
+        self.model = model
+        self.home_x, self.home_y = population.household_x, population.household_y
+        n = len(self.home_x)
+        member_home = model.locations.home_id[population.home_x, population.home_y]
+        traits = population.traits
+        commuter = traits["essential"] & (traits["work_x"] >= 0) & (traits["age"] > 14)
+        self.commuters = np.bincount(member_home, weights=commuter, minlength=n).astype(np.int16)
+        self.workplace = model.locations.workplace[self.home_x, self.home_y]
+        self.aggregated = np.zeros(n, dtype=bool)
+        self.promoted_day = np.full(n, -QUIET_DAYS, dtype=np.int32)
+        self.size = np.zeros(n, dtype=np.int8)
+        for name, dtype in SLOT_FIELDS.items():
+            setattr(self, name, np.zeros((n, SLOTS), dtype=dtype))
+        self.cells = {} # (x, y) -> household row, for every aggregated household
+        self.promotions = 0 # Households turned back into PersonAgents
+        self.demotions = 0 # Households aggregated, including at construction
+
+    def aggregate_population(self, population):
+        """Aggregates the qualifying households of a new population directly; returns the rest of it, to materialize as agents."""
+        m, traits = self.model, population.traits
+        member_home = m.locations.home_id[population.home_x, population.home_y]
+        infected = np.zeros((m.width, m.height), dtype=np.int64)
+        np.add.at(infected, (population.home_x, population.home_y), population.infected)
+        infected = infected + window_sum(infected, m.risk_perception_radius)
+        sizes = np.bincount(member_home, minlength=len(self.home_x))
+        eligible = ((self.commuters == 0) & ~self.workplace & (infected[self.home_x, self.home_y] == 0)
+                    & (sizes > 0) & (sizes <= SLOTS))
+        members = np.flatnonzero(eligible[member_home])
+        rows = member_home[members]
+        order = np.argsort(rows, kind="stable"); members, rows = members[order], rows[order]
+        slots = np.arange(len(rows)) - np.searchsorted(rows, rows) # Rank within the household
+        self.unique_id[rows, slots] = np.arange(m.person_agent_next_id, m.person_agent_next_id + len(members))
+        m.person_agent_next_id += len(members)
+        self.mobility[rows, slots] = np.where(traits["essential"][members], ESSENTIAL, ISOLATED)
+        for name in ("age", "work_x", "work_y") + TRAITS:
+            getattr(self, name)[rows, slots] = traits[name][members]
+        households = np.flatnonzero(eligible)
+        self.size[households] = sizes[households]
+        self.aggregated[households] = True
+        self.cells.update(zip(zip(self.home_x[households].tolist(), self.home_y[households].tolist()), households.tolist()))
+        self.demotions += len(households)
+        m.rasters.people[self.home_x[households], self.home_y[households]] += sizes[households]
+        m.counters.total += len(members); m.counters.states[STATE_NAMES[SUSCEPTIBLE]] += len(members)
+        keep = np.ones(len(population.home_x), dtype=bool); keep[members] = False
+        return population._replace(home_x=population.home_x[keep], home_y=population.home_y[keep],
+                                   traits={name: values[keep] for name, values in traits.items()},
+                                   infected=population.infected[keep], asymptomatic=population.asymptomatic[keep])
+
+    # --- Daily update (start of the object model's day, after rasters.rebuild()) ---
+    def step(self):
+        rasters = self.model.rasters
+        risky = (rasters.infected_ratio[self.home_x, self.home_y] > 0) | (rasters.infected[self.home_x, self.home_y] > 0)
+        for row in np.flatnonzero(self.aggregated & risky).tolist():
+            self.promote(row)
+        people = rasters.people[self.home_x, self.home_y]
+        candidates = np.flatnonzero(~self.aggregated & ~risky & (self.commuters == 0) & ~self.workplace
+                                    & (people > 0) & (people <= SLOTS) & (self.promoted_day <= self.model.day - QUIET_DAYS))
+        for row in candidates.tolist():
+            self.demote(row)
+        self.advance_day()
+
+    def advance_day(self):
+        """One day of PersonAgent.step for every aggregated member: masking, then immunity waning."""
+        m = self.model
+        rows = np.flatnonzero(self.aggregated)
+        if not len(rows): return
+        x, y = self.home_x[rows], self.home_y[rows]
+        members = np.arange(SLOTS) < self.size[rows, None]
+        prob = (self.base_propensity_to_mask_lockdown if m.lockdown_active else self.base_propensity_to_mask_normal)[rows]
+        prob = np.where((m.rasters.masked_fraction[x, y] > 0.5)[:, None], np.minimum(1.0, prob * 1.2), prob) # Social norm effect
+        masked = members & (m.np_random.random(prob.shape) < prob)
+        change = masked.sum(axis=1) - self.masked[rows].sum(axis=1)
+        m.rasters.masked[x, y] += change; m.counters.masked += int(change.sum())
+        self.masked[rows] = masked
+
+        recovered = members & (self.state[rows] == RECOVERED)
+        self.days_since_recovery[rows] += recovered
+        waned = recovered & (self.days_since_recovery[rows] > m.natural_immunity_duration)
+        if waned.any():
+            r, s = rows[np.nonzero(waned)[0]], np.nonzero(waned)[1]
+            self.state[r, s] = SUSCEPTIBLE; self.days_since_recovery[r, s] = 0
+            n = len(r); m.counters.states[STATE_NAMES[RECOVERED]] -= n; m.counters.states[STATE_NAMES[SUSCEPTIBLE]] += n
+        effective = members & self.vaccinated[rows] & ~self.vaccine_waned[rows]
+        self.days_since_vaccination[rows] += effective
+        waned = effective & (self.days_since_vaccination[rows] > m.vaccine_immunity_duration)
+        if waned.any():
+            self.vaccine_waned[rows[np.nonzero(waned)[0]], np.nonzero(waned)[1]] = True
+            m.counters.vaccine_effective -= int(waned.sum())
+
+    def vaccinate(self, quota, pool_size):
+        """Vaccinates the aggregated members' share of the day's quota; returns how many were vaccinated.
+
+        The quota is split between these members and the model's vaccine_pool in proportion
+        to their eligible (unvaccinated susceptible) counts. This share is then drawn like
+        vaccination.campaign_order. Unwilling members leave part of it unused, and the
+        caller passes that part on to the pool.
+        """
+        m = self.model
+        rows = np.flatnonzero(self.aggregated)
+        members = np.arange(SLOTS) < self.size[rows, None]
+        eligible = members & (self.state[rows] == SUSCEPTIBLE) & ~self.vaccinated[rows]
+        r, s = rows[np.nonzero(eligible)[0]], np.nonzero(eligible)[1]
+        quota = min(quota, len(r) + pool_size)
+        if not len(r) or quota <= 0: return 0
+        share = int(m.np_random.hypergeometric(len(r), pool_size, quota)) if pool_size else quota
+        priority = self.age[r, s] if m.vaccination_priority == "oldest_first" else None
+        chosen = campaign_order(m.np_random, np.arange(len(r)), self.base_willingness_to_vaccinate[r, s], share, priority)
+        r, s = r[chosen], s[chosen]
+        self.vaccinated[r, s] = True; self.vaccine_waned[r, s] = False; self.days_since_vaccination[r, s] = 0
+        m.counters.vaccinated += len(r); m.counters.vaccine_effective += len(r)
+        return len(r)
+
+    # --- Promotion and demotion ---
+    def arrive(self, pos):
+        """Someone moved into pos: an aggregated household living there becomes agents again."""
+        row = self.cells.get(pos)
+        if row is not None: self.promote(row)
+
+    def touch(self, pos):
+        """An infected agent at pos is about to transmit: promotes aggregated households in its Moore neighborhood."""
+        m = self.model
+        x, y = pos
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                row = self.cells.get(((x + dx) % m.width, (y + dy) % m.height))
+                if row is not None: self.promote(row)
+
+    def promote(self, row):
+        """Turns an aggregated household back into its PersonAgents at home."""
+        m = self.model
+        cell = m.home_locations[row]
+        n = int(self.size[row])
+        members = [dict(zip(SLOT_FIELDS, values)) for values in zip(*(getattr(self, name)[row, :n].tolist() for name in SLOT_FIELDS))]
+        del self.cells[cell]; self.aggregated[row] = False; self.promoted_day[row] = m.day; self.promotions += 1
+        # The members leave the tallies and counts as a block and come back in one by one as agents
+        counters = m.counters
+        counters.total -= n
+        for member in members:
+            counters.states[STATE_NAMES[member["state"]]] -= 1
+            counters.vaccinated -= member["vaccinated"]; counters.vaccine_effective -= member["vaccinated"] and not member["vaccine_waned"]
+            counters.masked -= member["masked"]
+        m.rasters.people[cell] -= n; m.rasters.masked[cell] -= int(self.masked[row, :n].sum())
+        for member in members:
+            agent = m.agent_class(member["unique_id"], m, traits=member)
+            agent.home_pos = cell
+            agent.work_pos = (member["work_x"], member["work_y"]) if member["work_x"] >= 0 else None
+            if member["state"] != SUSCEPTIBLE: agent.set_state(member["state"])
+            if member["vaccinated"]: agent.set_vaccine(True, member["vaccine_waned"])
+            agent.days_since_recovery, agent.days_since_vaccination = member["days_since_recovery"], member["days_since_vaccination"]
+            agent.set_masked(member["masked"])
+            m.grid.place_agent(agent, cell); m.schedule.add(agent); m.rasters.add(agent)
+
+    def demote(self, row):
+        """Aggregates a household if only its own, uninfected, non-commuting members are in its cell."""
+        m = self.model
+        cell = m.home_locations[row]
+        occupants = m.grid.get_cell_list_contents([cell])
+        if any(agent.home_pos != cell or agent.state == INFECTED or is_commuter(agent) for agent in occupants): return
+        work = lambda agent: agent.work_pos or (-1, -1)
+        getters = {"work_x": lambda agent: work(agent)[0], "work_y": lambda agent: work(agent)[1]}
+        for name in SLOT_FIELDS: # Slots past the members are cleared, since row-wide sums (masked) include them
+            getattr(self, name)[row] = 0
+            getattr(self, name)[row, :len(occupants)] = [getters[name](agent) if name in getters else getattr(agent, name) for agent in occupants]
+        self.size[row] = len(occupants)
+        for agent in occupants: # Still counted in the rasters and counters, now as part of the row
+            m.vaccine_pool.discard(agent); m.grid.remove_agent(agent); m.schedule.remove(agent)
+        self.aggregated[row] = True; self.cells[cell] = row; self.demotions += 1
+
+    def note_migrant(self, agent):
+        """A migrant settled at agent.home_pos: a commuter there keeps the household from being aggregated."""
+        row = self.model.locations.home_id[agent.home_pos]
+        if row >= 0 and is_commuter(agent): self.commuters[row] += 1
+
+    # --- Reporting ---
+    @property
+    def people(self):
+        return int(self.size[self.aggregated].sum())
+
+    def member_columns(self):
+        """Per-member arrays (x, y and the SLOT_FIELDS) of every aggregated household."""
+        rows = np.flatnonzero(self.aggregated)
+        members = np.arange(SLOTS) < self.size[rows, None]
+        r = np.nonzero(members)[0]
+        return {"x": self.home_x[rows][r], "y": self.home_y[rows][r],
+                **{name: getattr(self, name)[rows][members] for name in SLOT_FIELDS}}
+
+    def tally_into(self, counters):
+        """Adds the aggregated members to a PopulationCounters built from the agents."""
+        columns = self.member_columns()
+        counters.total += len(columns["state"])
+        for state, count in zip(STATE_NAMES, np.bincount(columns["state"], minlength=len(STATE_NAMES)).tolist()):
+            counters.states[state] += count
+        counters.vaccinated += int(columns["vaccinated"].sum())
+        counters.vaccine_effective += int((columns["vaccinated"] & ~columns["vaccine_waned"]).sum())
+        counters.masked += int(columns["masked"].sum())
+        return counters
+
+    def add_to_rasters(self, rasters):
+        rows = np.flatnonzero(self.aggregated)
+        rasters.people[self.home_x[rows], self.home_y[rows]] += self.size[rows]
+        rasters.masked[self.home_x[rows], self.home_y[rows]] += self.masked[rows].sum(axis=1)
+
+    def stats(self):
+        return {"aggregated_households": int(self.aggregated.sum()), "aggregated_people": self.people,
+                "promotions": self.promotions, "demotions": self.demotions}
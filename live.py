@@ -0,0 +1,212 @@
+"""Live server: steps InfectionModel in a background thread at full speed and streams it to browsers.
+
+    python live.py --width 300 --height 300 --engine vectorized --seed 7 --fps 4
+    python live.py --config scenario.json --snapshot-every 2 --port 8522
+
+server.py's ModularServer only advances the model when a browser asks for the next
+step. Here the model runs on its own thread, and every 1/fps seconds each connected
+browser gets the DataCollector rows it has not seen yet, plus the latest grid
+snapshot (heatmap.heatmap_pixels) if a newer one exists. A browser that joins
+mid-run is sent the whole buffered history first. Any number of browsers can watch
+the same run, and closing them all does not stop it.
+"""
+import argparse
+import base64
+import concurrent.futures
+import json
+import os
+import threading
+import time
+
+import tornado.ioloop
+import tornado.web
+import tornado.websocket
+
+try:
+    from .model import InfectionModel
+    from .headless import add_model_arguments, model_params
+    from .heatmap import heatmap_pixels
+except ImportError:
+    from model import InfectionModel
+    from headless import add_model_arguments, model_params
+    from heatmap import heatmap_pixels
+
+
+class BackgroundRun:
+    """One InfectionModel stepped by a daemon thread, and the buffers that clients read.
+
+    `rows` holds one [day, *reporters] list per DataCollector row and only grows while a
+    run lasts. `snapshot` is replaced whole each time. Readers never touch the model.
+    start(), pause(), resume() and restart() may be called from any thread.
+    """
+
+    def __init__(self, params, snapshot_every=1.0, max_bins=100):
+        if snapshot_every <= 0:
+            raise ValueError(f"snapshot_every must be positive, got {snapshot_every}")
+        self.params, self.snapshot_every, self.max_bins = params, snapshot_every, max_bins
+        self.run_id = 0 # Bumped by start(); clients start over when it changes
+        self.columns, self.rows, self.snapshot = [], [], None
+        self.finished = False
+        self._lock = threading.Lock() # Swaps run_id, columns, rows and snapshot together
+        self._go = threading.Event() # Set while running, cleared while paused
+        self._stop = None
+        self._thread = None
+
+    @property
+    def status(self):
+        return "finished" if self.finished else "running" if self._go.is_set() else "paused"
+
+    def start(self, paused=False):
+        """Builds a fresh model from params and starts stepping it (or waits for resume())."""
+        model = InfectionModel(**self.params)
+        with self._lock:
+            self.run_id += 1
+            self.columns = ["Day"] + list(model.datacollector.model_vars)
+            self.rows, self.snapshot, self.finished = [], None, False
+        self.collect(model); self.take_snapshot(model)
+        if paused: self._go.clear()
+        else: self._go.set()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, args=(model, self._stop), name="live-model", daemon=True)
+        self._thread.start()
+
+    def pause(self):
+        self._go.clear()
+
+    def resume(self):
+        self._go.set()
+
+    def stop(self):
+        """Stops the stepping thread and waits for it; the buffers stay readable."""
+        if self._thread is None: return
+        self._stop.set(); self._go.set()
+        self._thread.join(); self._thread = None
+
+    def restart(self, paused=False):
+        self.stop(); self.start(paused)
+
+    def _loop(self, model, stop):
+        next_snapshot = time.perf_counter() + self.snapshot_every
+        try:
+            while model.running and not stop.is_set():
+                if not self._go.wait(0.25): continue
+                if stop.is_set(): break
+                model.step()
+                self.collect(model)
+                if time.perf_counter() >= next_snapshot:
+                    self.take_snapshot(model); next_snapshot = time.perf_counter() + self.snapshot_every
+            if not stop.is_set():
+                self.take_snapshot(model) # The final state, whenever the last periodic snapshot was
+                self.finished = True
+        finally:
+            if self.params.get("engine") == "tiled": model.engine.close()
+
+    def collect(self, model):
+        """Appends the DataCollector rows not buffered yet; a row's day is its index in the collector."""
+        model_vars = model.datacollector.model_vars
+        names = self.columns[1:]
+        new_rows = [[day] + [model_vars[name][day] for name in names] for day in range(len(self.rows), len(model_vars[names[0]]))]
+        with self._lock:
+            self.rows.extend(new_rows)
+
+    def take_snapshot(self, model):
+        width, height, pixels = heatmap_pixels(model, self.max_bins)
+        self.snapshot = {"day": model.day, "width": width, "height": height,
+                         "pixels": base64.b64encode(pixels.tobytes()).decode("ascii")}
+
+    def view(self):
+        """(run_id, columns, rows, snapshot) of the current run, read consistently."""
+        with self._lock:
+            return self.run_id, self.columns, self.rows, self.snapshot
+
+
+class LiveSocket(tornado.websocket.WebSocketHandler):
+    """One watching browser; remembers how much of the run it has been sent."""
+
+    def initialize(self, live):
+        self.live = live
+        self.run_id, self.sent_rows, self.sent_snapshot, self.sent_status = None, 0, None, None
+
+    def open(self):
+        self.live.clients.add(self)
+        self.live.push(self) # History right away rather than at the next frame
+
+    def on_close(self):
+        self.live.clients.discard(self)
+
+    async def on_message(self, message):
+        command = json.loads(message).get("type")
+        if command == "pause": self.live.run.pause()
+        elif command == "resume": self.live.run.resume()
+        elif command == "restart": # Joining the old thread and building the model would stall every client's frames
+            await tornado.ioloop.IOLoop.current().run_in_executor(self.live.restarts, self.live.run.restart)
+        else: return
+        self.live.broadcast()
+
+
+class PageHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.set_header("Content-Type", "text/html; charset=UTF-8")
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "live.html"), "rb") as f:
+            self.write(f.read())
+
+
+class LiveServer:
+    """Serves live.html and pushes updates to every connected client at `fps` frames per second."""
+
+    def __init__(self, run, fps=4.0):
+        if fps <= 0:
+            raise ValueError(f"fps must be positive, got {fps}")
+        self.run, self.fps = run, fps
+        self.clients = set()
+        self.restarts = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="live-restart") # One at a time
+        self.app = tornado.web.Application([(r"/", PageHandler), (r"/ws", LiveSocket, {"live": self})])
+        self._timer = tornado.ioloop.PeriodicCallback(self.broadcast, 1000 / fps)
+
+    def listen(self, port):
+        self.app.listen(port)
+        self._timer.start()
+
+    def broadcast(self):
+        for client in list(self.clients):
+            self.push(client)
+
+    def push(self, client):
+        """Sends the client what it has not seen: new rows, a newer snapshot or a status change."""
+        run_id, columns, rows, snapshot = self.run.view()
+        status = self.run.status
+        message = {"type": "update", "run": run_id, "status": status}
+        if client.run_id != run_id: # First message, or the run was restarted: start the client over
+            client.run_id, client.sent_rows, client.sent_snapshot = run_id, 0, None
+            message["columns"] = columns
+        new_rows = rows[client.sent_rows:]
+        if new_rows: message["rows"] = new_rows
+        if snapshot is not None and snapshot is not client.sent_snapshot: message["snapshot"] = snapshot
+        if len(message) == 3 and status == client.sent_status: return # Nothing new
+        try:
+            client.write_message(json.dumps(message, default=lambda value: value.item())) # numpy scalars
+        except tornado.websocket.WebSocketClosedError:
+            self.clients.discard(client)
+            return
+        client.sent_rows += len(new_rows); client.sent_snapshot = snapshot; client.sent_status = status
+
+
+def main(argv=None):
+    parser = add_model_arguments(argparse.ArgumentParser(description="Run InfectionModel in the background and stream it to browsers."))
+    parser.add_argument("--port", type=int, default=8522)
+    parser.add_argument("--fps", type=float, default=4.0, help="updates pushed to each browser per second")
+    parser.add_argument("--snapshot-every", type=float, default=1.0, help="seconds between grid snapshots")
+    parser.add_argument("--max-bins", type=int, default=100, help="heatmap resolution cap per side")
+    parser.add_argument("--paused", action="store_true", help="build the model but wait for Resume in a browser")
+    args = parser.parse_args(argv)
+    if args.fps <= 0 or args.snapshot_every <= 0:
+        parser.error("--fps and --snapshot-every must be positive")
+    run = BackgroundRun(model_params(args, parser), args.snapshot_every, args.max_bins)
+    run.start(args.paused)
+    LiveServer(run, args.fps).listen(args.port)
+    print(f"Interface starting at http://127.0.0.1:{args.port}")
+    tornado.ioloop.IOLoop.current().start()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+import numpy as np
+
+
+class LocationLayer:
+    """Static home and workplace layout of the grid, kept off the agent grid.
+
+    home_id[x, y] is the household index of the home in that cell (-1 if none) and
+    workplace[x, y] flags workplace cells. Homes and workplaces never move, so they
+    are plain arrays rather than marker agents that every neighbor query and
+    render pass would have to skip.
+    """
+
+    def __init__(self, width, height):
+        self.width, self.height = width, height
+        self.home_id = np.full((width, height), -1, dtype=np.int32)
+        self.workplace = np.zeros((width, height), dtype=bool)
+        self.num_homes = 0
+
+    def is_home(self, pos):
+        return self.home_id[pos] >= 0
+
+    def is_workplace(self, pos):
+        return bool(self.workplace[pos])
+
+    def add_home(self, pos):
+        """Registers a home at pos and returns its household index."""
+        self.home_id[pos] = self.num_homes
+        self.num_homes += 1
+        return self.num_homes - 1
+
+    def add_homes(self, xs, ys):
+        """Bulk version of add_home for coordinate arrays."""
+        self.home_id[xs, ys] = np.arange(self.num_homes, self.num_homes + len(xs))
+        self.num_homes += len(xs)
+
+    def add_workplace(self, pos):
+        self.workplace[pos] = True
+
+    def add_workplaces(self, xs, ys):
+        self.workplace[xs, ys] = True
+
+    def home_cells(self):
+        return list(zip(*(c.tolist() for c in np.nonzero(self.home_id >= 0))))
+
+    def workplace_cells(self):
+        return list(zip(*(c.tolist() for c in np.nonzero(self.workplace))))
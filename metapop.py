@@ -0,0 +1,221 @@
+"""Metapopulation runs: several InfectionModels (cities), one worker process each, exchanging travelers daily.
+
+    python metapop.py cities.json --out metapop.csv
+
+    cities.json: {"cities": {"north": {"width": 80, "height": 80}, "south": {"density": 0.5}},
+                  "mobility": [[0, 0.002], [0.001, 0]], "seed": 7}
+
+mobility[i][j] is the daily probability that a living person of city i moves to city j.
+At each day boundary every city draws its leavers and sends them as one structured
+array (model.TRAVELER) per destination. The receiving city settles them at random
+homes, with their disease state, vaccination and immunity timers intact, and then
+steps. A day is two round trips to the workers (departures, then arrivals plus the
+step), and each waits for every city. All cities are therefore always on the same
+day, and they step in parallel.
+"""
+import argparse
+import contextlib
+import csv
+import io
+import json
+import multiprocessing
+import time
+import traceback
+import weakref
+
+import numpy as np
+
+try:
+    from .model import InfectionModel
+    from .cache import run_summary
+    from .tiles import _shutdown
+except ImportError:
+    from model import InfectionModel
+    from cache import run_summary
+    from tiles import _shutdown
+
+
+class City:
+    """One city's InfectionModel and its travel stream; the methods are the day protocol Metapopulation drives."""
+
+    def __init__(self, params, seed):
+        if params.get("engine") == "tiled":
+            raise ValueError("Cities cannot use engine='tiled'; each city already runs in its own process.")
+        self.rng = np.random.default_rng(seed) # Travel draws only: with no travel, a city runs exactly as it would alone
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.model = InfectionModel(**params)
+        self.model.finish_on_stop = False # Metapopulation.run calls finish() once, after the last day
+
+    def living(self):
+        m = self.model
+        return len(m.engine) if m.engine is not None else len(m.schedule.agents)
+
+    def depart(self, rates):
+        """Draws today's travelers; returns {destination index: TRAVELER rows}."""
+        counts = self.rng.multinomial(self.living(), np.append(rates, max(0.0, 1 - rates.sum())))[:-1]
+        if not counts.any(): return {}
+        rows = self.model.take_travelers(int(counts.sum()), self.rng)
+        bounds = np.cumsum(counts)
+        return {int(j): rows[bounds[j] - counts[j]:bounds[j]] for j in np.flatnonzero(counts)}
+
+    def arrive(self, batches):
+        if batches: self.model.add_travelers(np.concatenate(batches), self.rng)
+
+    def step(self, arrivals=()):
+        """Settles the arrivals, then advances one day; returns whether the city's model would still be running on its own."""
+        self.arrive(arrivals)
+        m = self.model
+        if m.day >= m.max_days: return False
+        m.running = True # A city that went quiet keeps pace with the rest, since travelers may bring infection back
+        with contextlib.redirect_stdout(io.StringIO()):
+            m.step()
+        return m.running
+
+    def finish(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.model.finish()
+
+    def results(self):
+        series = {name: np.asarray(values, dtype=float) for name, values in self.model.datacollector.model_vars.items()}
+        return series, run_summary(self.model)
+
+
+def _serve_city(conn, params, seed):
+    """Worker process: builds a City and answers (method, args) requests until told to stop."""
+    try:
+        city = City(params, seed)
+    except Exception:
+        conn.send((False, traceback.format_exc()))
+        return
+    conn.send((True, None))
+    while True:
+        method, call_args = conn.recv()
+        if method is None: break
+        try:
+            conn.send((True, getattr(city, method)(*call_args)))
+        except Exception:
+            conn.send((False, traceback.format_exc()))
+
+
+class Metapopulation:
+    """Cities stepped in lockstep, with travelers exchanged on a mobility matrix at every day boundary.
+
+    cities maps names to InfectionModel keyword arguments (a list gets names city0, city1, ...).
+    A city without a seed gets seed + its index, and a log_path only if given one. With
+    parallel=False the cities run in this process, one after another (same results).
+    """
+
+    def __init__(self, cities, mobility, seed=0, parallel=True):
+        if not isinstance(cities, dict): cities = {f"city{i}": params for i, params in enumerate(cities)}
+        self.names = list(cities)
+        n = len(self.names)
+        self.mobility = np.array(mobility, dtype=float)
+        if self.mobility.shape != (n, n):
+            raise ValueError(f"mobility must be a {n}x{n} matrix for {n} cities, got shape {self.mobility.shape}")
+        np.fill_diagonal(self.mobility, 0.0)
+        if (self.mobility < 0).any() or (self.mobility.sum(axis=1) > 1).any():
+            raise ValueError("mobility entries must be non-negative daily probabilities, each row summing to at most 1")
+        params = [{"log_path": None, "seed": seed + i, **cities[name]} for i, name in enumerate(self.names)]
+        seeds = np.random.SeedSequence(seed).spawn(n)
+        self.day = 0
+        self.running = [True] * n
+        self.travelers = np.zeros((n, n), dtype=np.int64) # Cumulative moves, origin by destination
+        self.step_seconds = self.exchange_seconds = 0.0
+        if not parallel:
+            self.cities, self.connections = [City(p, s) for p, s in zip(params, seeds)], None
+            return
+        self.cities = None
+        context = multiprocessing.get_context()
+        self.connections, self.processes = [], []
+        for p, s in zip(params, seeds):
+            conn, child = context.Pipe()
+            process = context.Process(target=_serve_city, args=(child, p, s), daemon=True)
+            process.start(); child.close()
+            self.connections.append(conn); self.processes.append(process)
+        self._finalizer = weakref.finalize(self, _shutdown, self.connections, self.processes)
+        self.gather() # Construction errors surface here
+
+    def close(self):
+        """Stops the worker processes (also done when the Metapopulation is garbage collected)."""
+        if self.connections is not None: self._finalizer()
+
+    def call(self, requests):
+        """Sends one (method, args) request to each city and waits for all of them: the day barrier."""
+        if self.cities is not None:
+            return [getattr(city, method)(*args) for city, (method, args) in zip(self.cities, requests)]
+        for conn, request in zip(self.connections, requests):
+            conn.send(request)
+        return self.gather()
+
+    def gather(self):
+        replies = []
+        for name, conn in zip(self.names, self.connections):
+            ok, reply = conn.recv()
+            if not ok:
+                raise RuntimeError(f"City {name!r} failed:\n{reply}")
+            replies.append(reply)
+        return replies
+
+    def call_all(self, method, *args):
+        return self.call([(method, args)] * len(self.names))
+
+    def step(self):
+        start = time.perf_counter()
+        departures = self.call([("depart", (rates,)) for rates in self.mobility])
+        for i, leaving in enumerate(departures):
+            for j, rows in leaving.items(): self.travelers[i, j] += len(rows)
+        middle = time.perf_counter()
+        self.running = self.call([("step", ([leaving[j] for leaving in departures if j in leaving],)) for j in range(len(self.names))])
+        self.day += 1
+        self.exchange_seconds += middle - start; self.step_seconds += time.perf_counter() - middle
+
+    def run(self, days=None):
+        """Steps until no city would keep running on its own (or for `days` days), finishes the cities; returns results()."""
+        while any(self.running) and (days is None or self.day < days):
+            self.step()
+        self.call_all("finish") # Logs, recordings and result caches are closed once, not on every quiet day
+        return self.results()
+
+    def results(self):
+        """{"cities": {name: (series, summary)}, "travelers": origin x destination counts, timings}."""
+        return {"cities": dict(zip(self.names, self.call_all("results"))), "travelers": self.travelers.tolist(),
+                "days": self.day, "step_seconds": round(self.step_seconds, 4), "exchange_seconds": round(self.exchange_seconds, 4)}
+
+
+def write_results(path, results):
+    """One row per city and day: the city name, the day, then its reporters."""
+    cities = results["cities"]
+    names = list(next(iter(cities.values()))[0])
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["city", "Day"] + names)
+        for city, (series, _) in cities.items():
+            for day in range(len(series[names[0]])):
+                writer.writerow([city, day] + [series[name][day] for name in names])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run coupled InfectionModel cities in parallel worker processes.")
+    parser.add_argument("config", help='JSON file: {"cities": {name: params}, "mobility": [[...]], "seed": 0}')
+    parser.add_argument("--days", type=int, help="stop after this many days even if cities are still running")
+    parser.add_argument("--out", default="metapop_results.csv", help="per-city daily reporters; 'none' disables it")
+    parser.add_argument("--serial", action="store_true", help="run the cities one after another in this process")
+    args = parser.parse_args(argv)
+    with open(args.config) as f:
+        config = json.load(f)
+    meta = Metapopulation(config["cities"], config["mobility"], config.get("seed", 0), parallel=not args.serial)
+    try:
+        results = meta.run(args.days)
+    finally:
+        meta.close()
+    if args.out.lower() != "none": write_results(args.out, results)
+    for name, (_, summary) in results["cities"].items():
+        final = summary["final"]
+        print(f"{name}: {final['Total']} people, {final['Infected']} infected, {final['Dead']} dead")
+    print(f"{results['days']} days, {int(np.sum(results['travelers']))} travelers, "
+          f"{results['step_seconds']:.2f} s stepping, {results['exchange_seconds']:.2f} s exchanging")
+    return results
+
+
+if __name__ == "__main__":
+    main()
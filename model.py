@@ -2,13 +2,65 @@ from mesa import Model
 from mesa.space import MultiGrid
 from mesa.time import RandomActivation
 from mesa.datacollection import DataCollector
-import csv
+import inspect
+import os
 import random
+import time
+import tracemalloc
+
+import numpy as np
 
 try:
-    from .agent import PersonAgent, WorkplaceMarkerAgent, HomeMarkerAgent # StatusDisplayAgent removed
+    from .agent import PersonAgent
+    from .vectorized import VectorizedEngine
+    from .tiles import TiledEngine
+    from .counters import PopulationCounters, ScannedRow
+    from .rasters import OccupancyRasters, cell_layers
+    from .neighbors import NeighborLookup
+    from .locations import LocationLayer
+    from .archive import DeadArchive
+    from .scheduling import ActiveSetActivation
+    from .population import build_population
+    from .sinks import REPORTERS, open_sink
+    from .vaccination import EligibilityPool
+    from .tables import DiseaseTables
+    from .codes import SUSCEPTIBLE, INFECTED, ESSENTIAL, ISOLATED
+    from .routes import RouteCache
+    from .checkpoint import Checkpoint
+    from .profiling import PHASES, PhaseProfiler, ProfiledPersonAgent
+    from .recorder import DayRecorder
+    from .households import HouseholdCompartments
 except ImportError:
-    from agent import PersonAgent, WorkplaceMarkerAgent, HomeMarkerAgent
+    from agent import PersonAgent
+    from vectorized import VectorizedEngine
+    from tiles import TiledEngine
+    from counters import PopulationCounters, ScannedRow
+    from rasters import OccupancyRasters, cell_layers
+    from neighbors import NeighborLookup
+    from locations import LocationLayer
+    from archive import DeadArchive
+    from scheduling import ActiveSetActivation
+    from population import build_population
+    from sinks import REPORTERS, open_sink
+    from vaccination import EligibilityPool
+    from tables import DiseaseTables
+    from codes import SUSCEPTIBLE, INFECTED, ESSENTIAL, ISOLATED
+    from routes import RouteCache
+    from checkpoint import Checkpoint
+    from profiling import PHASES, PhaseProfiler, ProfiledPersonAgent
+    from recorder import DayRecorder
+    from households import HouseholdCompartments
+
+# Constructor parameters that shape the grid, population or engine built in __init__; a running
+# model (or a fork of one) cannot change them.
+STRUCTURAL_PARAMS = {"width", "height", "density", "engine", "scheduler", "active_set_full_activation", "workers", "profile", "record_path", "hybrid"}
+
+# Per-person state carried by a traveler between models (metapop.py): everything but ids and positions.
+TRAVEL_FIELDS = ("age", "state", "days_infected", "masked", "asymptomatic", "vaccinated", "vaccine_waned",
+                 "days_since_vaccination", "days_since_recovery", "essential", "base_propensity_to_mask_normal",
+                 "base_propensity_to_mask_lockdown", "prop_voluntary_isolation_if_risk_high",
+                 "base_compliance_propensity", "base_willingness_to_vaccinate")
+TRAVELER = np.dtype([(name, VectorizedEngine.FIELDS[name]) for name in TRAVEL_FIELDS])
 
 
 class InfectionModel(Model):
@@ -36,18 +88,39 @@ class InfectionModel(Model):
                  avg_prop_voluntary_isolation=0.25, # Avg propensity of essential workers to isolate if risk is high
                  voluntary_isolation_risk_threshold=0.5, # Perceived local risk to consider voluntary isolation
                  avg_lockdown_compliance=0.9, # Average propensity to comply with lockdown
-                 avg_vaccine_willingness=0.7 # Average base willingness to vaccinate
+                 avg_vaccine_willingness=0.7, # Average base willingness to vaccinate
+                 engine="object", # "object" (PersonAgent per person), "vectorized" (NumPy arrays, for large grids) or "tiled" (vectorized, split across processes)
+                 debug_counters=False, # Cross-check the incremental population counters against a full scan every day
+                 scheduler="random", # "random" (RandomActivation) or "active" (step only agents whose step can matter)
+                 active_set_full_activation=False, # With scheduler="active": still step everyone, for validation
+                 seed=None, # Picked up by mesa.Model.__new__ to seed self.random
+                 log_path="simulation_log.csv", # Per-day log file; None disables file output (parallel sweeps give each run its own)
+                 log_format="csv", # "csv" (buffered), "npz" (columnar, written at run end) or "memory" (model.log.columns())
+                 log_flush_every=30, # CSV rows buffered between writes
+                 vaccination_priority="random", # "random" or "oldest_first" (age tiers, oldest vaccinated first)
+                 workers=None, # engine="tiled": worker processes, one vertical strip of the grid each (default: CPU count)
+                 profile=False, # Time each phase of step() into self.profiler (see profiling.py); off costs nothing
+                 record_path=None, # Directory to record every agent's position, state and flags each day (recorder.py)
+                 hybrid=False # Object engine: isolated low-risk households run as compartments until touched (households.py)
                  ):
 
         super().__init__()
         self.width = width; self.height = height
         self.grid = MultiGrid(self.width, self.height, torus=True)
-        self.schedule = RandomActivation(self)
+        if scheduler not in ("random", "active"):
+            raise ValueError(f"Unknown scheduler {scheduler!r}; expected 'random' or 'active'.")
+        if scheduler == "active" and engine in ("vectorized", "tiled"):
+            raise ValueError(f"scheduler='active' applies to the object engine; the {engine} engine steps arrays in bulk.")
+        if hybrid and (engine != "object" or scheduler != "random"):
+            raise ValueError("hybrid=True needs engine='object' and scheduler='random' (households.py swaps PersonAgents in and out of the schedule).")
+        self.active_scheduling = scheduler == "active"
+        if self.active_scheduling: self.schedule = ActiveSetActivation(self, full_activation=active_set_full_activation)
+        else: self.schedule = RandomActivation(self)
         
         self.person_agent_next_id = 0
-        self.workplace_marker_next_id = -1 
-        self.home_marker_next_id = -10000 
+        self.locations = LocationLayer(self.width, self.height) # Homes and workplaces; the grid holds people only
         self.cumulative_deaths = 0 
+        self.dead_archive = DeadArchive() # Dead agents are retired here instead of staying scheduled
 
         self.infection_rate = infection_rate
         # self.masking_rate = masking_rate # Replaced by dynamic agent masking
@@ -88,159 +161,397 @@ class InfectionModel(Model):
         self.avg_vaccine_willingness = avg_vaccine_willingness
 
 
+        self.tables = DiseaseTables(self) # Transmission/mortality lookups; refreshed daily, rebuilt only on parameter changes
+
+        if engine not in ("object", "vectorized", "tiled"):
+            raise ValueError(f"Unknown engine {engine!r}; expected 'object', 'vectorized' or 'tiled'.")
+        self.engine_mode = engine
+        self.engine = None
+        self.counters = PopulationCounters()
+        self.debug_counters = debug_counters
+        self.vaccination_priority = vaccination_priority
+        self.vaccine_pool = EligibilityPool(self.random, vaccination_priority) # Unvaccinated susceptibles, kept by PersonAgent's setters
+
+        self.profiler = PhaseProfiler() if profile else None
+        self.agent_class = ProfiledPersonAgent if profile else PersonAgent
         self.max_days = max_days
         self.day = 0
         self.running = True
 
-        self.csv_filename = "simulation_log.csv" 
-        with open(self.csv_filename, "w", newline="") as f:
-            writer = csv.writer(f)
-            writer.writerow(["Day", "Susceptible", "Infected", "Recovered", "Dead",
-                             "Vaccinated (Any)", "Vaccine Effective", "Asymptomatic", "LockdownActive", "AvgMasked"])
-
-        # Workplace and Household Generation (same as before)
-        self.workplaces = [] 
-        attempts = 0
-        actual_num_workplaces = min(self.num_workplaces, self.width * self.height)
-        if actual_num_workplaces > 0:
-            while len(self.workplaces) < actual_num_workplaces and attempts < self.width * self.height * 2:
-                x_work, y_work = self.random.randrange(self.width), self.random.randrange(self.height)
-                if (x_work, y_work) not in self.workplaces: self.workplaces.append((x_work, y_work))
-                attempts += 1
-        if not self.workplaces and actual_num_workplaces > 0:
-            self.workplaces.append((self.random.randrange(self.width), self.random.randrange(self.height)))
-        for i, wp_pos in enumerate(self.workplaces):
-            marker = WorkplaceMarkerAgent(self.workplace_marker_next_id - i, self)
-            self.grid.place_agent(marker, wp_pos)
-
-        self.home_locations = [] 
-        total_cells = self.width * self.height
-        num_person_agents_to_create = int(total_cells * density)
-        person_agents_created_count = 0
-        all_possible_cells = [(x,y) for x in range(self.width) for y in range(self.height)]
-        self.random.shuffle(all_possible_cells)
-        home_cell_candidate_index = 0
-        while person_agents_created_count < num_person_agents_to_create and home_cell_candidate_index < len(all_possible_cells):
-            current_home_pos = all_possible_cells[home_cell_candidate_index]; home_cell_candidate_index += 1
-            if current_home_pos not in self.home_locations: self.home_locations.append(current_home_pos)
-            else: continue 
-            household_size = self.random.randint(2, 6)
-            if person_agents_created_count + household_size > num_person_agents_to_create:
-                household_size = num_person_agents_to_create - person_agents_created_count
-            if household_size <= 0: break
-            for _ in range(household_size):
-                if person_agents_created_count >= num_person_agents_to_create: break 
-                agent = PersonAgent(self.person_agent_next_id, self); self.person_agent_next_id += 1
-                agent.home_pos = current_home_pos; agent.assign_work_location() 
-                if self.random.random() < 0.02:
-                     agent.state = "Infected"; agent.asymptomatic = self.random.random() < self.asymptomatic_rate
-                # agent.masked is now decided in agent.step()
-                self.grid.place_agent(agent, current_home_pos); self.schedule.add(agent)
-                person_agents_created_count += 1
-        if person_agents_created_count == 0 and num_person_agents_to_create > 0:
+        self.log_format, self.log_flush_every = log_format, log_flush_every
+        self.log = open_sink(log_format, log_path, log_flush_every) # See sinks.py; None when there is nothing to write
+
+        # Workplaces, households and per-person traits are drawn in vectorized batches (population.py),
+        # then either materialized as PersonAgents or handed to the array engine as-is.
+        construction_start = time.perf_counter()
+        self.np_random = np.random.default_rng(self.random.getrandbits(64)) # Batched draws, seeded from self.random
+        population = build_population(self, density, self.np_random)
+        if len(population.home_x) == 0 and density > 0:
             print(f"Warning: Could not create any PersonAgents. Check density ({density}).")
-        for i, home_pos_coord in enumerate(self.home_locations):
-            home_marker = HomeMarkerAgent(self.home_marker_next_id - i, self)
-            self.grid.place_agent(home_marker, home_pos_coord)
-        
-        self.datacollector = DataCollector(
-            model_reporters={
-                "Susceptible": lambda m: m.count_state("Susceptible"),
-                "Infected": lambda m: m.count_state("Infected"),
-                "Recovered": lambda m: m.count_state("Recovered"),
-                "Dead": lambda m: m.count_state("Dead"), 
-                "Vaccinated (Any)": lambda m: m.count_vaccinated(),
-                "Vaccine Effective": lambda m: m.count_vaccine_effective(),
-                "Asymptomatic": lambda m: self.count_asymptomatic(),
-                "LockdownActive": lambda m: 1 if m.lockdown_active else 0,
-                "AvgMasked": lambda m: m.count_masked_person_agents() / (sum(1 for _ in m.schedule.agents if isinstance(_, PersonAgent)) or 1) # Avg masked
-            }
-        )
+        self.register_locations(population)
+        self.households = None # HouseholdCompartments in hybrid mode
+        if self.engine_mode != "object":
+            # Agents live in VectorizedEngine arrays (in worker processes for "tiled"); the grid stays empty.
+            if self.engine_mode == "tiled": self.engine = TiledEngine(self, population, workers or os.cpu_count() or 1)
+            else: self.engine = VectorizedEngine(self, population)
+            self.counters = self.engine.tally()
+            self.rasters = self.engine.rasters
+            self.neighbors = None # The engine works on rasters only, no per-agent neighbor lists
+            self.routes = None # Moves are one batched step toward each target (routes.torus_direction)
+        else:
+            self.rasters = OccupancyRasters(self.width, self.height, self.risk_perception_radius)
+            self.neighbors = NeighborLookup(self.grid) # Transmission neighborhoods, counted for the profiler
+            self.routes = RouteCache(self.width, self.height) # Commute paths shared by everyone making the same trip
+            if hybrid:
+                self.households = HouseholdCompartments(self, population)
+                population = self.households.aggregate_population(population) # The people left to be agents
+            self.materialize_agents(population)
+        self.construction_seconds = time.perf_counter() - construction_start
+        self.verify_counters()
+
+        self.datacollector = self.make_datacollector()
         self.datacollector.collect(self)
+        self.recorder = DayRecorder(record_path, self) if record_path is not None else None
+        if self.recorder is not None: self.recorder.record(self)
+        self.result_cache = None # cache.PendingEntry set by ResultCache.open(); files the run there when it stops
+        self.finish_on_stop = True # False in metapop.py cities, which keep stepping after they stop and call finish() once
+
+    def make_datacollector(self):
+        """The model reporters; rebuilt on restore, since their lambdas cannot be pickled."""
+        reporters = {
+            "Susceptible": lambda m: m.count_state("Susceptible"),
+            "Infected": lambda m: m.count_state("Infected"),
+            "Recovered": lambda m: m.count_state("Recovered"),
+            "Dead": lambda m: m.count_state("Dead"), 
+            "Vaccinated (Any)": lambda m: m.count_vaccinated(),
+            "Vaccine Effective": lambda m: m.count_vaccine_effective(),
+            "Asymptomatic": lambda m: m.count_asymptomatic(),
+            "LockdownActive": lambda m: 1 if m.lockdown_active else 0,
+            "AvgMasked": lambda m: m.count_masked_person_agents() / (m.count_person_agents() or 1) # Avg masked
+        }
+        if self.profiler is not None: # Cumulative; today's data collection and log I/O land in tomorrow's row
+            reporters.update({f"Time {phase} (s)": (lambda m, phase=phase: m.profiler.seconds[phase]) for phase in PHASES})
+            reporters["Neighbor Queries"] = lambda m: m.profiler.neighbor_queries
+            reporters["Cells Scanned"] = lambda m: m.profiler.cells_scanned
+        if self.households is not None:
+            reporters.update({"Aggregated Households": lambda m: int(m.households.aggregated.sum()),
+                              "Aggregated People": lambda m: m.households.people,
+                              "Promotions": lambda m: m.households.promotions, "Demotions": lambda m: m.households.demotions})
+        return DataCollector(model_reporters=reporters)
+
+    def register_locations(self, population):
+        self.workplaces = list(zip(population.workplace_x.tolist(), population.workplace_y.tolist()))
+        self.locations.add_workplaces(population.workplace_x, population.workplace_y)
+        self.home_locations = list(zip(population.household_x.tolist(), population.household_y.tolist()))
+        self.locations.add_homes(population.household_x, population.household_y)
+
+    def materialize_agents(self, population):
+        """Creates one PersonAgent per row of the bulk-generated population and places it at home."""
+        traits = population.traits
+        rows = zip(population.home_x.tolist(), population.home_y.tolist(), traits["work_x"].tolist(), traits["work_y"].tolist(),
+                   traits["age"].tolist(), traits["essential"].tolist(),
+                   traits["base_propensity_to_mask_normal"].tolist(), traits["base_propensity_to_mask_lockdown"].tolist(),
+                   traits["prop_voluntary_isolation_if_risk_high"].tolist(), traits["base_compliance_propensity"].tolist(),
+                   traits["base_willingness_to_vaccinate"].tolist(),
+                   population.infected.tolist(), population.asymptomatic.tolist())
+        positions = {pos: pos for pos in self.workplaces} # Household members and coworkers share one position tuple
+        for home_x, home_y, work_x, work_y, age, essential, mask_normal, mask_lockdown, isolation, compliance, willingness, infected, asymptomatic in rows:
+            agent = self.agent_class(self.person_agent_next_id, self, traits={
+                "age": age, "mobility": ESSENTIAL if essential else ISOLATED,
+                "base_propensity_to_mask_normal": mask_normal, "base_propensity_to_mask_lockdown": mask_lockdown,
+                "prop_voluntary_isolation_if_risk_high": isolation, "base_compliance_propensity": compliance,
+                "base_willingness_to_vaccinate": willingness,
+            })
+            self.person_agent_next_id += 1
+            agent.home_pos = positions.setdefault((home_x, home_y), (home_x, home_y))
+            agent.work_pos = positions[(work_x, work_y)] if work_x >= 0 else None
+            if infected:
+                agent.asymptomatic = asymptomatic; agent.set_state(INFECTED)
+            # agent.masked is now decided in agent.step()
+            self.grid.place_agent(agent, agent.home_pos); self.schedule.add(agent); self.rasters.add(agent)
+
+    def cell_counts(self):
+        """(width, height) counts of living people per cell and state (rasters.CELL_LAYERS), e.g. for heatmap.py."""
+        if self.engine is not None: return self.engine.cell_counts()
+        rows = [(agent.pos[0] * self.height + agent.pos[1], agent.state, agent.vaccinated) for agent in self.schedule.agents]
+        rows = np.array(rows, dtype=np.int64).reshape(-1, 3)
+        if self.households is not None: # Aggregated members count at their home cell
+            members = self.households.member_columns()
+            rows = np.concatenate([rows, np.stack([members["x"] * self.height + members["y"], members["state"], members["vaccinated"]], axis=1)])
+        return cell_layers(rows[:, 0], rows[:, 1], rows[:, 2].astype(bool), (self.width, self.height))
+
+    def agent_columns(self, names):
+        """One array per named VectorizedEngine field over the living agents, e.g. for recorder.py."""
+        if self.engine is not None: return self.engine.agent_columns(names)
+        agents = self.schedule.agents
+        getters = {"x": lambda agent: agent.pos[0], "y": lambda agent: agent.pos[1]}
+        columns = {name: np.fromiter(map(getters.get(name) or (lambda agent, name=name: getattr(agent, name)), agents),
+                                     dtype=VectorizedEngine.FIELDS[name], count=len(agents)) for name in names}
+        if self.households is None: return columns
+        members = self.households.member_columns() # Aggregated members keep their ids while off the schedule
+        empty = np.zeros(len(members["state"])) # Fields they have no slot for are infection-only (asymptomatic, days_infected)
+        return {name: np.concatenate([column, members.get(name, empty).astype(column.dtype)]) for name, column in columns.items()}
+
+    # Reporters read the incrementally maintained tallies (see counters.py) instead of scanning the schedule.
+    def count_person_agents(self):
+        return self.counters.total
 
     def count_masked_person_agents(self): # New helper
-        return sum(1 for agent in self.schedule.agents if isinstance(agent, PersonAgent) and agent.masked)
+        return self.counters.masked
 
     def count_state(self, state_name):
-        return sum(1 for agent in self.schedule.agents if isinstance(agent, PersonAgent) and agent.state == state_name)
+        return self.counters.states[state_name]
     def count_vaccinated(self):
-        return sum(1 for agent in self.schedule.agents if isinstance(agent, PersonAgent) and agent.vaccinated)
+        return self.counters.vaccinated
     def count_vaccine_effective(self):
-        return sum(1 for agent in self.schedule.agents if isinstance(agent, PersonAgent) and agent.vaccinated and not agent.vaccine_waned)
+        return self.counters.vaccine_effective
     def count_asymptomatic(self):
-        return sum(1 for agent in self.schedule.agents if isinstance(agent, PersonAgent) and agent.state == "Infected" and agent.asymptomatic)
+        return self.counters.asymptomatic
+
+    def verify_counters(self):
+        """In debug_counters mode, checks the running tallies, occupancy rasters and vaccine pool against a full scan."""
+        if not self.debug_counters: return
+        if self.engine is not None: # self.counters is the engine's batched tally; recount its arrays and the dead row by row
+            expected = PopulationCounters.from_columns(self.agent_columns(ScannedRow._fields))
+            self.counters.verify(expected.merge(PopulationCounters.from_agents(self.dead_archive.records())), self.day)
+            return
+        people = [a for a in self.schedule.agents if isinstance(a, PersonAgent)]
+        expected = self.dead_archive.tally_into(PopulationCounters.from_agents(people))
+        if self.households is not None: self.households.tally_into(expected)
+        self.counters.verify(expected, self.day)
+        eligible = sum(1 for a in people if a.state == SUSCEPTIBLE and not a.vaccinated)
+        if eligible != len(self.vaccine_pool) or any(a not in self.vaccine_pool for a in people if a.state == SUSCEPTIBLE and not a.vaccinated):
+            raise RuntimeError(f"Day {self.day}: vaccine eligibility pool out of sync ({len(self.vaccine_pool)} members, {eligible} eligible)")
+        expected = OccupancyRasters(self.width, self.height, self.risk_perception_radius)
+        for agent in people:
+            if agent.pos is not None: expected.add(agent)
+        if self.households is not None: self.households.add_to_rasters(expected)
+        self.rasters.verify(expected, self.day)
+
+    def retire_agent(self, agent):
+        """Moves a dead PersonAgent out of the schedule and spatial index into self.dead_archive."""
+        self.dead_archive.add(agent, self.day)
+        self.rasters.remove(agent)
+        self.grid.remove_agent(agent)
+        self.schedule.remove(agent)
+
+    def wake_agent(self, agent):
+        """Tells the active-set scheduler that agent is about to change from outside its own step."""
+        if self.active_scheduling: self.schedule.wake(agent)
 
     def perform_daily_vaccination(self):
         if self.daily_vaccination_target_percentage <= 0: return
-        eligible_candidates = [
-            agent for agent in self.schedule.agents
-            if isinstance(agent, PersonAgent) and \
-               agent.state == "Susceptible" and not agent.vaccinated
-        ]
-        if not eligible_candidates: return
-        self.random.shuffle(eligible_candidates)
-        
-        num_person_agents = sum(1 for agent in self.schedule.agents if isinstance(agent, PersonAgent))
-        if num_person_agents == 0: return
-
-        num_to_target_today = int(num_person_agents * self.daily_vaccination_target_percentage)
-        actually_vaccinated_this_step = 0
-        for agent in eligible_candidates:
-            if actually_vaccinated_this_step >= num_to_target_today: break
-            if self.random.random() < agent.get_current_vaccine_willingness(): # Check willingness
-                agent.vaccinated = True; agent.vaccine_waned = False; agent.days_since_vaccination = 0
-                actually_vaccinated_this_step += 1
-        # if actually_vaccinated_this_step > 0:
-        #     print(f"Day {self.day}: Targeted {num_to_target_today}, newly vaccinated {actually_vaccinated_this_step} agents based on willingness.")
+        if self.engine is not None:
+            self.engine.perform_daily_vaccination(); self.counters = self.engine.tally()
+            return
+        num_to_target_today = int(self.count_person_agents() * self.daily_vaccination_target_percentage)
+        if self.households is not None: num_to_target_today -= self.households.vaccinate(num_to_target_today, len(self.vaccine_pool))
+        chosen = []
+        for agent in self.vaccine_pool.candidates(): # Random order (oldest tier first if prioritized), drawn lazily
+            if len(chosen) >= num_to_target_today: break
+            if self.random.random() < agent.get_current_vaccine_willingness(): chosen.append(agent) # Check willingness
+        for agent in chosen: # Vaccinating takes agents out of the pool, so only after the draw is done
+            self.wake_agent(agent); agent.set_vaccine(True, False); agent.days_since_vaccination = 0
 
 
     def introduce_migrants(self):
+        if self.engine is not None:
+            self.engine.introduce_migrants(self.num_migrants_per_event); self.counters = self.engine.tally()
+            return
         for _ in range(self.num_migrants_per_event):
-            migrant_agent = PersonAgent(self.person_agent_next_id, self); self.person_agent_next_id += 1
-            migrant_agent.state = "Infected"
-            migrant_agent.asymptomatic = self.random.random() < self.asymptomatic_rate; migrant_agent.days_infected = 0
+            migrant_agent = self.agent_class(self.person_agent_next_id, self); self.person_agent_next_id += 1
+            migrant_agent.infect()
             # Migrants might have different behavioral propensities or get default ones
-            migrant_agent.masked = self.random.random() < self.avg_mask_propensity_normal # Use avg as a proxy
-            migrant_agent.vaccinated = False
+            migrant_agent.set_masked(self.random.random() < self.avg_mask_propensity_normal) # Use avg as a proxy
             x, y = self.random.randrange(self.grid.width), self.random.randrange(self.grid.height)
-            migrant_agent.home_pos = (x,y); self.grid.place_agent(migrant_agent, (x,y))
+            if self.households is not None: self.households.arrive((x,y)) # Anyone living there becomes agents first
+            migrant_agent.home_pos = (x,y); self.grid.place_agent(migrant_agent, (x,y)); self.rasters.add(migrant_agent)
             migrant_agent.assign_work_location(); self.schedule.add(migrant_agent)
+            if self.households is not None: self.households.note_migrant(migrant_agent)
+
+    # --- Travel between models (see metapop.py); called between steps ---
+    def take_travelers(self, count, rng):
+        """Removes `count` living agents drawn uniformly at random (PersonAgents only in hybrid mode); returns their TRAVELER rows."""
+        if self.engine_mode == "tiled":
+            raise ValueError("Travel needs engine='object' or 'vectorized'; the tiled engine's agents live in its workers.")
+        rows = np.zeros(count, dtype=TRAVELER)
+        if self.engine is not None:
+            columns = self.engine.take_rows(rng.choice(len(self.engine), count, replace=False))
+            for name in TRAVEL_FIELDS:
+                rows[name] = columns[name]
+            self.counters = self.engine.tally()
+            return rows
+        agents = self.schedule.agents
+        for i, index in enumerate(rng.choice(len(agents), count, replace=False).tolist()):
+            agent = agents[index]
+            rows[i] = tuple(agent.mobility == ESSENTIAL if name == "essential" else getattr(agent, name) for name in TRAVEL_FIELDS)
+            self.counters.remove(agent); self.vaccine_pool.discard(agent); self.rasters.remove(agent)
+            self.grid.remove_agent(agent); self.schedule.remove(agent)
+        return rows
+
+    def add_travelers(self, rows, rng):
+        """Settles TRAVELER rows at random homes (working at a random workplace if essential), keeping their disease,
+        vaccine and immunity state; they get new unique ids."""
+        if self.engine_mode == "tiled":
+            raise ValueError("Travel needs engine='object' or 'vectorized'; the tiled engine's agents live in its workers.")
+        n = len(rows)
+        homes = np.array(self.home_locations, dtype=np.int64).reshape(-1, 2)
+        workplaces = np.array(self.workplaces, dtype=np.int64).reshape(-1, 2)
+        if len(homes): home = homes[rng.integers(0, len(homes), size=n)]
+        else: home = np.stack([rng.integers(0, self.width, size=n), rng.integers(0, self.height, size=n)], axis=1)
+        work = workplaces[rng.integers(0, len(workplaces), size=n)] if len(workplaces) else np.full((n, 2), -1)
+        essential = rows["essential"] & (work[:, 0] >= 0)
+        home_x, home_y = home[:, 0], home[:, 1]
+        work_x, work_y = np.where(essential, work[:, 0], -1), np.where(essential, work[:, 1], -1)
+        if self.engine is not None:
+            self.engine.add_agents(home_x, home_y, {**{name: rows[name] for name in TRAVEL_FIELDS},
+                                                    "essential": essential, "work_x": work_x, "work_y": work_y})
+            self.counters = self.engine.tally()
+            return
+        for row, x, y, wx, wy in zip(rows.tolist(), home_x.tolist(), home_y.tolist(), work_x.tolist(), work_y.tolist()):
+            row = dict(zip(TRAVEL_FIELDS, row))
+            agent = self.agent_class(self.person_agent_next_id, self, traits={**row, "mobility": ESSENTIAL if wx >= 0 else ISOLATED})
+            self.person_agent_next_id += 1
+            agent.home_pos, agent.work_pos = (x, y), (wx, wy) if wx >= 0 else None
+            agent.asymptomatic = row["asymptomatic"]; agent.days_infected = row["days_infected"]
+            if row["state"] != SUSCEPTIBLE: agent.set_state(row["state"])
+            if row["vaccinated"]: agent.set_vaccine(True, row["vaccine_waned"])
+            agent.days_since_vaccination, agent.days_since_recovery = row["days_since_vaccination"], row["days_since_recovery"]
+            agent.set_masked(row["masked"])
+            if self.households is not None: self.households.arrive((x, y))
+            self.grid.place_agent(agent, (x, y)); self.schedule.add(agent); self.rasters.add(agent)
+            if self.households is not None: self.households.note_migrant(agent)
+
+    def write_log(self):
+        """Logs today's row from the values the DataCollector just computed, so counts are taken once per day."""
+        if self.log is None: return
+        self.log.write([self.day] + [self.datacollector.model_vars[name][-1] for name in REPORTERS])
+
+    def finish(self):
+        """End-of-run work: closes the log and recording and files the run in its result cache."""
+        self.close_log()
+        if self.result_cache is not None: self.result_cache.store(self)
+
+    def close_log(self):
+        """Flushes buffered rows to the log file and indexes the recording; called automatically when the run stops."""
+        if self.log is not None: self.log.close()
+        if self.recorder is not None: self.recorder.close(self)
 
-    def write_csv_log(self):
-        with open(self.csv_filename, "a", newline="") as f:
-            writer = csv.writer(f)
-            num_person_agents = sum(1 for _ in self.schedule.agents if isinstance(_, PersonAgent)) or 1
-            writer.writerow([
-                self.day, self.count_state("Susceptible"), self.count_state("Infected"),
-                self.count_state("Recovered"), self.count_state("Dead"), 
-                self.count_vaccinated(), self.count_vaccine_effective(),
-                self.count_asymptomatic(), 1 if self.lockdown_active else 0,
-                self.count_masked_person_agents() / num_person_agents # Log average masked
-            ])
+    # --- Checkpoints (see checkpoint.py) ---
+    def checkpoint(self):
+        """Snapshot of the full model state between steps."""
+        return Checkpoint.of(self)
+
+    def fork(self, **overrides):
+        """An independent copy of this model with some parameters changed, e.g. to branch scenarios off a common prefix."""
+        return self.checkpoint().fork(**overrides)
+
+    def update_params(self, **params):
+        """Changes constructor parameters of a running model. Grid, population and engine stay as built.
+
+        seed reseeds both random streams, so forks with the same overrides can still diverge.
+        """
+        unknown = set(params) - (set(inspect.signature(InfectionModel.__init__).parameters) - {"self"} - STRUCTURAL_PARAMS)
+        if unknown:
+            raise ValueError(f"Cannot change {sorted(unknown)} on a running model; structural parameters are {sorted(STRUCTURAL_PARAMS)}.")
+        log = {name: params.pop(name) for name in ("log_path", "log_format", "log_flush_every") if name in params}
+        if "seed" in params:
+            self._seed = params.pop("seed"); self.random.seed(self._seed)
+            self.np_random = np.random.default_rng(self.random.getrandbits(64))
+            if self.engine is not None: self.engine.rng = self.np_random
+        if "vaccination_priority" in params:
+            self.vaccine_pool = EligibilityPool(self.random, params["vaccination_priority"])
+            for agent in self.schedule.agents: self.vaccine_pool.update(agent)
+        if "risk_perception_radius" in params and self.rasters is not None: self.rasters.perception_radius = params["risk_perception_radius"]
+        for name, value in params.items():
+            setattr(self, name, value)
+        if log:
+            path = log.get("log_path", self.log.path if self.log is not None else None)
+            self.close_log()
+            self.log_format = log.get("log_format", self.log_format); self.log_flush_every = log.get("log_flush_every", self.log_flush_every)
+            self.log = open_sink(self.log_format, path, self.log_flush_every)
+        if "max_days" in params:
+            self.running = self.day < self.max_days and not (self.count_state("Infected") == 0 and self.day > 10)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["datacollector"] = self.datacollector.model_vars # Reporter lambdas don't pickle; history does
+        return state
+
+    def __setstate__(self, state):
+        model_vars = state.pop("datacollector")
+        self.__dict__.update(state)
+        self.datacollector = self.make_datacollector()
+        self.datacollector.model_vars = model_vars
 
     def step(self):
-        num_person_agents = sum(1 for agent in self.schedule.agents if isinstance(agent, PersonAgent))
+        prof = self.profiler
+        if prof: t = time.perf_counter()
+        num_person_agents = self.count_person_agents()
         if num_person_agents > 0:
             current_infected_percentage = self.count_state("Infected") / num_person_agents
             if not self.lockdown_active and current_infected_percentage >= self.lockdown_infection_threshold_percentage:
                 self.lockdown_active = True
                 self.lockdown_end_day = self.day + self.lockdown_duration_days
+                if self.active_scheduling: self.schedule.wake_all() # Everyone re-decides masking and mobility
                 print(f"Day {self.day}: LOCKDOWN INITIATED. Ends on day {self.lockdown_end_day}. Infected: {current_infected_percentage*100:.2f}%")
         
         if self.lockdown_active and self.day >= self.lockdown_end_day:
             self.lockdown_active = False; self.lockdown_end_day = -1 
+            if self.active_scheduling: self.schedule.wake_all()
             print(f"Day {self.day}: LOCKDOWN ENDED.")
 
+        self.tables.refresh() # Picks up parameters changed between steps
+        if prof: t = prof.lap("lockdown", t)
         if self.random.random() < self.migration_event_probability: self.introduce_migrants()
+        if prof: t = prof.lap("migration", t)
         self.perform_daily_vaccination()
+        if prof: t = prof.lap("vaccination", t)
         
-        self.schedule.step() # PersonAgents update behavior (masking) and then state, movement, infection
+        if self.engine is not None:
+            self.engine.step(); self.counters = self.engine.tally() # Same phases as PersonAgent.step, batched over arrays
+        else:
+            self.rasters.rebuild() # Daily neighborhood tables for perception and social masking
+            if self.households is not None: self.households.step() # Promotions, demotions and the aggregated members' day
+            self.schedule.step() # PersonAgents update behavior (masking) and then state, movement, infection
+            self.rasters.flush_moves() # The day's moves, applied to the occupancy counts in one batch
+        if prof: t = prof.lap("agents", t)
+        self.verify_counters()
+        if prof: t = prof.lap("verification", t)
 
         self.datacollector.collect(self)
-        self.write_csv_log()
+        if prof: t = prof.lap("data_collection", t)
+        self.write_log()
+        if self.recorder is not None: self.recorder.record(self)
 
         self.day += 1
 
-        infected_person_agents = sum(1 for agent in self.schedule.agents if isinstance(agent, PersonAgent) and agent.state == "Infected")
+        infected_person_agents = self.count_state("Infected")
         if infected_person_agents == 0 and self.day > 10: self.running = False
         if self.day >= self.max_days: self.running = False
+        stopping = not self.running and self.finish_on_stop
+        if stopping: self.finish()
+        if prof:
+            prof.lap("log_io", t); prof.end_day(self)
+            if stopping: print(prof.report())
+
+
+def measure_memory_per_agent(width=50, height=50, days=1, **params):
+    """Builds (and steps) a model under tracemalloc and reports the memory it holds per living agent.
+
+    Includes everything the model allocates (agents, grid, schedule, rasters, pools), so
+    bytes_per_agent times the planned population is a sizing estimate for a larger run
+    with the same density and engine.
+    """
+    params.setdefault("log_path", None)
+    tracing = tracemalloc.is_tracing()
+    if not tracing: tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        model = InfectionModel(width=width, height=height, **params)
+        for _ in range(days): model.step()
+        total = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        if not tracing: tracemalloc.stop()
+    agents = model.count_person_agents() - model.count_state("Dead")
+    return {"agents": agents, "total_bytes": total, "bytes_per_agent": total / agents if agents else 0.0}
@@ -0,0 +1,18 @@
+class NeighborLookup:
+    """The people in the Moore neighborhood of a cell (radius 1, center excluded; the grid holds only people).
+
+    Each get() asks the grid afresh. Caching the lists per cell for the day paid for
+    itself on few lookups: with every move invalidating the lists around two cells,
+    under a quarter of lookups hit and the plain query was faster. Counts the lookups
+    and the cells they read for profiling.py.
+    """
+
+    def __init__(self, grid):
+        self.grid = grid
+        self.neighbor_queries = 0
+        self.cells_scanned = 0 # Grid cells read building lists
+        self.window = len(grid.get_neighborhood((0, 0), moore=True, include_center=False))
+
+    def get(self, pos):
+        self.neighbor_queries += 1; self.cells_scanned += self.window
+        return self.grid.get_neighbors(pos, moore=True, include_center=False)
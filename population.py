@@ -0,0 +1,77 @@
+from collections import namedtuple
+
+import numpy as np
+
+AGE_VALUES = np.array([5, 15, 25, 35, 45, 55, 65, 75, 85], dtype=np.int16)
+AGE_WEIGHTS = np.array([.117, .131, .136, .135, .124, .128, .118, .073, .039])
+INITIAL_INFECTED_RATE = 0.02
+
+# Arrays describing a freshly generated population, one entry per person unless noted.
+Population = namedtuple("Population", [
+    "workplace_x", "workplace_y",  # one entry per workplace
+    "household_x", "household_y",  # one entry per household
+    "home_x", "home_y", "traits", "infected", "asymptomatic",
+])
+
+
+def place_workplaces(model, rng):
+    num_cells = model.width * model.height
+    cells = rng.choice(num_cells, size=min(model.num_workplaces, num_cells), replace=False)
+    return (cells // model.height).astype(np.int32), (cells % model.height).astype(np.int32)
+
+
+def place_households(model, density, rng):
+    """Draws distinct home cells and 2-6 members per home until density * cells people are housed.
+
+    Returns the home cell of every household and of every person.
+    """
+    num_cells = model.width * model.height
+    num_people = int(num_cells * density)
+    if num_people <= 0:
+        empty = np.zeros(0, dtype=np.int32)
+        return empty, empty, empty, empty
+    cells = rng.permutation(num_cells)
+    sizes = rng.integers(2, 7, size=num_cells)
+    num_homes = min(int(np.searchsorted(np.cumsum(sizes), num_people)) + 1, num_cells)
+    cells, sizes = cells[:num_homes], sizes[:num_homes]
+    sizes[-1] -= max(0, int(sizes.sum()) - num_people) # Last household takes whoever is left
+    member_cells = np.repeat(cells, sizes)
+    return ((cells // model.height).astype(np.int32), (cells % model.height).astype(np.int32),
+            (member_cells // model.height).astype(np.int32), (member_cells % model.height).astype(np.int32))
+
+
+def draw_traits(model, rng, n, workplace_x, workplace_y):
+    """Draws age, mobility, work assignment and behavioral propensities for n new people at once.
+
+    Same distributions as PersonAgent.draw_traits / assign_work_location.
+    """
+    age = rng.choice(AGE_VALUES, size=n, p=AGE_WEIGHTS / AGE_WEIGHTS.sum())
+    essential = (age < 65) & (rng.random(n) < model.essential_worker_rate)
+    work_x = np.full(n, -1, dtype=np.int32); work_y = np.full(n, -1, dtype=np.int32)
+    if len(workplace_x):
+        choice = rng.integers(0, len(workplace_x), size=n)
+        work_x[essential] = workplace_x[choice[essential]]
+        work_y[essential] = workplace_y[choice[essential]]
+
+    def propensity(mean, sd):
+        return np.clip(rng.normal(mean, sd, size=n), 0, 1)
+
+    return {
+        "age": age, "essential": essential, "work_x": work_x, "work_y": work_y,
+        "base_propensity_to_mask_normal": propensity(model.avg_mask_propensity_normal, 0.2),
+        "base_propensity_to_mask_lockdown": propensity(model.avg_mask_propensity_lockdown, 0.15),
+        "prop_voluntary_isolation_if_risk_high": propensity(model.avg_prop_voluntary_isolation, 0.2),
+        "base_compliance_propensity": propensity(model.avg_lockdown_compliance, 0.15),
+        "base_willingness_to_vaccinate": propensity(model.avg_vaccine_willingness, 0.25),
+    }
+
+
+def build_population(model, density, rng):
+    """Generates workplaces, households, traits and initial infections in vectorized batches."""
+    workplace_x, workplace_y = place_workplaces(model, rng)
+    household_x, household_y, home_x, home_y = place_households(model, density, rng)
+    n = len(home_x)
+    traits = draw_traits(model, rng, n, workplace_x, workplace_y)
+    infected = rng.random(n) < INITIAL_INFECTED_RATE
+    asymptomatic = infected & (rng.random(n) < model.asymptomatic_rate)
+    return Population(workplace_x, workplace_y, household_x, household_y, home_x, home_y, traits, infected, asymptomatic)
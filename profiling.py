@@ -0,0 +1,83 @@
+from time import perf_counter
+
+try:
+    from .agent import PersonAgent
+    from .codes import INFECTED, DEAD
+except ImportError:
+    from agent import PersonAgent
+    from codes import INFECTED, DEAD
+
+# InfectionModel.step phases in step order; "agents" (schedule or engine step) contains the agent phases below it.
+MODEL_PHASES = ("lockdown", "migration", "vaccination", "agents", "verification", "data_collection", "log_io")
+AGENT_PHASES = ("perception", "masking", "progression", "movement", "transmission")
+PHASES = MODEL_PHASES + AGENT_PHASES
+
+
+class PhaseProfiler:
+    """Wall time and call counts per phase of InfectionModel.step, accumulated over the run.
+
+    Model phases are timed once per day. The agent phases are summed over every
+    PersonAgent step (ProfiledPersonAgent) or timed once per VectorizedEngine phase,
+    and together make up most of "agents". With engine="tiled" they are timed in each
+    strip's worker and summed over the strips, which run in parallel, so they can add
+    up to more than "agents". neighbor_queries and cells_scanned are
+    cumulative: neighbor lookups answered, and grid cells read to answer them
+    (NeighborLookup queries and the rasters' window sums).
+    """
+
+    def __init__(self):
+        self.seconds = dict.fromkeys(PHASES, 0.0)
+        self.calls = dict.fromkeys(PHASES, 0)
+        self.neighbor_queries = 0
+        self.cells_scanned = 0
+        self.days = 0
+
+    def lap(self, phase, start):
+        """Charges the time since `start` to `phase`; returns now, the start of the next phase."""
+        now = perf_counter()
+        self.seconds[phase] += now - start; self.calls[phase] += 1
+        return now
+
+    def end_day(self, model):
+        """Picks up the day's neighborhood counters from the engine or the neighbor cache and rasters."""
+        self.days += 1
+        source = model.engine if model.engine is not None else model.neighbors
+        self.neighbor_queries = source.neighbor_queries
+        self.cells_scanned = source.cells_scanned + (model.rasters.cells_scanned if model.rasters is not None else 0)
+
+    def summary(self):
+        return {"days": self.days, "seconds": dict(self.seconds), "calls": dict(self.calls),
+                "neighbor_queries": self.neighbor_queries, "cells_scanned": self.cells_scanned}
+
+    def report(self):
+        """Plain-text table of time per phase, share of the step and calls."""
+        total = sum(self.seconds[phase] for phase in MODEL_PHASES) or 1.0
+        lines = [f"Phase profile over {self.days} days ({total:.3f} s in step):",
+                 f"  {'phase':<18}{'seconds':>10}{'share':>8}{'calls':>12}"]
+        for phase in PHASES:
+            name = phase if phase in MODEL_PHASES else "  " + phase
+            lines.append(f"  {name:<18}{self.seconds[phase]:>10.3f}{self.seconds[phase] / total:>8.1%}{self.calls[phase]:>12}")
+        lines.append(f"  neighbor queries: {self.neighbor_queries:,}; cells scanned: {self.cells_scanned:,}")
+        return "\n".join(lines)
+
+
+class ProfiledPersonAgent(PersonAgent):
+    """PersonAgent whose step charges each phase to model.profiler; built instead of PersonAgent
+    when InfectionModel(profile=True), so unprofiled runs pay nothing for the timers."""
+
+    __slots__ = ()
+
+    def step(self):
+        if self.state == DEAD:
+             return
+        prof = self.model.profiler; t = perf_counter()
+        self.update_perceived_local_risk(); t = prof.lap("perception", t)
+        self.decide_masking(); t = prof.lap("masking", t)
+        self.progress_disease()
+        if self.state == DEAD:
+            self.model.retire_agent(self); prof.lap("progression", t)
+            return
+        t = prof.lap("progression", t)
+        self.move(); t = prof.lap("movement", t)
+        if self.state == INFECTED:
+            self.spread_infection(); prof.lap("transmission", t)
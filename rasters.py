@@ -0,0 +1,119 @@
+import numpy as np
+
+try:
+    from .codes import SUSCEPTIBLE, INFECTED, RECOVERED
+except ImportError:
+    from codes import SUSCEPTIBLE, INFECTED, RECOVERED
+
+# Per-cell count layers of cell_layers(); every living person is in "people" and exactly one of the others.
+CELL_LAYERS = ("people", "susceptible", "vaccinated", "infected", "recovered")
+
+
+def torus_window(size, radius):
+    """Cells before/after the center covered by a Moore window along one torus axis.
+
+    Mirrors MultiGrid.get_neighborhood: the radius is capped at size // 2 and, on an
+    even axis at that cap, shortened by one so no cell is counted twice.
+    """
+    r = min(radius, size // 2)
+    return r, r - int(r == size // 2 and size % 2 == 0)
+
+
+def window_sum(raster, radius, wrap_x=True):
+    """Moore-neighborhood sum (center excluded) of every cell of a (..., width, height) torus raster.
+
+    Uses a summed-area table over the wrap-padded raster, so the cost is O(cells)
+    regardless of the radius. With wrap_x=False the x edges are zero-padded instead:
+    the raster is a strip whose outer `radius` columns are a halo copied from its
+    neighbors, and only the sums inside the halo are meaningful.
+    """
+    width, height = raster.shape[-2:]
+    (x_before, x_after) = torus_window(width, radius) if wrap_x else (radius, radius)
+    (y_before, y_after) = torus_window(height, radius)
+    lead = [(0, 0)] * (raster.ndim - 2)
+    if wrap_x:
+        padded = np.pad(raster, lead + [(x_before, x_after), (y_before, y_after)], mode="wrap")
+    else:
+        padded = np.pad(np.pad(raster, lead + [(0, 0), (y_before, y_after)], mode="wrap"), lead + [(x_before, x_after), (0, 0)])
+    wx, wy = x_before + x_after + 1, y_before + y_after + 1
+    sat = np.zeros(raster.shape[:-2] + (width + wx, height + wy), dtype=np.int64)
+    sat[..., 1:, 1:] = padded.cumsum(axis=-2).cumsum(axis=-1)
+    total = sat[..., wx:, wy:] - sat[..., :-wx, wy:] - sat[..., wx:, :-wy] + sat[..., :-wx, :-wy]
+    return total - raster
+
+
+def cell_layers(cells, state, vaccinated, shape):
+    """(width, height) counts per CELL_LAYERS name from flat cell indices and state codes of living people.
+
+    "vaccinated" counts vaccinated people who are still susceptible, "susceptible" the unvaccinated ones.
+    """
+    size = shape[0] * shape[1]
+    count = lambda mask: np.bincount(cells[mask], minlength=size).reshape(shape)
+    susceptible = state == SUSCEPTIBLE
+    return {"people": np.bincount(cells, minlength=size).reshape(shape),
+            "susceptible": count(susceptible & ~vaccinated), "vaccinated": count(susceptible & vaccinated),
+            "infected": count(state == INFECTED), "recovered": count(state == RECOVERED)}
+
+
+def ratio(numerator, denominator):
+    return np.divide(numerator, denominator, out=np.zeros(denominator.shape), where=denominator > 0)
+
+
+class OccupancyRasters:
+    """Per-cell person, infected and masked counts with daily neighborhood tables.
+
+    The counts are kept current as agents are placed and change state or mask.
+    Moves are queued and applied to all three layers in one batched update by
+    flush_moves() at the end of the day. rebuild() turns them into per-cell tables of the local infected ratio
+    (risk_perception_radius) and the masked-neighbor fraction (radius 1), so both
+    perception and social masking influence become a single cell lookup.
+    """
+
+    def __init__(self, width, height, perception_radius):
+        self.width, self.height = width, height
+        self.perception_radius = perception_radius
+        self.people = np.zeros((width, height), dtype=np.int32)
+        self.infected = np.zeros((width, height), dtype=np.int32)
+        self.masked = np.zeros((width, height), dtype=np.int32)
+        self.infected_ratio = np.zeros((width, height))
+        self.masked_fraction = np.zeros((width, height))
+        self._moves = [] # (old x, old y, new x, new y, infected, masked) not yet applied to the layers
+        self.cells_scanned = 0 # Cells read by rebuild()'s window sums
+
+    def add(self, agent, sign=1):
+        x, y = agent.pos
+        self.people[x, y] += sign
+        if agent.state == INFECTED: self.infected[x, y] += sign
+        if agent.masked: self.masked[x, y] += sign
+
+    def remove(self, agent):
+        self.add(agent, -1)
+
+    def moved(self, agent, old_pos):
+        """Queues a move. Later state/mask changes at the new cell stay consistent once it is applied."""
+        self._moves.append((old_pos[0], old_pos[1], agent.pos[0], agent.pos[1], agent.state == INFECTED, agent.masked))
+
+    def flush_moves(self):
+        """Applies every queued move to the count layers at once."""
+        if not self._moves: return
+        moves = np.array(self._moves, dtype=np.int32); self._moves = []
+        old, new = (moves[:, 0], moves[:, 1]), (moves[:, 2], moves[:, 3])
+        for layer, weight in ((self.people, 1), (self.infected, moves[:, 4]), (self.masked, moves[:, 5])):
+            np.subtract.at(layer, old, weight); np.add.at(layer, new, weight)
+
+    def verify(self, expected, day):
+        """Raises RuntimeError if any count layer differs from `expected` (rasters rebuilt by a full scan)."""
+        stale = [name for name in ("people", "infected", "masked")
+                 if not np.array_equal(getattr(self, name), getattr(expected, name))]
+        if stale:
+            raise RuntimeError(f"Day {day}: occupancy rasters out of sync with full scan ({', '.join(stale)})")
+
+    def rebuild(self):
+        """Recomputes the neighborhood tables from the current counts (once per day)."""
+        self.flush_moves()
+        people = window_sum(self.people, self.perception_radius)
+        self.infected_ratio = ratio(window_sum(self.infected, self.perception_radius), people)
+        if self.perception_radius != 1:
+            people = window_sum(self.people, 1)
+        self.masked_fraction = ratio(window_sum(self.masked, 1), people)
+        self.cells_scanned += self.people.size * (3 if self.perception_radius == 1 else 4)
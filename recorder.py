@@ -0,0 +1,245 @@
+"""Per-day recording of every agent to a memory-mapped file, and replay of it without re-simulating.
+
+    InfectionModel(record_path="run.rec")             # records day 0 and every step into run.rec/
+    python recorder.py run.rec --port 8523            # scrub through it in the usual web view
+
+A recording is a directory. agents.bin holds one RECORD row (11 bytes) per living agent
+per day, the days back to back. days.bin holds one row per day: where the day ends in
+agents.bin, the dead archive's size and the DataCollector row. dead.bin holds the dead
+archive, and layout.npz the grid size, home/workplace layout and reporter names. All but
+layout.npz grow by appends that are flushed every day, so a run that crashes or is
+killed leaves a recording readable up to its last complete day. Recording.day(d) is a
+slice of the memory map, so any day is read in constant time whatever its position in the run.
+"""
+import argparse
+import os
+
+import numpy as np
+from mesa import Model
+from mesa.space import MultiGrid
+from mesa.datacollection import DataCollector
+
+try:
+    from .archive import DeadArchive
+    from .locations import LocationLayer
+    from .rasters import cell_layers
+    from .codes import STATE_NAMES
+except ImportError:
+    from archive import DeadArchive
+    from locations import LocationLayer
+    from rasters import cell_layers
+    from codes import STATE_NAMES
+
+RECORD = np.dtype([("unique_id", "<i4"), ("x", "<u2"), ("y", "<u2"), ("age", "u1"), ("state", "u1"), ("flags", "u1")])
+FLAGS = ("masked", "vaccinated", "vaccine_waned") # Bit i of RECORD["flags"]
+FIELDS = ("unique_id", "x", "y", "age", "state") + FLAGS # Agent columns read from the model each day
+DEAD = np.dtype(list(DeadArchive.FIELDS.items()))
+AGENTS_FILE, DAYS_FILE, DEAD_FILE, LAYOUT_FILE = "agents.bin", "days.bin", "dead.bin", "layout.npz"
+
+
+def day_dtype(reporters):
+    """days.bin row: end of the day in agents.bin, len(dead_archive), then the day's DataCollector values."""
+    return np.dtype([("end", "<i8"), ("dead", "<i8"), ("reporters", "<f8", (reporters,))])
+
+
+class DayRecorder:
+    """Appends the model's living agents to <path>/agents.bin once per DataCollector row.
+
+    The files stay open between days. A pickled recorder (in a checkpoint) drops them, and
+    the restored one reopens them cut back to its own last day, so the copy continues the
+    recording from the checkpoint (forks drop the recorder, as they drop the log).
+    """
+
+    def __init__(self, path, model):
+        if max(model.width, model.height) > np.iinfo(RECORD["x"]).max + 1:
+            raise ValueError(f"Recordings store coordinates as uint16; a {model.width}x{model.height} grid is too large.")
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.reporter_names = list(model.datacollector.model_vars)
+        np.savez(os.path.join(path, LAYOUT_FILE), width=model.width, height=model.height,
+                 home_id=model.locations.home_id, workplace=model.locations.workplace, reporter_names=np.array(self.reporter_names))
+        self.day_row = day_dtype(len(self.reporter_names))
+        self.rows = {AGENTS_FILE: 0, DAYS_FILE: 0, DEAD_FILE: 0} # Rows written to each file
+        self.files = None
+        self.open("wb")
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["files"] = None
+        return state
+
+    def open(self, mode="r+b"):
+        """Opens the files for appending, first cutting them back to the rows this recorder wrote."""
+        itemsize = {AGENTS_FILE: RECORD.itemsize, DAYS_FILE: self.day_row.itemsize, DEAD_FILE: DEAD.itemsize}
+        self.files = {}
+        for name, rows in self.rows.items():
+            f = open(os.path.join(self.path, name), mode)
+            f.truncate(rows * itemsize[name]); f.seek(0, os.SEEK_END)
+            self.files[name] = f
+
+    @property
+    def days(self):
+        return self.rows[DAYS_FILE]
+
+    def append(self, name, rows):
+        self.files[name].write(rows.tobytes()); self.files[name].flush()
+        self.rows[name] += len(rows)
+
+    def record(self, model):
+        """Appends today's rows; called right after each DataCollector.collect()."""
+        if self.files is None: self.open()
+        columns = model.agent_columns(FIELDS)
+        rows = np.empty(len(columns["state"]), dtype=RECORD)
+        for name in ("unique_id", "x", "y", "age", "state"):
+            rows[name] = columns[name]
+        rows["flags"] = sum(np.asarray(columns[name], dtype=np.uint8) << bit for bit, name in enumerate(FLAGS))
+        self.append(AGENTS_FILE, rows)
+        archive = model.dead_archive
+        dead = np.empty(len(archive) - self.rows[DEAD_FILE], dtype=DEAD)
+        for name, column in archive.columns(start=self.rows[DEAD_FILE]).items():
+            dead[name] = column
+        self.append(DEAD_FILE, dead)
+        day = np.zeros(1, dtype=self.day_row) # Written last, so it never points past the rows above
+        day["end"], day["dead"] = self.rows[AGENTS_FILE], len(archive)
+        day["reporters"] = [model.datacollector.model_vars[name][-1] for name in self.reporter_names]
+        self.append(DAYS_FILE, day)
+
+    def close(self, model):
+        """Closes the files; the next record() (e.g. after more steps) reopens them."""
+        if self.files is None: return
+        for f in self.files.values(): f.close()
+        self.files = None
+
+
+class Recording:
+    """Read side of a DayRecorder directory, up to the last day fully written (also while the run goes on)."""
+
+    def __init__(self, path):
+        layout_path = os.path.join(path, LAYOUT_FILE)
+        if not os.path.exists(layout_path):
+            raise ValueError(f"{path!r} has no {LAYOUT_FILE}; it is not a recording.")
+        with np.load(layout_path) as layout:
+            self.layout = {name: layout[name] for name in layout.files}
+        self.path = path
+        self.width, self.height = int(self.layout["width"]), int(self.layout["height"])
+        names = self.layout["reporter_names"].tolist()
+        days = np.fromfile(os.path.join(path, DAYS_FILE), dtype=np.uint8)
+        row = day_dtype(len(names))
+        days = days[:len(days) - len(days) % row.itemsize].view(row) # A day cut short by a crash is dropped
+        self.offsets = np.concatenate([[0], days["end"]])
+        self.dead_counts = days["dead"]
+        self.agents = self.map(AGENTS_FILE, RECORD, int(self.offsets[-1]))
+        self.dead = self.map(DEAD_FILE, DEAD, int(self.dead_counts[-1]) if len(days) else 0)
+        self.reporters = dict(zip(names, days["reporters"].T))
+
+    def map(self, name, dtype, rows):
+        if not rows: return np.zeros(0, dtype=dtype) # mmap cannot map an empty file
+        return np.memmap(os.path.join(self.path, name), dtype=dtype, mode="r", shape=(rows,))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def day(self, day):
+        """The RECORD rows of day `day` (0 = before the first step): a view of the memory map."""
+        if not 0 <= day < len(self):
+            raise ValueError(f"Day {day} is outside the recording (0..{len(self) - 1}).")
+        return self.agents[self.offsets[day]:self.offsets[day + 1]]
+
+    def flag(self, rows, name):
+        return (rows["flags"] >> FLAGS.index(name) & 1).astype(bool)
+
+    def dead_archive(self, day):
+        """A DeadArchive holding everyone who had died by `day`."""
+        archive = DeadArchive()
+        n = int(self.dead_counts[day])
+        archive.add_columns(**{name: self.dead[name][:n] for name in DeadArchive.FIELDS})
+        return archive
+
+    def locations(self):
+        layer = LocationLayer(self.width, self.height)
+        layer.home_id, layer.workplace = self.layout["home_id"], self.layout["workplace"]
+        layer.num_homes = int((layer.home_id >= 0).sum())
+        return layer
+
+
+class RecordedAgent:
+    """A recorded agent placed on ReplayModel.grid, with the attributes agent_portrayal reads."""
+
+    __slots__ = ("unique_id", "pos", "age", "state", "masked", "vaccinated", "vaccine_waned")
+
+    def __init__(self, unique_id, age, state, masked, vaccinated, vaccine_waned):
+        self.unique_id, self.age, self.state = unique_id, age, state
+        self.masked, self.vaccinated, self.vaccine_waned = masked, vaccinated, vaccine_waned
+        self.pos = None
+
+    @property
+    def state_name(self):
+        return STATE_NAMES[self.state]
+
+
+class ReplayModel(Model):
+    """Plays a recording back through server.py's grid and chart modules.
+
+    Each step shows the next recorded day; seek(day) jumps anywhere. Only the day on
+    screen is read from the recording, so any day loads in the same time.
+    """
+
+    def __init__(self, path, start_day=0):
+        super().__init__()
+        self.recording = Recording(path)
+        self.width, self.height = self.recording.width, self.recording.height
+        self.locations = self.recording.locations()
+        self.datacollector = DataCollector()
+        self.engine = None
+        self.seek(start_day)
+
+    def seek(self, day):
+        day = min(max(int(day), 0), len(self.recording) - 1)
+        self.day, self.rows = day, self.recording.day(day)
+        self.running = day < len(self.recording) - 1
+        self.datacollector.model_vars = {name: values[:day + 1].tolist() for name, values in self.recording.reporters.items()}
+        self.dead_archive = self.recording.dead_archive(day)
+        self._grid = None # Built on first use: the heatmap view never needs agent objects
+
+    @property
+    def grid(self):
+        if self._grid is None:
+            self._grid = MultiGrid(self.width, self.height, torus=True)
+            rows = self.rows
+            flags = [self.recording.flag(rows, name).tolist() for name in FLAGS]
+            for unique_id, x, y, age, state, masked, vaccinated, waned in zip(
+                    rows["unique_id"].tolist(), rows["x"].tolist(), rows["y"].tolist(), rows["age"].tolist(),
+                    rows["state"].tolist(), *flags):
+                self._grid.place_agent(RecordedAgent(unique_id, age, state, masked, vaccinated, waned), (x, y))
+        return self._grid
+
+    def cell_counts(self):
+        """Per-cell counts of the day's living people by state, as InfectionModel.cell_counts() gives them."""
+        rows = self.rows
+        cells = rows["x"].astype(np.int64) * self.height + rows["y"]
+        return cell_layers(cells, rows["state"], self.recording.flag(rows, "vaccinated"), (self.width, self.height))
+
+    def step(self):
+        self.seek(self.day + 1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a recorded run in the web view.")
+    parser.add_argument("path", help="recording directory (InfectionModel record_path)")
+    parser.add_argument("--port", type=int, default=8523)
+    args = parser.parse_args(argv)
+    from mesa.visualization.ModularVisualization import ModularServer
+    from mesa.visualization.UserParam import Slider
+    try:
+        from .server import grid, chart
+    except ImportError:
+        from server import grid, chart
+    days = len(Recording(args.path))
+    server = ModularServer(ReplayModel, [grid, chart], f"Replay of {args.path}",
+                           {"path": args.path, "start_day": Slider("Start Day (Reset to jump)", 0, 0, max(days - 1, 1), 1)})
+    server.port = args.port
+    server.launch()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import numpy as np
+
+
+def wrapped_delta(delta, size):
+    """Shortest signed offset along a torus axis of the given size (ties go the negative way).
+
+    Works on ints and NumPy arrays alike.
+    """
+    return (delta + size // 2) % size - size // 2
+
+
+def torus_direction(delta, size):
+    """-1, 0 or 1: the one-cell step along a torus axis that shortens the wraparound distance."""
+    return np.sign(wrapped_delta(delta, size))
+
+
+def build_route(origin, target, width, height):
+    """Cells visited going from origin to target one hop per day, both ends included.
+
+    Same path shape PersonAgent always walked: diagonal while both axes are off, then
+    straight along the remaining one, but the shorter way around the torus on each axis.
+    Every suffix of a route is the route from that cell, so an agent can pick up a
+    cached route anywhere along it.
+    """
+    x, y = origin
+    dx = wrapped_delta(target[0] - x, width); dy = wrapped_delta(target[1] - y, height)
+    cells = [origin]
+    while dx or dy:
+        sx = (dx > 0) - (dx < 0); sy = (dy > 0) - (dy < 0)
+        x = (x + sx) % width; y = (y + sy) % height
+        dx -= sx; dy -= sy
+        cells.append((x, y))
+    return tuple(cells)
+
+
+class RouteCache:
+    """Routes keyed by (origin, target), computed once and shared by every agent making that trip.
+
+    Household members working at the same workplace share the same home->work and
+    work->home routes; PersonAgent only keeps the route and its index along it.
+    """
+
+    def __init__(self, width, height):
+        self.width, self.height = width, height
+        self._routes = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._routes)
+
+    def get(self, origin, target):
+        route = self._routes.get((origin, target))
+        if route is None:
+            self.misses += 1
+            route = self._routes[(origin, target)] = build_route(origin, target, self.width, self.height)
+        else:
+            self.hits += 1
+        return route
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"routes": len(self._routes), "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0}
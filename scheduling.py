@@ -0,0 +1,152 @@
+from collections import defaultdict
+
+import numpy as np
+from mesa.time import RandomActivation
+
+try:
+    from .codes import INFECTED, RECOVERED, ESSENTIAL
+except ImportError:
+    from codes import INFECTED, RECOVERED, ESSENTIAL
+
+
+class ActiveSetActivation(RandomActivation):
+    """RandomActivation that only steps agents whose step can change something.
+
+    An agent stays in the active set while it is infected, commutes, is away from
+    home, or perceived any local risk on its last step. Everyone else goes dormant
+    after their step. A dormant agent is
+    woken when an infected person is within its perception radius (the model's
+    infected_ratio raster at its home cell), when its natural or vaccine immunity is due to wane
+    (a timer set when it went dormant), or when the model changes its state
+    (infection, vaccination, lockdown start/end). Dormant agents' day counters are
+    fast-forwarded when they wake, so waning happens on the same day as under full
+    activation. Dormant agents still redraw their mask every day, since the social
+    norm they respond to keeps changing while they sleep. Their perceived risk is 0,
+    so this is one batched draw over per-slot arrays of their propensities and home
+    cells (redraw_masks), with set_masked called only for the masks that change.
+
+    With full_activation=True every agent is stepped every day, as with
+    RandomActivation, while the same bookkeeping runs for validation.
+    """
+
+    def __init__(self, model, full_activation=False):
+        super().__init__(model)
+        self.full_activation = full_activation
+        self._last_step = {}             # unique_id -> last day the agent's counters are current for
+        self._active = set()             # unique_ids that keep stepping until they go dormant
+        self._woken = set()              # unique_ids to step at the next activation
+        self._timers = defaultdict(set)  # day -> unique_ids whose immunity wanes that day
+        self._today = None               # unique_ids being activated by the current step()
+        self._slot = {}                  # unique_id -> index into the arrays below and _slot_agent
+        self._slot_agent = []
+        self._dormant = np.zeros(0, dtype=bool)      # Slept and not stepped or woken since
+        self._propensity = np.zeros((0, 2))          # base_propensity_to_mask_normal, _lockdown
+        self._home = np.zeros((0, 2), dtype=np.int64) # Cell the agent sleeps in, set by sleep()
+        self._masked = np.zeros(0, dtype=bool)       # Its mask since it went dormant
+        self.scheduled = 0               # Agent-days: agents present at the start of each step, summed
+        self.activations = 0
+        self.skipped = 0                 # Agent-days the active set left out (would have, under full activation)
+
+    def add(self, agent):
+        super().add(agent)
+        self._last_step[agent.unique_id] = self.model.day - 1
+        self._woken.add(agent.unique_id)
+        slot = self._slot[agent.unique_id] = len(self._slot_agent)
+        if slot == len(self._dormant): # Grow the slot arrays by doubling
+            grow = lambda array: np.concatenate([array, np.zeros((max(slot, 64),) + array.shape[1:], dtype=array.dtype)])
+            self._dormant, self._propensity, self._home, self._masked = map(grow, (self._dormant, self._propensity, self._home, self._masked))
+        self._slot_agent.append(agent)
+        self._propensity[slot] = agent.base_propensity_to_mask_normal, agent.base_propensity_to_mask_lockdown
+
+    def remove(self, agent):
+        super().remove(agent)
+        self._last_step.pop(agent.unique_id, None)
+        self._active.discard(agent.unique_id); self._woken.discard(agent.unique_id)
+        slot = self._slot.pop(agent.unique_id, None)
+        if slot is not None: self._dormant[slot] = False; self._slot_agent[slot] = None
+
+    def catch_up(self, agent, through_day):
+        """Applies the immunity counter increments a dormant agent missed up to through_day."""
+        missed = through_day - self._last_step[agent.unique_id]
+        if missed <= 0: return
+        if agent.state == RECOVERED: agent.days_since_recovery += missed
+        if agent.vaccinated and not agent.vaccine_waned: agent.days_since_vaccination += missed
+        self._last_step[agent.unique_id] = through_day
+
+    def wake(self, agent):
+        """Call before the model changes a (possibly dormant) agent's state from outside its own step."""
+        if self._today is None: self.catch_up(agent, self.model.day - 1)
+        elif agent.unique_id not in self._today: self.catch_up(agent, self.model.day) # Sits out today's step
+        self._woken.add(agent.unique_id); self._dormant[self._slot[agent.unique_id]] = False
+
+    def wake_all(self):
+        for agent in self._agents.values():
+            self.wake(agent)
+
+    def needs_step(self, agent):
+        if agent.state == INFECTED or agent.pos != agent.home_pos: return True
+        # Only go dormant after a zero-risk day, so the mask kept while dormant is an ordinary low-risk draw
+        if agent.perceived_local_risk > 0: return True
+        return agent.mobility == ESSENTIAL and agent.work_pos is not None and agent.age > 14
+
+    def sleep(self, agent, day):
+        """Drops agent from the active set and arms its immunity-waning timers."""
+        self._active.discard(agent.unique_id)
+        slot = self._slot[agent.unique_id]
+        self._dormant[slot] = True; self._home[slot] = agent.pos; self._masked[slot] = agent.masked
+        if agent.state == RECOVERED:
+            self._timers[day + self.model.natural_immunity_duration - agent.days_since_recovery + 1].add(agent.unique_id)
+        if agent.vaccinated and not agent.vaccine_waned:
+            self._timers[day + self.model.vaccine_immunity_duration - agent.days_since_vaccination + 1].add(agent.unique_id)
+
+    def select_active(self, day):
+        selected = self._active | self._woken | self._timers.pop(day, set())
+        self._woken = set()
+        # Everyone else in a cell with infection nearby: dormant agents sit in their home cell
+        x, y = self._home.T
+        near_infected = np.flatnonzero(self._dormant & (self.model.rasters.infected_ratio[x, y] > 0))
+        selected.update(self._slot_agent[slot].unique_id for slot in near_infected.tolist())
+        return selected
+
+    def step(self):
+        day = self.model.day
+        selected = self.select_active(day)
+        num_scheduled = len(self._agents)
+        self._today = set(self._agents) if self.full_activation else selected
+        agent_keys = sorted(self._today) # Sorted first: set order does not survive a checkpoint restore
+        self.model.random.shuffle(agent_keys)
+        for agent_key in agent_keys:
+            agent = self._agents.get(agent_key)
+            if agent is None: continue # Retired earlier in this step
+            self.catch_up(agent, day - 1)
+            self._dormant[self._slot[agent_key]] = False
+            agent.step()
+            if agent_key not in self._agents: continue
+            self._last_step[agent_key] = day
+            if self.needs_step(agent): self._active.add(agent_key)
+            else: self.sleep(agent, day)
+        if not self.full_activation: self.redraw_masks() # Full activation redraws them in agent.step()
+        self.scheduled += num_scheduled; self.activations += len(agent_keys)
+        self.skipped += num_scheduled - len(selected & self._agents.keys())
+        self._today = None
+        self.steps += 1
+        self.time += 1
+
+    def redraw_masks(self):
+        """Today's mask draw for every dormant agent, as PersonAgent.decide_masking makes it with zero perceived risk."""
+        m = self.model
+        slots = np.flatnonzero(self._dormant)
+        if not len(slots): return
+        prob = self._propensity[slots, int(m.lockdown_active)]
+        if 0 > m.masking_risk_threshold: prob = np.minimum(1.0, prob * 1.5) # Zero risk still counts as above threshold
+        x, y = self._home[slots].T
+        prob = np.where(m.rasters.masked_fraction[x, y] > 0.5, np.minimum(1.0, prob * 1.2), prob) # Social norm effect
+        masked = m.np_random.random(len(slots)) < prob
+        changed = masked != self._masked[slots]
+        self._masked[slots] = masked
+        for slot, value in zip(slots[changed].tolist(), masked[changed].tolist()):
+            self._slot_agent[slot].set_masked(value)
+
+    def stats(self):
+        return {"activations": self.activations, "skipped": self.skipped,
+                "skipped_fraction": self.skipped / self.scheduled if self.scheduled else 0.0}
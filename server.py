@@ -1,25 +1,24 @@
 from mesa.visualization.modules import CanvasGrid, ChartModule
-from mesa.visualization.ModularVisualization import ModularServer
-from mesa.visualization.UserParam import Slider, NumberInput, Choice
+from mesa.visualization.ModularVisualization import ModularServer, TextElement
+from mesa.visualization.UserParam import Slider, NumberInput, Choice, Checkbox
 
 try:
     # Assuming model.py is in the same directory or a submodule
+    from .heatmap import HeatmapGrid
+    from .cache import ResultCache
     from .model import InfectionModel
 except ImportError:
+    from heatmap import HeatmapGrid
+    from cache import ResultCache
     from model import InfectionModel
 
-def agent_portrayal(agent):
+def location_portrayal(location_type):
     """
-    Defines how each agent will be drawn on the grid.
-    Handles PersonAgents, HomeMarkerAgents, and WorkplaceMarkerAgents differently.
+    Defines how a static location from model.locations is drawn on the grid.
+    Homes and workplaces are not agents, so LocationCanvasGrid calls this per cell.
     """
-    if agent is None:
-        return
-
-    agent_type = getattr(agent, 'agent_type', None) # Get agent_type if it exists
-
-    # --- Portrayal for HomeMarkerAgent ---
-    if agent_type == "home_marker":
+    # --- Portrayal for homes ---
+    if location_type == "home":
         return {
             "Shape": "rect",
             "w": 1,  # Fill the cell width
@@ -29,8 +28,8 @@ def agent_portrayal(agent):
             "stroke_color": "#0000FF",         # Bright blue outline
             "Layer": 0,                        # Draw home markers on layer 0 (bottom)
         }
-    # --- Portrayal for WorkplaceMarkerAgent ---
-    elif agent_type == "workplace_marker":
+    # --- Portrayal for workplaces ---
+    elif location_type == "workplace":
         return {
             "Shape": "rect",
             "w": 1,
@@ -41,8 +40,15 @@ def agent_portrayal(agent):
             "Layer": 1,                        # Draw workplace markers on layer 1 (above homes)
         }
 
-    # --- Portrayal for PersonAgent (default if not a marker) ---
-    # This assumes if agent_type is None or not a known marker type, it's a PersonAgent.
+
+def agent_portrayal(agent):
+    """
+    Defines how each agent will be drawn on the grid.
+    Only PersonAgents live on the grid; homes and workplaces come from location_portrayal.
+    """
+    if agent is None:
+        return
+
     portrayal = {
         "Shape": "circle",
         "r": 0.8,
@@ -55,7 +61,7 @@ def agent_portrayal(agent):
     }
 
     # Set color based on infection state for PersonAgents
-    agent_state = getattr(agent, 'state', 'Dead') # Default to Dead if state is somehow missing
+    agent_state = getattr(agent, 'state_name', 'Dead') # Default to Dead if state is somehow missing
     portrayal["Color"] = {
         "Susceptible": "blue",
         "Infected": "red",
@@ -80,13 +86,43 @@ def agent_portrayal(agent):
     return portrayal
 
 
+class LocationCanvasGrid(CanvasGrid):
+    """CanvasGrid that also draws the model's static home/workplace layer and its retired dead agents."""
+
+    def __init__(self, portrayal_method, location_portrayal_method, *args, **kwargs):
+        super().__init__(portrayal_method, *args, **kwargs)
+        self.location_portrayal_method = location_portrayal_method
+
+    def render(self, model):
+        grid_state = super().render(model)
+        for location_type, cells in (("home", model.locations.home_cells()),
+                                      ("workplace", model.locations.workplace_cells())):
+            for x, y in cells:
+                portrayal = self.location_portrayal_method(location_type)
+                portrayal["x"] = x
+                portrayal["y"] = y
+                grid_state[portrayal["Layer"]].append(portrayal)
+        for record in model.dead_archive.records(): # Dead agents leave the grid but are still drawn where they died
+            portrayal = self.portrayal_method(record)
+            portrayal["x"], portrayal["y"] = record.pos
+            grid_state[portrayal["Layer"]].append(portrayal)
+        return grid_state
+
+
 # Define grid and canvas dimensions
 NEW_GRID_WIDTH = 50
 NEW_GRID_HEIGHT = 50
 CANVAS_PIXEL_WIDTH = 750  # Adjust as needed for your screen space
 CANVAS_PIXEL_HEIGHT = 750 # Adjust as needed for your screen space
 
-grid = CanvasGrid(agent_portrayal, NEW_GRID_WIDTH, NEW_GRID_HEIGHT, CANVAS_PIXEL_WIDTH, CANVAS_PIXEL_HEIGHT)
+# False: server-side heatmap (heatmap.py) whose payload is bounded whatever the grid size, with grid size and
+# engine chosen in the UI. True: every agent, home and workplace drawn on a fixed NEW_GRID_WIDTH x NEW_GRID_HEIGHT canvas.
+AGENT_VIEW = False
+
+if AGENT_VIEW:
+    grid = LocationCanvasGrid(agent_portrayal, location_portrayal, NEW_GRID_WIDTH, NEW_GRID_HEIGHT, CANVAS_PIXEL_WIDTH, CANVAS_PIXEL_HEIGHT)
+else:
+    grid = HeatmapGrid(CANVAS_PIXEL_WIDTH, CANVAS_PIXEL_HEIGHT) # At most 100x100 blocks per frame, changed pixels only
 
 # Define the chart for visualizing model-level data
 chart = ChartModule([
@@ -99,12 +135,45 @@ chart = ChartModule([
     {"Label": "Asymptomatic", "Color": "purple"}
 ], data_collector_name='datacollector') # Ensure this matches the DataCollector instance name in model.py
 
+# Finished fixed-seed runs are kept with their final checkpoint; resetting to a configuration and seed that
+# already ran replays its stored curves instead of simulating it again. Built on the first fixed-seed reset,
+# so importing this module (run.py, recorder.py) creates no result_cache/ directory.
+RESULT_CACHE = None
+
+
+def result_cache():
+    global RESULT_CACHE
+    if RESULT_CACHE is None: RESULT_CACHE = ResultCache("result_cache", checkpoints=True)
+    return RESULT_CACHE
+
+
+def cached_model(fixed_seed=False, seed=42, **params):
+    """COVID-19 simulation; with a fixed seed, a configuration that already ran is replayed from the result cache."""
+    if not fixed_seed: return InfectionModel(**params) # A new stochastic run on every Reset
+    return result_cache().open(seed=seed, **params)
+
+
+class CacheStatus(TextElement):
+    """One line of result-cache statistics under the charts."""
+
+    def render(self, model):
+        if RESULT_CACHE is None: return "Run simulated. Tick Fixed Seed to cache runs and replay repeated ones."
+        stats = RESULT_CACHE.stats()
+        source = "replayed from cache" if getattr(model, "result", None) is not None else "simulated"
+        return (f"Run {source}. Result cache: {stats['hits']} hits, {stats['misses']} misses, "
+                f"{stats['entries']} entries ({stats['bytes'] / 2**20:.1f} of {stats['max_bytes'] / 2**20:.0f} MiB), "
+                f"{stats['evictions']} evicted.")
+
+
 # Define the model parameters that will be adjustable via the server UI
 model_params = {
     # Grid and Population Density
-    "width": NEW_GRID_WIDTH, # Fixed width for this server instance
-    "height": NEW_GRID_HEIGHT, # Fixed height for this server instance
+    "width": NEW_GRID_WIDTH if AGENT_VIEW else Slider("Grid Width", NEW_GRID_WIDTH, 20, 1000, 10),
+    "height": NEW_GRID_HEIGHT if AGENT_VIEW else Slider("Grid Height", NEW_GRID_HEIGHT, 20, 1000, 10),
+    "engine": "object" if AGENT_VIEW else Choice("Engine", value="object", choices=["object", "vectorized"]),
     "density": Slider("Agent Density", 0.8, 0.1, 0.9, 0.05), # Controls total initial agent count
+    "fixed_seed": Checkbox("Fixed Seed (replay repeated runs from the result cache)", value=False), # Off: a new random run per Reset
+    "seed": NumberInput("Random Seed (with Fixed Seed)", value=42),
 
     # Simulation Control
     "max_days": Slider("Max Sim Days", 10, 365, 730, 5),
@@ -144,8 +213,8 @@ model_params = {
 
 # Create and run the server
 server = ModularServer(
-    InfectionModel,
-    [grid, chart],
+    cached_model,
+    [grid, chart, CacheStatus()],
     "COVID-19 Simulation with Dynamic Behaviors", # Updated server title
     model_params
 )
\ No newline at end of file
@@ -0,0 +1,86 @@
+import csv
+import os
+
+import numpy as np
+
+# Column order of every log: the day, then the model reporters in DataCollector order.
+REPORTERS = ["Susceptible", "Infected", "Recovered", "Dead", "Vaccinated (Any)",
+             "Vaccine Effective", "Asymptomatic", "LockdownActive", "AvgMasked"]
+COLUMNS = ["Day"] + REPORTERS
+
+
+class MemorySink:
+    """Keeps every logged row in memory; columns() returns them as NumPy arrays."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.rows = []
+
+    def write(self, row):
+        self.rows.append(row)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+    def columns(self):
+        table = np.array(self.rows, dtype=float).reshape(len(self.rows), len(COLUMNS))
+        return {name: table[:, i] for i, name in enumerate(COLUMNS)}
+
+
+class CSVSink(MemorySink):
+    """CSV log written in batches: the file is opened once per flush_every rows instead of once per day.
+
+    A sink restored from a checkpoint cuts the file back to what it had written when
+    the checkpoint was taken before appending, so rows the original logged after
+    that are not duplicated.
+    """
+
+    def __init__(self, path, flush_every=30):
+        super().__init__(path)
+        self.flush_every = flush_every
+        self.rows_written = 0
+        with open(self.path, "w", newline="") as f:
+            csv.writer(f).writerow(COLUMNS)
+        self.bytes_written = os.path.getsize(self.path)
+        self.restored = False
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.restored = True
+
+    def write(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.flush_every: self.flush()
+
+    def flush(self):
+        if self.restored:
+            with open(self.path, "r+b") as f: f.truncate(self.bytes_written)
+            self.restored = False
+        if not self.rows: return
+        with open(self.path, "a", newline="") as f:
+            csv.writer(f).writerows(self.rows)
+        self.rows_written += len(self.rows); self.bytes_written = os.path.getsize(self.path)
+        self.rows = []
+
+
+class NPZSink(MemorySink):
+    """Columnar NumPy archive, one array per column, written when the run ends (or on flush())."""
+
+    def flush(self):
+        if self.rows: np.savez_compressed(self.path, **self.columns())
+
+
+SINKS = {"csv": CSVSink, "npz": NPZSink, "memory": MemorySink}
+
+
+def open_sink(log_format, path, flush_every=30):
+    """Returns the sink for log_format ("csv", "npz" or "memory"); None if path is None and the format needs a file."""
+    if log_format not in SINKS:
+        raise ValueError(f"Unknown log_format {log_format!r}; expected one of {sorted(SINKS)}.")
+    if log_format == "memory": return MemorySink(path)
+    if path is None: return None
+    if log_format == "csv": return CSVSink(path, flush_every)
+    return NPZSink(path)
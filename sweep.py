@@ -0,0 +1,136 @@
+import contextlib
+import csv
+import io
+import itertools
+import os
+from multiprocessing import Pool
+
+import numpy as np
+
+try:
+    from .model import InfectionModel
+    from .sinks import REPORTERS
+    from .cache import run_summary
+except ImportError:
+    from model import InfectionModel
+    from sinks import REPORTERS
+    from cache import run_summary
+
+
+def expand_grid(param_grid):
+    """Turns {"name": [values...]} into the list of every parameter combination.
+
+    Scalars are treated as a single value, so fixed overrides can sit next to swept ones.
+    """
+    names = list(param_grid)
+    values = [v if isinstance(v, (list, tuple, np.ndarray)) else [v] for v in param_grid.values()]
+    return [dict(zip(names, combo)) for combo in itertools.product(*values)]
+
+
+def run_one(task):
+    """Runs one InfectionModel to completion in a worker; returns its per-day reporter series and run summary.
+
+    task is (combo_index, replicate, params, seed, log_dir). Every run writes its
+    CSV log to its own file under log_dir, or none at all, never the shared default.
+    """
+    combo_index, replicate, params, seed, log_dir = task
+    log_path = None if log_dir is None else os.path.join(log_dir, f"run_{combo_index:04d}_{replicate:03d}.csv")
+    with contextlib.redirect_stdout(io.StringIO()): # Lockdown announcements from hundreds of runs are noise here
+        model = InfectionModel(**params, seed=seed, log_path=log_path)
+        while model.running:
+            model.step()
+    series = {name: np.asarray(model.datacollector.model_vars[name], dtype=float) for name in REPORTERS}
+    return combo_index, replicate, series, run_summary(model)
+
+
+def pad_to(series, length):
+    """Extends a run that stopped early (no infections left) by holding its last value."""
+    if len(series) >= length: return series
+    return np.concatenate([series, np.full(length - len(series), series[-1])])
+
+
+def summarize(runs, quantiles):
+    """Mean and quantile bands per reporter and day over the replicates of one combination."""
+    length = max(len(series["Infected"]) for series in runs)
+    bands = {}
+    for name in REPORTERS:
+        stacked = np.stack([pad_to(series[name], length) for series in runs])
+        bands[f"{name}_mean"] = stacked.mean(axis=0)
+        for q in quantiles:
+            bands[f"{name}_q{round(q * 100):02d}"] = np.quantile(stacked, q, axis=0)
+    return length, bands
+
+
+def result_columns(combos, summaries):
+    """One array per column, a row per combination and day: combo, swept parameters, Day, then mean/quantile bands."""
+    param_names = sorted({name for params in combos for name in params})
+    order = sorted(summaries)
+    lengths = [summaries[i][0] for i in order]
+    columns = {"combo": np.repeat(order, lengths)}
+    for name in param_names:
+        columns[name] = np.repeat([combos[i].get(name, "") for i in order], lengths)
+    columns["Day"] = np.concatenate([np.arange(length) for length in lengths])
+    for name in summaries[order[0]][1]:
+        columns[name] = np.concatenate([summaries[i][1][name] for i in order])
+    return columns
+
+
+def write_results(path, combos, summaries):
+    """Writes result_columns(): a columnar .npz archive (one array per column), or a CSV for any other extension."""
+    columns = result_columns(combos, summaries)
+    if path.endswith(".npz"):
+        np.savez_compressed(path, **columns)
+        return
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(list(columns))
+        writer.writerows(zip(*(column.tolist() for column in columns.values())))
+
+
+def run_sweep(param_grid, replicates=1, processes=None, base_seed=0, quantiles=(0.05, 0.5, 0.95),
+              out_path="sweep_results.npz", log_dir=None, progress=None, cache=None):
+    """Runs every combination of param_grid replicates times across a process pool.
+
+    param_grid maps InfectionModel keyword arguments, other than seed and log_path, to
+    lists of values. Replicate r of every combination uses seed base_seed + r, so combinations are compared on
+    the same random streams. Runs are streamed back as they finish and aggregated into
+    out_path (see write_results). processes=1 runs in this process. progress, if
+    given, is called as progress(done, total) after each run. With a cache.ResultCache,
+    runs already in it are read back instead of simulated (and write no log_dir file),
+    and new runs are stored; cache.stats() then counts the hits and misses. Returns
+    {combo_index: (params, bands)}.
+    """
+    reserved = sorted({"seed", "log_path"} & set(param_grid))
+    if reserved: # Set per run by run_one; use base_seed and log_dir instead
+        raise ValueError(f"param_grid cannot set {reserved}: replicate r runs with seed=base_seed + r and logs to log_dir.")
+    combos = expand_grid(param_grid)
+    if log_dir is not None: os.makedirs(log_dir, exist_ok=True)
+    tasks = [(i, r, params, base_seed + r, log_dir) for i, params in enumerate(combos) for r in range(replicates)]
+    runs = {i: [] for i in range(len(combos))}
+    summaries = {}
+    done = 0
+
+    def collect(results, store):
+        nonlocal done
+        for combo_index, replicate, series, summary in results:
+            if store: cache.put_series({**combos[combo_index], "seed": base_seed + replicate}, series, summary)
+            runs[combo_index].append(series)
+            if len(runs[combo_index]) == replicates: # Last replicate in: summarize and drop the raw series
+                summaries[combo_index] = summarize(runs.pop(combo_index), quantiles)
+            done += 1
+            if progress is not None: progress(done, len(tasks))
+
+    if cache is not None: # Cached runs are answered here; only the rest go to the workers
+        cached = [(i, r, cache.get({**params, "seed": seed})) for i, r, params, seed, _ in tasks]
+        tasks_left = [task for task, (_, _, result) in zip(tasks, cached) if result is None]
+        collect([(i, r, {name: result.series[name] for name in REPORTERS}, result.summary)
+                 for i, r, result in cached if result is not None], store=False)
+    else:
+        tasks_left = tasks
+    if processes == 1:
+        collect(map(run_one, tasks_left), cache is not None)
+    elif tasks_left:
+        with Pool(processes) as pool:
+            collect(pool.imap_unordered(run_one, tasks_left), cache is not None)
+    if out_path is not None and summaries: write_results(out_path, combos, summaries)
+    return {i: (combos[i], summaries[i][1]) for i in sorted(summaries)}
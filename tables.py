@@ -0,0 +1,87 @@
+from bisect import bisect_right
+
+import numpy as np
+
+# Age buckets for mortality: bucket i holds ages below MORTALITY_AGE_BINS[i], the last bucket everyone older.
+MORTALITY_AGE_BINS = [19, 29, 39, 49, 59, 69, 79]
+MORTALITY_BASE_RATES = [0.00003, 0.00014, 0.00039, 0.00096, 0.00219, 0.00470, 0.01060, .03253]
+
+# Model attributes the tables are built from; a change to any of them triggers a rebuild.
+TABLE_PARAMS = (
+    "infection_rate", "mask_effect_one", "mask_effect_both", "asymptomatic_infectiousness_modifier",
+    "vaccine_transmission_reduction_infector", "vaccine_transmission_reduction_infector_waned",
+    "vaccine_susceptibility_reduction_susceptible", "vaccine_susceptibility_reduction_susceptible_waned",
+    "vaccine_escape_trans_factor", "vaccine_escape_sus_factor",
+    "severity_multiplier", "vaccine_mortality_reduction", "vaccine_mortality_reduction_waned",
+)
+
+
+def vaccine_status(vaccinated, vaccine_waned):
+    """0 unvaccinated, 1 effective, 2 waned."""
+    return (1 + vaccine_waned) if vaccinated else 0
+
+
+def infector_class(agent):
+    """0-11: masked * 6 + asymptomatic * 3 + vaccine status."""
+    return agent.masked * 6 + agent.asymptomatic * 3 + vaccine_status(agent.vaccinated, agent.vaccine_waned)
+
+
+def susceptible_class(agent):
+    """0-5: masked * 3 + vaccine status."""
+    return agent.masked * 3 + vaccine_status(agent.vaccinated, agent.vaccine_waned)
+
+
+def age_bucket(age):
+    return bisect_right(MORTALITY_AGE_BINS, age)
+
+
+class DiseaseTables:
+    """Per-contact transmission and per-recovery mortality probabilities, precomputed from model parameters.
+
+    transmission[infector class][susceptible class] and mortality[age bucket][vaccine status]
+    are nested lists for scalar lookups in PersonAgent.step; the *_array versions feed the
+    vectorized engine. refresh() is called once per day and rebuilds only if one of
+    TABLE_PARAMS changed.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self._key = None
+        self.rebuilds = 0
+        self.refresh()
+
+    def refresh(self):
+        key = tuple(getattr(self.model, name) for name in TABLE_PARAMS)
+        if key == self._key: return False
+        self._key = key
+        self.rebuilds += 1
+        self.transmission_array = self.build_transmission()
+        self.transmission = self.transmission_array.tolist()
+        with np.errstate(divide="ignore"):
+            self.log_escape = np.log1p(-self.transmission_array) # Per-contact log P(no infection), for batched exposure
+        self.mortality_array = self.build_mortality()
+        self.mortality = self.mortality_array.tolist()
+        return True
+
+    def build_transmission(self):
+        """P[infector class, susceptible class], the same product of modifiers PersonAgent used to apply per pair."""
+        m = self.model
+        trans = np.array([1.0,
+                          1.0 - (1.0 - m.vaccine_transmission_reduction_infector) * (1.0 - m.vaccine_escape_trans_factor),
+                          1.0 - (1.0 - m.vaccine_transmission_reduction_infector_waned) * (1.0 - m.vaccine_escape_trans_factor)])
+        sus = np.array([1.0,
+                        1.0 - (1.0 - m.vaccine_susceptibility_reduction_susceptible) * (1.0 - m.vaccine_escape_sus_factor),
+                        1.0 - (1.0 - m.vaccine_susceptibility_reduction_susceptible_waned) * (1.0 - m.vaccine_escape_sus_factor)])
+        mask = np.array([[1.0, m.mask_effect_one], [m.mask_effect_one, m.mask_effect_both]])
+        asym = np.array([1.0, m.asymptomatic_infectiousness_modifier])
+        modifier = (mask[:, None, None, :, None]
+                    * asym[None, :, None, None, None]
+                    * trans[None, None, :, None, None]
+                    * sus[None, None, None, None, :])
+        return np.clip(m.infection_rate * modifier.reshape(12, 6), 0.0, 1.0)
+
+    def build_mortality(self):
+        """P[age bucket, vaccine status] of dying at the end of an infection."""
+        m = self.model
+        rates = np.array(MORTALITY_BASE_RATES) * m.severity_multiplier
+        return rates[:, None] * np.array([1.0, m.vaccine_mortality_reduction, m.vaccine_mortality_reduction_waned])
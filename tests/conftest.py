@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The modules are flat files at the repository root, imported as `from model import InfectionModel`
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,8 @@
+import benchmarks
+
+
+def test_tiled_case_runs_in_its_own_process():
+    cases = benchmarks.benchmark_cases(sizes=(20,), densities=(0.4,), radii=(1,), engines=("tiled",))
+    (result,) = benchmarks.run_benchmarks(cases, warmup_days=1, measure_days=2)
+    assert result["name"] == "tiled-20x20-d0.4-r1"
+    assert result["agents"] > 0 and result["seconds_per_day"] > 0
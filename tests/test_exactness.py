@@ -0,0 +1,98 @@
+"""Exactness checks: runs that must agree bit for bit, and tallies that must match a full scan."""
+import contextlib
+import io
+
+import numpy as np
+import pytest
+
+from cache import ResultCache
+from counters import PopulationCounters, ScannedRow
+from metapop import Metapopulation
+from model import InfectionModel
+
+SMALL = dict(width=30, height=30, seed=3, log_path=None, infection_rate=0.2, migration_event_probability=0.3,
+             natural_immunity_duration=20, vaccine_immunity_duration=10, daily_vaccination_target_percentage=0.03)
+
+
+def run(model, days):
+    with contextlib.redirect_stdout(io.StringIO()): # Lockdown announcements
+        for _ in range(days):
+            if not model.running: break
+            model.step()
+    return model
+
+
+def series(model):
+    return {name: list(values) for name, values in model.datacollector.model_vars.items()}
+
+
+@pytest.mark.parametrize("params", [{}, {"engine": "vectorized"}, {"scheduler": "active"}, {"hybrid": True}],
+                         ids=["object", "vectorized", "active", "hybrid"])
+def test_checkpoint_restore_continues_the_same_series(params):
+    model = run(InfectionModel(**SMALL, **params), 10)
+    checkpoint = model.checkpoint()
+    run(model, 20)
+    restored = run(checkpoint.restore(), 20)
+    assert series(restored) == series(model)
+    assert restored.counters.as_dict() == model.counters.as_dict()
+
+
+
+def test_restored_checkpoint_does_not_duplicate_log_rows(tmp_path):
+    log_path = str(tmp_path / "log.csv")
+    model = run(InfectionModel(**dict(SMALL, log_path=log_path, log_flush_every=4, max_days=40)), 10)
+    checkpoint = model.checkpoint()
+    run(model, 15) # The original flushes days past the checkpoint to the same file
+    restored = run(checkpoint.restore(), 100)
+    restored.close_log()
+    with open(log_path) as f:
+        days = [int(float(line.split(",")[0])) for line in f.readlines()[1:]]
+    assert days == list(range(restored.day))
+
+@pytest.mark.parametrize("params", [{"engine": "vectorized"}, {"engine": "tiled", "workers": 2}, {"hybrid": True}],
+                         ids=["vectorized", "tiled", "hybrid"])
+def test_counters_match_a_full_scan(params):
+    model = InfectionModel(**SMALL, **params, debug_counters=True) # verify_counters raises on any mismatch
+    try:
+        run(model, 40)
+        scan = PopulationCounters.from_columns(model.agent_columns(ScannedRow._fields))
+        scan.merge(PopulationCounters.from_agents(model.dead_archive.records()))
+        assert model.counters.as_dict() == scan.as_dict()
+        model.counters.masked += 1
+        with pytest.raises(RuntimeError, match="out of sync"):
+            model.verify_counters()
+    finally:
+        if model.engine_mode == "tiled": model.engine.close()
+
+
+def test_serial_metapopulation_equals_parallel():
+    cities = {"a": dict(width=30, height=30), "b": dict(width=25, height=25, engine="vectorized"), "c": dict(width=25, height=25, hybrid=True)}
+    mobility = [[0, 0.01, 0.01], [0.01, 0, 0.01], [0.01, 0.01, 0]]
+    results = []
+    for parallel in (True, False):
+        meta = Metapopulation(cities, mobility, seed=5, parallel=parallel)
+        try:
+            results.append(meta.run(20))
+        finally:
+            meta.close()
+    parallel, serial = results
+    assert parallel["travelers"] == serial["travelers"]
+    for name in cities:
+        (parallel_series, parallel_summary), (serial_series, serial_summary) = parallel["cities"][name], serial["cities"][name]
+        assert parallel_summary == serial_summary
+        for reporter, values in serial_series.items():
+            np.testing.assert_array_equal(parallel_series[reporter], values)
+
+
+def test_cached_run_equals_a_fresh_run(tmp_path):
+    params = dict(SMALL, max_days=40)
+    cache = ResultCache(str(tmp_path), checkpoints=True)
+    first = cache.run(params)
+    again = cache.run(params)
+    assert cache.stats()["hits"] == 1
+    fresh = run(InfectionModel(**params), 40)
+    for result in (first, again):
+        assert result.summary == {"days": fresh.day, "final": fresh.counters.as_dict(), "cumulative_deaths": fresh.cumulative_deaths}
+        for reporter, values in series(fresh).items():
+            np.testing.assert_array_equal(result.series[reporter], values)
+    assert series(again.restore()) == series(fresh) # The stored final checkpoint
@@ -0,0 +1,18 @@
+import contextlib
+import io
+
+from model import InfectionModel
+from profiling import AGENT_PHASES
+
+
+def test_tiled_profile_collects_the_strips_phases_and_counters():
+    with contextlib.redirect_stdout(io.StringIO()):
+        model = InfectionModel(width=40, height=40, seed=1, log_path=None, max_days=5, engine="tiled", workers=2, profile=True)
+        try:
+            while model.running: model.step()
+        finally:
+            model.engine.close()
+    prof = model.profiler
+    assert prof.neighbor_queries > 0 and prof.cells_scanned > 0
+    for phase in AGENT_PHASES:
+        assert prof.seconds[phase] > 0 and prof.calls[phase] >= 2 * model.day # Every strip, every day
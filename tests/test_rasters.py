@@ -0,0 +1,35 @@
+import contextlib
+import io
+import itertools
+
+import numpy as np
+import pytest
+
+from codes import INFECTED
+from model import InfectionModel
+from rasters import window_sum
+
+
+@pytest.mark.parametrize("width, height", [(9, 6), (7, 7), (4, 5)])
+@pytest.mark.parametrize("radius", [1, 2, 3, 4])
+def test_window_covers_the_same_people_as_grid_get_neighbors(width, height, radius):
+    """Radii at and past half the grid hit MultiGrid's cap and even-axis dedup; every cell's window wraps somewhere."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        model = InfectionModel(width=width, height=height, seed=5, log_path=None, risk_perception_radius=radius, density=1.0)
+    for i, agent in enumerate(model.schedule.agents): # A mix of infected and masked people for the ratios
+        if i % 3 == 0: agent.infect()
+        if i % 2 == 0: agent.set_masked(True)
+    model.rasters.rebuild()
+    covers = {} # Occupied cell -> cells whose window includes it
+    for agent in model.schedule.agents:
+        if agent.pos not in covers:
+            indicator = np.zeros((width, height), dtype=np.int32); indicator[agent.pos] = 1
+            covers[agent.pos] = window_sum(indicator, radius) > 0
+    for cell in itertools.product(range(width), range(height)):
+        people = set(model.grid.get_neighbors(cell, moore=True, include_center=False, radius=radius))
+        assert {agent for agent in model.schedule.agents if covers[agent.pos][cell]} == people
+        infected = sum(agent.state == INFECTED for agent in people)
+        assert model.rasters.infected_ratio[cell] == pytest.approx(infected / len(people) if people else 0.0)
+        near = model.grid.get_neighbors(cell, moore=True, include_center=False)
+        masked = sum(agent.masked for agent in near)
+        assert model.rasters.masked_fraction[cell] == pytest.approx(masked / len(near) if near else 0.0)
@@ -0,0 +1,45 @@
+import contextlib
+import io
+import itertools
+
+import pytest
+
+from model import InfectionModel
+from routes import RouteCache, wrapped_delta
+
+
+def old_walk(origin, target):
+    """The path move_towards walked before routes were cached: one signed step per axis, never across the edge."""
+    (x, y), cells = origin, [origin]
+    while (x, y) != target:
+        x += (target[0] > x) - (target[0] < x); y += (target[1] > y) - (target[1] < y)
+        cells.append((x, y))
+    return tuple(cells)
+
+
+@pytest.mark.parametrize("width, height", [(7, 5), (6, 4)], ids=["odd", "even"])
+def test_routes_are_shortest_around_the_torus_and_match_the_old_walk_without_wrapping(width, height):
+    routes = RouteCache(width, height)
+    cells = list(itertools.product(range(width), range(height)))
+    for origin, target in itertools.product(cells, cells):
+        route = routes.get(origin, target)
+        assert route[0] == origin and route[-1] == target
+        for (x0, y0), (x1, y1) in zip(route, route[1:]): # One king move per day, possibly across the edge
+            assert abs(wrapped_delta(x1 - x0, width)) <= 1 and abs(wrapped_delta(y1 - y0, height)) <= 1
+        dx = wrapped_delta(target[0] - origin[0], width); dy = wrapped_delta(target[1] - origin[1], height)
+        assert len(route) - 1 == max(abs(dx), abs(dy))
+        if (dx, dy) == (target[0] - origin[0], target[1] - origin[1]): # The shortest way does not wrap
+            assert route == old_walk(origin, target)
+
+
+def test_agent_commutes_across_the_edge():
+    with contextlib.redirect_stdout(io.StringIO()):
+        model = InfectionModel(width=20, height=20, seed=1, log_path=None)
+    agent = next(iter(model.schedule.agents))
+    old_pos = agent.pos
+    model.grid.move_agent(agent, (1, 18)); model.rasters.moved(agent, old_pos)
+    agent.route = None
+    path = [agent.pos]
+    while agent.pos != (18, 1):
+        agent.move_towards((18, 1)); path.append(agent.pos)
+    assert path == [(1, 18), (0, 19), (19, 0), (18, 1)]
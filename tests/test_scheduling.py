@@ -0,0 +1,76 @@
+import contextlib
+import io
+
+from codes import INFECTED, RECOVERED, SUSCEPTIBLE
+from model import InfectionModel
+
+
+def quiet_model(**params):
+    """Active-set model with nothing going on: no spread, migrants, vaccination or lockdown, and nobody infected."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        model = InfectionModel(**dict(dict(width=30, height=30, seed=4, log_path=None, scheduler="active", infection_rate=0.0,
+                                           migration_event_probability=0.0, daily_vaccination_target_percentage=0.0,
+                                           lockdown_infection_threshold_percentage=1.0), **params))
+    for agent in model.schedule.agents:
+        if agent.state == INFECTED: model.wake_agent(agent); agent.set_state(RECOVERED)
+    run(model, 3)
+    return model
+
+
+def run(model, days):
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(days): model.step()
+
+
+def last_step(model, agent):
+    return model.schedule._last_step[agent.unique_id]
+
+
+def dormant(model):
+    return [agent for agent in model.schedule.agents if agent.unique_id not in model.schedule._active]
+
+
+def test_dormant_agents_are_skipped():
+    model = quiet_model()
+    sleepers = dormant(model)
+    assert len(sleepers) > len(model.schedule.agents) // 2
+    day = model.day
+    run(model, 2)
+    assert all(last_step(model, agent) < day for agent in sleepers)
+    assert model.schedule.stats()["skipped"] >= 2 * len(sleepers)
+
+
+def test_infection_nearby_wakes_a_dormant_agent():
+    model = quiet_model()
+    sleeper, carrier = dormant(model)[:2]
+    old_pos = carrier.pos
+    model.grid.move_agent(carrier, ((sleeper.pos[0] + 1) % model.width, sleeper.pos[1]))
+    model.rasters.moved(carrier, old_pos); model.rasters.flush_moves()
+    model.wake_agent(carrier); carrier.infect()
+    day = model.day
+    run(model, 1)
+    assert last_step(model, sleeper) == day
+    assert sleeper.perceived_local_risk > 0
+
+
+def test_waning_timer_wakes_a_dormant_agent_on_the_day_immunity_wanes():
+    model = quiet_model(natural_immunity_duration=5)
+    sleeper = next(agent for agent in dormant(model) if agent.state == SUSCEPTIBLE)
+    model.wake_agent(sleeper); sleeper.set_state(RECOVERED); sleeper.days_since_recovery = 0
+    day = model.day
+    run(model, 1) # Woken: steps once, then goes back to sleep with a timer
+    assert last_step(model, sleeper) == day and sleeper.unique_id not in model.schedule._active
+    run(model, 4)
+    assert last_step(model, sleeper) == day and sleeper.state == RECOVERED
+    run(model, 1) # Under full activation days_since_recovery passes 5 on this day
+    assert last_step(model, sleeper) == day + 5 and sleeper.state == SUSCEPTIBLE
+
+
+def test_lockdown_change_wakes_everyone():
+    model = quiet_model()
+    assert dormant(model)
+    model.lockdown_infection_threshold_percentage = 0.0
+    day = model.day
+    run(model, 1)
+    assert model.lockdown_active
+    assert all(last_step(model, agent) == day for agent in model.schedule.agents)
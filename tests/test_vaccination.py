@@ -0,0 +1,73 @@
+import collections
+import contextlib
+import io
+import random
+
+import numpy as np
+import pytest
+
+from codes import SUSCEPTIBLE
+from model import InfectionModel
+from vaccination import EligibilityPool, campaign_order
+
+
+class Member:
+    def __init__(self, age):
+        self.age, self.state, self.vaccinated = age, SUSCEPTIBLE, False
+
+
+AGES = [5, 85, 45, 85, 25, 65, 5, 45, 75, 15]
+
+
+def pool_of(priority, seed=0):
+    pool = EligibilityPool(random.Random(seed), priority)
+    members = [Member(age) for age in AGES]
+    for member in members: pool.update(member)
+    return pool, members
+
+
+def test_oldest_first_draws_every_member_once_in_age_order():
+    pool, members = pool_of("oldest_first")
+    order = list(pool.candidates())
+    assert sorted(order, key=id) == sorted(members, key=id)
+    assert [member.age for member in order] == sorted(AGES, reverse=True)
+
+
+def test_random_priority_ignores_age():
+    """As before the pool existed: a uniform shuffle of the eligible, so each member is first equally often."""
+    firsts = collections.Counter()
+    for seed in range(5000):
+        pool, members = pool_of("random", seed)
+        order = list(pool.candidates())
+        assert sorted(order, key=id) == sorted(members, key=id)
+        firsts[members.index(order[0])] += 1
+    assert set(firsts) == set(range(len(AGES)))
+    assert all(abs(count - 500) < 100 for count in firsts.values()) # ~6 standard deviations
+
+
+@pytest.mark.parametrize("engine", ["object", "vectorized"])
+def test_oldest_first_campaign_vaccinates_the_oldest_eligible(engine):
+    with contextlib.redirect_stdout(io.StringIO()):
+        model = InfectionModel(width=30, height=30, seed=2, log_path=None, engine=engine, vaccination_priority="oldest_first",
+                               daily_vaccination_target_percentage=0.1)
+    if engine == "object":
+        for agent in model.schedule.agents: agent.base_willingness_to_vaccinate = 1.0
+        model.perform_daily_vaccination()
+        ages = {vaccinated: [agent.age for agent in model.schedule.agents if agent.state == SUSCEPTIBLE and agent.vaccinated == vaccinated]
+                for vaccinated in (True, False)}
+    else:
+        people = model.engine
+        people.base_willingness_to_vaccinate[:] = 1.0
+        model.perform_daily_vaccination()
+        susceptible = people.state == SUSCEPTIBLE
+        ages = {vaccinated: people.age[susceptible & (people.vaccinated == vaccinated)].tolist()
+                for vaccinated in (True, False)}
+    assert ages[True] and ages[False]
+    assert min(ages[True]) >= max(ages[False])
+
+
+def test_campaign_order_without_priority_is_uniform():
+    rng = np.random.default_rng(0)
+    eligible = np.arange(10)
+    counts = np.bincount(np.concatenate([campaign_order(rng, eligible, np.ones(10), 3) for _ in range(5000)]), minlength=10)
+    assert np.all(np.abs(counts - 1500) < 200)
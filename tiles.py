@@ -0,0 +1,330 @@
+import multiprocessing
+import traceback
+import weakref
+from time import perf_counter
+
+import numpy as np
+
+try:
+    from .vectorized import VectorizedEngine
+    from .counters import PopulationCounters
+    from .rasters import ratio, torus_window, window_sum
+    from .archive import DeadArchive
+    from .tables import DiseaseTables
+    from .codes import SUSCEPTIBLE, INFECTED
+    from .profiling import PhaseProfiler
+except ImportError:
+    from vectorized import VectorizedEngine
+    from counters import PopulationCounters
+    from rasters import ratio, torus_window, window_sum
+    from archive import DeadArchive
+    from tables import DiseaseTables
+    from codes import SUSCEPTIBLE, INFECTED
+    from profiling import PhaseProfiler
+
+
+def model_params(model):
+    """The model's plain attributes (parameters, day, lockdown state), as sent to the tiles each day."""
+    return {name: value for name, value in vars(model).items()
+            if value is None or isinstance(value, (bool, int, float, str))}
+
+
+def strip_bounds(width, workers):
+    """Column boundaries of `workers` vertical strips of nearly equal width: strip i is [bounds[i], bounds[i + 1])."""
+    return np.array([i * width // workers for i in range(workers + 1)])
+
+
+class TileContext:
+    """Stands in for the model inside a tile worker: the parameters of the day, disease tables, a dead archive
+    and, when the model is profiled, the strip's own PhaseProfiler."""
+
+    def __init__(self, params):
+        self.update(params)
+        self.tables = DiseaseTables(self)
+        self.dead_archive = DeadArchive()
+        self.profiler = PhaseProfiler() if params["profile"] else None # Daily params never carry it: not a plain value
+
+    def update(self, params):
+        self.__dict__.update(params)
+
+
+class TileEngine(VectorizedEngine):
+    """VectorizedEngine for the agents in one vertical strip of the torus, run inside a worker process.
+
+    Rows carry global coordinates; the rasters cover the strip's own columns, and
+    neighborhood sums read `halo` columns of counts on each side that the parent
+    copies from the neighboring strips. Agents that walk out of the strip are handed
+    to the parent, which passes them to the strip they entered. TiledEngine calls the
+    methods below in lockstep on every tile; each returns what the parent needs to
+    exchange or reduce before the next one.
+    """
+
+    def __init__(self, params, population, unique_id, bounds, index, halo, seed):
+        self.bounds, self.index, self.halo = bounds, index, halo
+        super().__init__(TileContext(params), population, (bounds[index], bounds[index + 1]), np.random.default_rng(seed), unique_id)
+
+    def edges(self, layers, width):
+        return layers[..., :width, :], layers[..., -width:, :]
+
+    def halo_sum(self, left, own, right, radius):
+        """Neighborhood sums over the strip's own columns, with the neighbors' edge columns as halo."""
+        h = left.shape[-2]
+        return window_sum(np.concatenate([left, own, right], axis=-2), radius, wrap_x=False)[..., h:h + self.raster_width, :]
+
+    # --- Day protocol ---
+    def begin_day(self, params):
+        m = self.model
+        m.update(params); m.tables.refresh(); m.dead_archive = DeadArchive()
+        self.layers = np.stack([self.raster(np.ones(len(self), dtype=bool)), self.raster(self.state == INFECTED), self.raster(self.masked)])
+        return self.edges(self.layers, self.halo)
+
+    def refresh_rasters(self):
+        r = self.rasters; left, right = self.halo_edges
+        r.people, r.infected, r.masked = self.layers
+        people = self.halo_sum(left[0], r.people, right[0], r.perception_radius)
+        r.infected_ratio = ratio(self.halo_sum(left[1], r.infected, right[1], r.perception_radius), people)
+        people = self.halo_sum(left[0][..., -1:, :], r.people, right[0][..., :1, :], 1)
+        r.masked_fraction = ratio(self.halo_sum(left[2][..., -1:, :], r.masked, right[2][..., :1, :], 1), people)
+        r.cells_scanned += r.people.size * (3 if r.perception_radius == 1 else 4) # As OccupancyRasters.rebuild counts
+
+    def perceive_and_move(self, left, right):
+        """Perception, masking, progression and movement; returns (leavers by destination tile, dead columns)."""
+        self.halo_edges = (left, right)
+        prof = self.model.profiler
+        if prof: t = perf_counter()
+        active = np.arange(len(self))
+        self.update_perceived_local_risk(active)
+        if prof: t = prof.lap("perception", t)
+        self.decide_masking(active)
+        if prof: t = prof.lap("masking", t)
+        self.progress_disease(active)
+        self.retire_dead()
+        if prof: t = prof.lap("progression", t)
+        self.move(np.arange(len(self)))
+        leavers = self.take_leavers()
+        if prof: prof.lap("movement", t)
+        return leavers, self.model.dead_archive.columns()
+
+    def take_leavers(self):
+        tile = np.searchsorted(self.bounds, self.x, side="right") - 1
+        leaving = tile != self.index
+        leavers = {int(t): {name: getattr(self, name)[tile == t] for name in self.FIELDS} for t in np.unique(tile[leaving])}
+        for name in self.FIELDS:
+            setattr(self, name, getattr(self, name)[~leaving])
+        return leavers
+
+    def begin_spread(self, arrivals):
+        """Takes in the agents that walked into the strip; returns the edges of today's infector counts."""
+        for rows in arrivals:
+            for name, dtype in self.FIELDS.items():
+                setattr(self, name, np.concatenate([getattr(self, name), rows[name].astype(dtype, copy=False)]))
+        self.generation = 0
+        prof = self.model.profiler
+        if prof: t = perf_counter()
+        edges = self.infector_edges(np.flatnonzero(self.state == INFECTED))
+        if prof: prof.lap("transmission", t)
+        return edges
+
+    def infector_edges(self, infectors):
+        self.counts = self.infector_counts(infectors)
+        return self.edges(self.counts, 1) + (len(infectors),)
+
+    def spread(self, left, right):
+        """One transmission generation (see VectorizedEngine.spread_infection)."""
+        prof = self.model.profiler
+        if prof: t = perf_counter()
+        edges = self.infector_edges(self.spread_generation(self.halo_sum(left, self.counts, right, 1)))
+        if prof: prof.lap("transmission", t)
+        return edges
+
+    def profile_day(self):
+        """The strip's phase seconds and calls since the last call, and its cumulative neighborhood counters."""
+        prof = self.model.profiler
+        day = {"seconds": prof.seconds, "calls": prof.calls, "neighbor_queries": self.neighbor_queries,
+               "cells_scanned": self.cells_scanned + self.rasters.cells_scanned}
+        prof.seconds, prof.calls = dict.fromkeys(prof.seconds, 0.0), dict.fromkeys(prof.calls, 0)
+        return day
+
+    def vaccination_offer(self):
+        """Draws who is willing today; returns their count per priority tier."""
+        eligible = np.flatnonzero((self.state == SUSCEPTIBLE) & ~self.vaccinated)
+        self.willing = eligible[self.rng.random(len(eligible)) < self.base_willingness_to_vaccinate[eligible]]
+        self.willing_tier = self.age[self.willing] if self.model.vaccination_priority == "oldest_first" else np.zeros(len(self.willing))
+        tiers, counts = np.unique(self.willing_tier, return_counts=True)
+        return dict(zip(tiers.tolist(), counts.tolist()))
+
+    def vaccinate(self, allotment):
+        """Vaccinates `count` willing agents drawn at random within each tier of the {tier: count} allotment."""
+        for tier, count in allotment.items():
+            chosen = self.rng.choice(self.willing[self.willing_tier == tier], count, replace=False)
+            self.vaccinated[chosen] = True; self.vaccine_waned[chosen] = False; self.days_since_vaccination[chosen] = 0
+
+    def size(self):
+        return len(self)
+
+
+def _serve_tile(conn, args):
+    """Worker process: builds a TileEngine and answers (method, args) requests until told to stop."""
+    engine = TileEngine(*args)
+    while True:
+        method, call_args = conn.recv()
+        if method is None: break
+        try:
+            conn.send((True, getattr(engine, method)(*call_args)))
+        except Exception:
+            conn.send((False, traceback.format_exc()))
+
+
+def _shutdown(connections, processes):
+    for conn in connections:
+        try: conn.send((None, ()))
+        except (OSError, EOFError): pass
+    for process in processes:
+        process.join(timeout=5)
+        if process.is_alive(): process.terminate()
+
+
+class TiledEngine:
+    """Runs one large vectorized model on vertical strips of the torus, one worker process per strip.
+
+    Each day the parent drives the tiles through the phases of VectorizedEngine.step
+    in lockstep: it copies the edge columns of the occupancy counts into the
+    neighbors' halos (risk_perception_radius wide) before perception and masking, hands
+    agents that crossed a strip boundary to their new strip after movement, and swaps
+    one column of infector counts per transmission generation until no tile has
+    spreaders left. Lockdown is decided by the model from the summed tallies, the
+    daily vaccination quota is split across tiles in proportion to their willing
+    agents, and migrants are placed by the parent and added by the strip they land in.
+
+    Every tile draws from its own stream spawned from the model seed, so a run is
+    reproducible for a fixed seed and number of workers; changing the worker count
+    changes the draws, not the dynamics. Checkpoints are not supported.
+    """
+
+    def __init__(self, model, population, workers):
+        halo = max(model.risk_perception_radius, 1)
+        if workers < 1 or model.width // workers < halo:
+            raise ValueError(f"{workers} workers on a {model.width}-wide grid leave strips narrower than the "
+                             f"{halo}-column halo; use at most {model.width // halo} workers.")
+        if torus_window(model.width, halo) != (halo, halo):
+            raise ValueError(f"risk_perception_radius={model.risk_perception_radius} wraps around a {model.width}-wide grid; "
+                             f"the tiled engine needs width > 2 * radius.")
+        self.model = model
+        self.rng = model.np_random # Migrant placement and the vaccination split
+        self.rasters = None # Occupancy lives in the tiles
+        self.neighbor_queries = self.cells_scanned = 0 # Summed from the workers each day when profiling
+        self.halo = halo
+        self.bounds = strip_bounds(model.width, workers)
+        n = len(population.home_x)
+        unique_id = np.arange(model.person_agent_next_id, model.person_agent_next_id + n); model.person_agent_next_id += n
+        tile = np.searchsorted(self.bounds, population.home_x, side="right") - 1
+        seeds = np.random.SeedSequence(int(self.rng.integers(2**63))).spawn(workers)
+        params = dict(model_params(model), profile=model.profiler is not None)
+        context = multiprocessing.get_context()
+        self.connections, self.processes = [], []
+        for i in range(workers):
+            rows = tile == i
+            part = population._replace(home_x=population.home_x[rows], home_y=population.home_y[rows],
+                                       traits={name: values[rows] for name, values in population.traits.items()},
+                                       infected=population.infected[rows], asymptomatic=population.asymptomatic[rows])
+            conn, child = context.Pipe()
+            process = context.Process(target=_serve_tile, daemon=True,
+                                      args=(child, (params, part, unique_id[rows], self.bounds, i, halo, seeds[i])))
+            process.start(); child.close()
+            self.connections.append(conn); self.processes.append(process)
+        self._finalizer = weakref.finalize(self, _shutdown, self.connections, self.processes)
+        self.size = sum(self.call_all("size")) # Living agents, refreshed by every tally()
+
+    def __len__(self):
+        return self.size
+
+    def __getstate__(self):
+        raise TypeError("Checkpoints are not supported with engine='tiled'; the population lives in worker processes.")
+
+    @property
+    def workers(self):
+        return len(self.connections)
+
+    def close(self):
+        """Stops the worker processes (also done when the engine is garbage collected)."""
+        self._finalizer()
+
+    def call(self, requests):
+        """Sends one (method, args) request to each tile, then gathers the replies in tile order."""
+        for conn, request in zip(self.connections, requests):
+            conn.send(request)
+        replies = []
+        for i, conn in enumerate(self.connections):
+            ok, reply = conn.recv()
+            if not ok:
+                raise RuntimeError(f"Tile {i} failed:\n{reply}")
+            replies.append(reply)
+        return replies
+
+    def call_all(self, method, *args):
+        return self.call([(method, args)] * self.workers)
+
+    def halos(self, edges):
+        """(left, right) halo of each tile: the right edge of the strip before it and the left edge of the one after."""
+        return [(edges[i - 1][1], edges[(i + 1) % self.workers][0]) for i in range(self.workers)]
+
+    def step(self):
+        m = self.model
+        if max(m.risk_perception_radius, 1) > self.halo:
+            raise ValueError(f"risk_perception_radius={m.risk_perception_radius} exceeds the {self.halo}-column halo the tiles were built with.")
+        edges = self.call_all("begin_day", model_params(m))
+        replies = self.call([("perceive_and_move", halo) for halo in self.halos(edges)])
+        for _, dead in replies:
+            if len(dead["unique_id"]):
+                m.dead_archive.add_columns(**dead); m.cumulative_deaths += len(dead["unique_id"])
+        arrivals = [[leavers[i] for leavers, _ in replies if i in leavers] for i in range(self.workers)]
+        edges = self.call([("begin_spread", (rows,)) for rows in arrivals])
+        while sum(spreaders for _, _, spreaders in edges):
+            edges = self.call([("spread", halo) for halo in self.halos(edges)])
+        if m.profiler: self.collect_profile(m.profiler)
+
+    def collect_profile(self, prof):
+        """Adds the strips' agent-phase times to the model's profiler and totals their neighborhood counters."""
+        days = self.call_all("profile_day")
+        for day in days:
+            for phase, seconds in day["seconds"].items():
+                prof.seconds[phase] += seconds; prof.calls[phase] += day["calls"][phase]
+        self.neighbor_queries = sum(day["neighbor_queries"] for day in days)
+        self.cells_scanned = sum(day["cells_scanned"] for day in days)
+
+    def perform_daily_vaccination(self):
+        """Splits today's quota across tiles, tier by tier, as a uniform draw from all willing agents would."""
+        m = self.model
+        remaining = int((len(self) + len(m.dead_archive)) * m.daily_vaccination_target_percentage)
+        offers = self.call_all("vaccination_offer")
+        allotments = [{} for _ in offers]
+        for tier in sorted(set().union(*offers), reverse=True):
+            if remaining == 0: break
+            available = np.array([offer.get(tier, 0) for offer in offers])
+            take = min(remaining, int(available.sum())); remaining -= take
+            for allotment, count in zip(allotments, self.rng.multivariate_hypergeometric(available, take)):
+                if count: allotment[tier] = int(count)
+        self.call([("vaccinate", (allotment,)) for allotment in allotments])
+
+    def introduce_migrants(self, count):
+        m = self.model
+        cells = self.rng.integers(0, m.width * m.height, size=count)
+        x, y = cells // m.height, cells % m.height
+        unique_id = np.arange(m.person_agent_next_id, m.person_agent_next_id + count); m.person_agent_next_id += count
+        tile = np.searchsorted(self.bounds, x, side="right") - 1
+        self.call([("add_migrants", (x[tile == i], y[tile == i], unique_id[tile == i])) for i in range(self.workers)])
+
+    def cell_counts(self):
+        strips = self.call_all("cell_counts")
+        return {name: np.concatenate([strip[name] for strip in strips]) for name in strips[0]}
+
+    def agent_columns(self, names):
+        parts = self.call_all("agent_columns", names)
+        return {name: np.concatenate([part[name] for part in parts]) for name in names}
+
+    def tally(self):
+        counters = PopulationCounters()
+        for part in self.call_all("living_tally"):
+            counters.merge(part)
+        self.size = counters.total
+        return self.model.dead_archive.tally_into(counters)
@@ -0,0 +1,83 @@
+import numpy as np
+
+try:
+    from .codes import SUSCEPTIBLE
+except ImportError:
+    from codes import SUSCEPTIBLE
+
+PRIORITIES = ("random", "oldest_first")
+
+
+class EligibilityPool:
+    """Unvaccinated susceptible agents, kept up to date by PersonAgent's transition setters.
+
+    Members are held in one swap-remove list per priority tier, so joining,
+    leaving and drawing a random member are all O(1). With priority="random"
+    there is a single tier. With "oldest_first" each age is its own tier, and
+    older tiers are drawn from until they are exhausted.
+    """
+
+    def __init__(self, rng, priority="random"):
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown vaccination priority {priority!r}; expected one of {PRIORITIES}.")
+        self.rng = rng # The model's random.Random, so runs stay reproducible from the seed
+        self.priority = priority
+        self._tiers = {}    # tier -> list of member agents
+        self._where = {}    # agent -> index in its tier's list (agents never change tier: age is fixed)
+
+    def __len__(self):
+        return len(self._where)
+
+    def __contains__(self, agent):
+        return agent in self._where
+
+    def tier_of(self, agent):
+        return agent.age if self.priority == "oldest_first" else 0
+
+    def update(self, agent):
+        """Adds or removes agent after any change to its state or vaccination status."""
+        if agent.state == SUSCEPTIBLE and not agent.vaccinated: self.add(agent)
+        else: self.discard(agent)
+
+    def add(self, agent):
+        if agent in self._where: return
+        members = self._tiers.setdefault(self.tier_of(agent), [])
+        self._where[agent] = len(members)
+        members.append(agent)
+
+    def discard(self, agent):
+        index = self._where.pop(agent, None)
+        if index is None: return
+        members = self._tiers[self.tier_of(agent)]
+        last = members.pop()
+        if last is not agent:
+            members[index] = last; self._where[last] = index
+
+    def candidates(self):
+        """Yields distinct members in campaign order: highest tier first, uniformly random within a tier.
+
+        Each member drawn costs O(1) (a lazy Fisher-Yates shuffle), so a campaign that stops after k
+        candidates costs O(k) rather than a shuffle of the whole pool. Members must not join or
+        leave the pool while the generator is being consumed, so collect the candidates first and
+        vaccinate afterwards.
+        """
+        for tier in sorted(self._tiers, reverse=True):
+            members = self._tiers[tier]
+            for i in range(len(members)):
+                j = self.rng.randrange(i, len(members))
+                members[i], members[j] = members[j], members[i]
+                self._where[members[i]] = i; self._where[members[j]] = j
+                yield members[i]
+
+
+def campaign_order(rng, eligible, willingness, count, priority_key=None):
+    """Array version for the vectorized engine: picks up to count willing rows of eligible.
+
+    Drawing willingness for everyone and then sampling count of the willing has the same
+    distribution as going through candidates in random order until count accept.
+    priority_key (higher first) orders the tiers, with ties broken at random.
+    """
+    willing = eligible[rng.random(len(eligible)) < willingness]
+    count = min(count, len(willing))
+    if priority_key is None: return rng.choice(willing, size=count, replace=False)
+    return willing[np.lexsort((rng.random(len(willing)), -priority_key[willing]))[:count]]
@@ -0,0 +1,323 @@
+from time import perf_counter
+
+import numpy as np
+
+try:
+    from .counters import PopulationCounters
+    from .rasters import OccupancyRasters, cell_layers, window_sum
+    from .population import draw_traits
+    from .vaccination import campaign_order
+    from .tables import MORTALITY_AGE_BINS
+    from .routes import torus_direction
+    from .codes import SUSCEPTIBLE, INFECTED, RECOVERED, DEAD, STATE_NAMES, AT_HOME, AT_WORK, GOING_TO_WORK, GOING_TO_HOME
+except ImportError:
+    from counters import PopulationCounters
+    from rasters import OccupancyRasters, cell_layers, window_sum
+    from population import draw_traits
+    from vaccination import campaign_order
+    from tables import MORTALITY_AGE_BINS
+    from routes import torus_direction
+    from codes import SUSCEPTIBLE, INFECTED, RECOVERED, DEAD, STATE_NAMES, AT_HOME, AT_WORK, GOING_TO_WORK, GOING_TO_HOME
+
+RECOVERY_DAYS = 14
+
+
+class VectorizedEngine:
+    """Struct-of-arrays version of the PersonAgent population.
+
+    Every per-agent attribute of PersonAgent lives in a NumPy array (one row per
+    living agent; the dead are moved to model.dead_archive), and each daily phase of PersonAgent.step runs as one batched operation over
+    the whole population. Agents within a day act on the start-of-phase state rather
+    than in RandomActivation order, so curves match the object model statistically
+    rather than draw for draw.
+    """
+
+    FIELDS = {
+        "unique_id": np.int64, "age": np.int16, "state": np.int8, "days_infected": np.int32,
+        "masked": bool, "asymptomatic": bool, "vaccinated": bool, "vaccine_waned": bool,
+        "days_since_vaccination": np.int32, "days_since_recovery": np.int32,
+        "x": np.int32, "y": np.int32, "home_x": np.int32, "home_y": np.int32,
+        "work_x": np.int32, "work_y": np.int32, "essential": bool, "location": np.int8,
+        "perceived_local_risk": np.float64,
+        "base_propensity_to_mask_normal": np.float64, "base_propensity_to_mask_lockdown": np.float64,
+        "prop_voluntary_isolation_if_risk_high": np.float64, "base_compliance_propensity": np.float64,
+        "base_willingness_to_vaccinate": np.float64,
+    }
+
+    def __init__(self, model, population, columns=None, rng=None, unique_id=None):
+        """`columns` = (x0, x1) restricts the rasters to that strip of the grid (see tiles.py)."""
+        self.model = model
+        self.width, self.height = model.width, model.height
+        self.x0, x1 = columns or (0, self.width)
+        self.raster_width = x1 - self.x0
+        self.num_cells = self.raster_width * self.height
+        self.rng = model.np_random if rng is None else rng
+        self.rasters = OccupancyRasters(self.raster_width, self.height, model.risk_perception_radius)
+        self.neighbor_queries = 0 # Neighborhood table lookups, one per agent per lookup
+        self.cells_scanned = 0 # Cells read by the transmission window sums (rasters counts its own)
+        for name, dtype in self.FIELDS.items():
+            setattr(self, name, np.zeros(0, dtype=dtype))
+        self.workplace_x, self.workplace_y = population.workplace_x, population.workplace_y
+        idx = self.add_agents(population.home_x, population.home_y, population.traits, unique_id)
+        self.state[idx[population.infected]] = INFECTED
+        self.asymptomatic[idx] = population.asymptomatic
+
+    def __len__(self):
+        return len(self.state)
+
+    # --- Construction ---
+    def add_agents(self, home_x, home_y, traits=None, unique_id=None):
+        """Appends new susceptible agents living at (home_x, home_y); returns their indices.
+
+        Ids are taken from model.person_agent_next_id unless given.
+        """
+        m = self.model; n = len(home_x)
+        if traits is None: traits = draw_traits(m, self.rng, n, self.workplace_x, self.workplace_y)
+        new = {name: np.zeros(n, dtype=dtype) for name, dtype in self.FIELDS.items()}
+        new.update(traits)
+        if unique_id is None:
+            unique_id = np.arange(m.person_agent_next_id, m.person_agent_next_id + n); m.person_agent_next_id += n
+        new.update(unique_id=unique_id, x=home_x, y=home_y, home_x=home_x, home_y=home_y)
+        start = len(self)
+        for name, dtype in self.FIELDS.items():
+            setattr(self, name, np.concatenate([getattr(self, name), np.asarray(new[name], dtype=dtype)]))
+        return np.arange(start, start + n)
+
+    def take_rows(self, idx):
+        """Removes rows idx (e.g. travelers leaving for another model); returns their FIELDS columns."""
+        rows = {name: getattr(self, name)[idx] for name in self.FIELDS}
+        keep = np.ones(len(self), dtype=bool); keep[idx] = False
+        for name in self.FIELDS:
+            setattr(self, name, getattr(self, name)[keep])
+        return rows
+
+    def infect(self, idx):
+        self.state[idx] = INFECTED
+        self.asymptomatic[idx] = self.rng.random(len(idx)) < self.model.asymptomatic_rate
+        self.days_infected[idx] = 0
+
+    # --- Rasters ---
+    def cell_index(self, mask=None):
+        cells = (self.x - self.x0) * self.height + self.y
+        return cells if mask is None else cells[mask]
+
+    def raster(self, mask):
+        return np.bincount(self.cell_index(mask), minlength=self.num_cells).reshape(self.raster_width, self.height)
+
+    def cell_counts(self):
+        """Per-cell counts of the living by state for rendering (rasters.cell_layers)."""
+        return cell_layers(self.cell_index(), self.state, self.vaccinated, (self.raster_width, self.height))
+
+    def agent_columns(self, names):
+        """The living agents' arrays for the given FIELDS (InfectionModel.agent_columns)."""
+        return {name: getattr(self, name) for name in names}
+
+    def lookup(self, raster, idx):
+        self.neighbor_queries += len(idx)
+        return raster[..., self.x[idx] - self.x0, self.y[idx]]
+
+    # --- Daily phases ---
+    def step(self):
+        prof = self.model.profiler
+        if prof: t = perf_counter()
+        active = np.arange(len(self)) # Every row is alive; deaths are retired right after progression
+        self.update_perceived_local_risk(active)
+        if prof: t = prof.lap("perception", t)
+        self.decide_masking(active)
+        if prof: t = prof.lap("masking", t)
+        self.progress_disease(active)
+        self.retire_dead()
+        if prof: t = prof.lap("progression", t)
+        active = np.arange(len(self))
+        self.move(active)
+        if prof: t = prof.lap("movement", t)
+        self.spread_infection()
+        if prof: prof.lap("transmission", t)
+
+    def retire_dead(self):
+        """Moves dead rows into model.dead_archive and compacts the arrays."""
+        dead = self.state == DEAD
+        if not dead.any(): return
+        self.model.dead_archive.add_columns(
+            day_of_death=np.full(int(dead.sum()), self.model.day),
+            **{name: getattr(self, name)[dead] for name in self.model.dead_archive.FIELDS if name != "day_of_death"})
+        alive = ~dead
+        for name in self.FIELDS:
+            setattr(self, name, getattr(self, name)[alive])
+
+    def refresh_rasters(self):
+        """Recounts the per-cell occupancy layers from the arrays and rebuilds the neighborhood tables."""
+        r = self.rasters
+        r.people = self.raster(np.ones(len(self), dtype=bool))
+        r.infected = self.raster(self.state == INFECTED)
+        r.masked = self.raster(self.masked)
+        r.rebuild()
+
+    def update_perceived_local_risk(self, active):
+        self.refresh_rasters()
+        self.perceived_local_risk[active] = self.lookup(self.rasters.infected_ratio, active)
+
+    def decide_masking(self, active):
+        m = self.model
+        base = self.base_propensity_to_mask_lockdown if m.lockdown_active else self.base_propensity_to_mask_normal
+        prob = base[active]
+        risk = self.perceived_local_risk[active]
+        prob = np.where(risk > m.masking_risk_threshold, np.minimum(1.0, prob * 1.5 + risk * 0.5), prob)
+        # Social influence reads yesterday's masks, i.e. the state at the start of the phase.
+        social = self.lookup(self.rasters.masked_fraction, active) > 0.5
+        prob = np.where(social, np.minimum(1.0, prob * 1.2), prob)
+        self.masked[active] = self.rng.random(len(active)) < prob
+
+    def mortality_rate(self, idx):
+        buckets = np.searchsorted(MORTALITY_AGE_BINS, self.age[idx], side="right")
+        return self.model.tables.mortality_array[buckets, self.vaccine_status(idx)]
+
+    def progress_disease(self, active):
+        m = self.model
+        recovered = active[self.state[active] == RECOVERED]
+        self.days_since_recovery[recovered] += 1
+        waned = recovered[self.days_since_recovery[recovered] > m.natural_immunity_duration]
+        self.state[waned] = SUSCEPTIBLE; self.days_since_recovery[waned] = 0
+
+        protected = active[self.vaccinated[active] & ~self.vaccine_waned[active]]
+        self.days_since_vaccination[protected] += 1
+        self.vaccine_waned[protected[self.days_since_vaccination[protected] > m.vaccine_immunity_duration]] = True
+
+        infected = active[self.state[active] == INFECTED]
+        self.days_infected[infected] += 1
+        done = infected[self.days_infected[infected] >= RECOVERY_DAYS]
+        dies = self.rng.random(len(done)) < self.mortality_rate(done)
+        self.state[done[dies]] = DEAD
+        m.cumulative_deaths += int(dies.sum())
+        survivors = done[~dies]
+        self.state[survivors] = RECOVERED; self.days_infected[survivors] = 0; self.days_since_recovery[survivors] = 0
+
+    def move(self, active):
+        m = self.model; rng = self.rng; n = len(active)
+        age = self.age[active]
+        essential = self.essential[active].copy()
+        if m.lockdown_active:
+            obeys = ~(rng.random(n) > self.base_compliance_propensity[active])
+            essential &= ~obeys | (age > 14)
+        else:
+            high_risk = essential & (self.perceived_local_risk[active] > m.voluntary_isolation_risk_threshold)
+            essential &= ~(high_risk & (rng.random(n) < self.prop_voluntary_isolation_if_risk_high[active]))
+
+        x, y = self.x[active], self.y[active]
+        hx, hy = self.home_x[active], self.home_y[active]
+        wx, wy = self.work_x[active], self.work_y[active]
+        at_home_cell = (x == hx) & (y == hy)
+        at_work_cell = (x == wx) & (y == wy)
+        location = self.location[active]
+
+        commuter = essential & (wx >= 0) & (age > 14)
+        to_work = commuter & (location == GOING_TO_WORK) & ~at_work_cell
+        to_home = commuter & (location == GOING_TO_HOME) & ~at_home_cell & ~to_work
+        undecided = commuter & ~to_work & ~to_home & (rng.random(n) < 0.75)
+        leave_home = undecided & (location == AT_HOME) & ~at_work_cell
+        leave_work = undecided & (location == AT_WORK) & ~at_home_cell
+        location[leave_home] = GOING_TO_WORK; location[leave_work] = GOING_TO_HOME
+        to_work |= leave_home; to_home |= leave_work
+        isolated = ~essential
+        to_home |= isolated & ~at_home_cell
+
+        moving = to_work | to_home
+        tx = np.where(to_work, wx, hx); ty = np.where(to_work, wy, hy)
+        x = np.where(moving, x + torus_direction(tx - x, self.width), x) % self.width # Shortest way around, as routes.py
+        y = np.where(moving, y + torus_direction(ty - y, self.height), y) % self.height
+        self.x[active] = x; self.y[active] = y
+
+        at_home_cell = (x == hx) & (y == hy)
+        at_work_cell = (x == wx) & (y == wy)
+        location[commuter & at_work_cell & ~at_home_cell] = AT_WORK
+        location[commuter & at_home_cell] = AT_HOME
+        location[isolated] = AT_HOME
+        self.location[active] = location
+
+    def infector_classes(self, idx):
+        """0-11: masked * 6 + asymptomatic * 3 + vaccine status (0 none, 1 effective, 2 waned); see tables.py."""
+        return self.masked[idx] * 6 + self.asymptomatic[idx] * 3 + self.vaccine_status(idx)
+
+    def susceptible_classes(self, idx):
+        """0-5: masked * 3 + vaccine status."""
+        return self.masked[idx] * 3 + self.vaccine_status(idx)
+
+    def vaccine_status(self, idx):
+        return np.where(self.vaccinated[idx], 1 + self.vaccine_waned[idx], 0)
+
+    def spread_infection(self):
+        """Transmits in generations to mimic RandomActivation's same-day chains.
+
+        Under random activation, someone infected earlier in the day still takes
+        their own step later that day with probability 1/2, spreads to others, and so
+        on. A chain k generations long happens with probability 1/(k+1)!. Each
+        generation's new infections therefore spread again with probability 1/(g+2),
+        after a progression step (days_infected = 1), as they would on their turn.
+        """
+        infectors = np.flatnonzero(self.state == INFECTED)
+        self.generation = 0
+        while len(infectors):
+            infectors = self.spread_generation(window_sum(self.infector_counts(infectors), 1))
+
+    def spread_generation(self, exposure):
+        """Infects around one generation's summed infector counts; returns who spreads again today."""
+        infected = self.transmit(exposure)
+        self.generation += 1
+        spreaders = infected[self.rng.random(len(infected)) < 1 / (self.generation + 1)]
+        self.days_infected[spreaders] = 1
+        return spreaders
+
+    def infector_counts(self, infectors):
+        """(12, raster width, height) counts of the given infectors per infector class and cell."""
+        keys = self.infector_classes(infectors) * self.num_cells + self.cell_index(infectors)
+        self.cells_scanned += 12 * self.num_cells
+        return np.bincount(keys, minlength=12 * self.num_cells).reshape(12, self.raster_width, self.height)
+
+    def transmit(self, exposure):
+        """Infects susceptibles given the per-class infector counts around each cell; returns the newly infected."""
+        susceptible = np.flatnonzero(self.state == SUSCEPTIBLE)
+        if len(susceptible) == 0: return susceptible
+        exposure = self.lookup(exposure, susceptible)
+        exposed = exposure.any(axis=0)
+        susceptible, exposure = susceptible[exposed], exposure[:, exposed]
+        log_escape = np.where(exposure > 0, exposure * self.model.tables.log_escape[:, self.susceptible_classes(susceptible)], 0.0)
+        p_infection = -np.expm1(log_escape.sum(axis=0))
+        infected = susceptible[self.rng.random(len(susceptible)) < p_infection]
+        self.infect(infected)
+        return infected
+
+    # --- Model-level operations ---
+    def perform_daily_vaccination(self):
+        m = self.model
+        eligible = np.flatnonzero((self.state == SUSCEPTIBLE) & ~self.vaccinated)
+        if len(eligible) == 0 or len(self) == 0: return
+        num_to_target_today = int((len(self) + len(m.dead_archive)) * m.daily_vaccination_target_percentage)
+        priority_key = self.age if m.vaccination_priority == "oldest_first" else None
+        chosen = campaign_order(self.rng, eligible, self.base_willingness_to_vaccinate[eligible], num_to_target_today, priority_key)
+        self.vaccinated[chosen] = True; self.vaccine_waned[chosen] = False; self.days_since_vaccination[chosen] = 0
+
+    def introduce_migrants(self, count):
+        cells = self.rng.integers(0, self.num_cells, size=count)
+        self.add_migrants(cells // self.height, cells % self.height)
+
+    def add_migrants(self, home_x, home_y, unique_id=None):
+        """Adds infected newcomers living at (home_x, home_y)."""
+        idx = self.add_agents(home_x, home_y, unique_id=unique_id)
+        self.infect(idx)
+        self.masked[idx] = self.rng.random(len(idx)) < self.model.avg_mask_propensity_normal
+
+    # --- Reporters ---
+    def tally(self):
+        """Population counters for the model reporters, computed in one batched pass over the arrays."""
+        return self.model.dead_archive.tally_into(self.living_tally())
+
+    def living_tally(self):
+        counters = PopulationCounters()
+        counts = np.bincount(self.state, minlength=len(STATE_NAMES))
+        counters.states = {name: int(count) for name, count in zip(STATE_NAMES, counts)}
+        counters.total = len(self)
+        counters.vaccinated = int(np.count_nonzero(self.vaccinated))
+        counters.vaccine_effective = int(np.count_nonzero(self.vaccinated & ~self.vaccine_waned))
+        counters.asymptomatic = int(np.count_nonzero((self.state == INFECTED) & self.asymptomatic))
+        counters.masked = int(np.count_nonzero(self.masked))
+        return counters